@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cascade_Calibration.py
+
+Hiệu chỉnh cascade detector cho một attack: model rẻ (NaiveBayes / LogisticRegression) quyết định
+các payload có xác suất tấn công <= low hoặc >= high, chỉ payload trong dải (low, high) được chuyển
+cho model mạnh (SVM, ensemble...). Ngưỡng được chọn để tỉ lệ chuyển lên nhỏ nhất mà accuracy
+không giảm quá --max-accuracy-loss so với chỉ dùng model mạnh.
+
+Dùng đúng tập test của SQL.py / XSS.py (cùng split, random_state=42), chia đôi: một nửa để hiệu chỉnh,
+một nửa để kiểm tra lại ngưỡng. Kết quả ghi vào saved_models/<attack>/cascade.json, WAF tự dùng khi load.
+
+Usage:
+    python Cascade_Calibration.py --attack SQLInjection --cheap NaiveBayes --strong SVM
+    python Cascade_Calibration.py --attack XSS --cheap LogisticRegression_xss.pkl --strong Stacking_xss.pkl --max-accuracy-loss 0.002
+"""
+
+import os
+import sys
+import glob
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from Feature_Cache import clean_payload_rows, to_int_labels, load_cluster_groups, split_train_test
+# custom_tokenizer phải có trong __main__ để unpickle vectorizer
+from Model_Export import ATTACK_FILES, SCRIPT_DIR, custom_tokenizer, find_dataset  # noqa: F401
+
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "WAF"))
+from WAF_Cascade import CascadeModel, calibrate_thresholds, save_cascade_config  # noqa: E402
+
+
+def resolve_model_file(attack_dir, name):
+    """name: tên file trong attack_dir, hoặc tiền tố (ví dụ 'NaiveBayes' -> NaiveBayes_xss.pkl)."""
+    exact = os.path.join(attack_dir, name)
+    if os.path.isfile(exact):
+        return exact
+    for p in sorted(glob.glob(os.path.join(attack_dir, "*.pkl"))):
+        base = os.path.basename(p)
+        if "vectorizer" not in base.lower() and base.lower().startswith(name.lower()):
+            return p
+    raise FileNotFoundError(f"Không tìm thấy model '{name}' trong {attack_dir}")
+
+
+def positive_proba(model, X):
+    proba = np.asarray(model.predict_proba(X))
+    classes = list(getattr(model, "classes_", [0, 1]))
+    return proba[:, classes.index(1) if 1 in classes else -1]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate a cheap -> strong detector cascade")
+    parser.add_argument("--attack", choices=sorted(ATTACK_FILES), required=True)
+    parser.add_argument("--cheap", default="NaiveBayes", help="Model rẻ (có predict_proba): tên file hoặc tiền tố")
+    parser.add_argument("--strong", default=None,
+                        help="Model mạnh: tên file hoặc tiền tố (mặc định: sqli.pkl / xss.pkl)")
+    parser.add_argument("--max-accuracy-loss", type=float, default=0.001,
+                        help="Accuracy tối đa được mất so với chỉ dùng model mạnh")
+    parser.add_argument("--dataset", default=None, help="Mặc định: data/processed/processed_payloads.csv")
+    parser.add_argument("--group-split", action="store_true",
+                        help="Dùng cùng split theo cluster gần trùng như khi train với --group-split")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in kết quả, không ghi cascade.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    attack_dir = os.path.join(SCRIPT_DIR, "saved_models", args.attack)
+    model_name, vectorizer_name = ATTACK_FILES[args.attack]
+    try:
+        cheap_path = resolve_model_file(attack_dir, args.cheap)
+        strong_path = resolve_model_file(attack_dir, args.strong or model_name)
+    except FileNotFoundError as ex:
+        print("ERROR:", ex)
+        sys.exit(1)
+
+    cheap = joblib.load(cheap_path)
+    strong = joblib.load(strong_path)
+    if not hasattr(cheap, "predict_proba"):
+        print(f"ERROR: {os.path.basename(cheap_path)} không có predict_proba, không dùng làm model rẻ được.")
+        sys.exit(1)
+    vectorizer = joblib.load(os.path.join(attack_dir, vectorizer_name))
+    print(f"📦 Cheap: {cheap_path}")
+    print(f"📦 Strong: {strong_path}")
+
+    # Cùng dữ liệu + split với SQL.py / XSS.py để không hiệu chỉnh trên dữ liệu đã train
+    df_path = args.dataset or find_dataset()
+    print("📂 Dataset:", df_path)
+    df = pd.read_csv(df_path, dtype=str, keep_default_na=False)
+    rows, cleaned = clean_payload_rows(df["payload"])
+    labels = to_int_labels(df["is_malicious"]).values[rows]
+    mask = np.isin(labels, [0, 1])
+    X = vectorizer.transform(cleaned)[mask]
+    y = labels[mask]
+
+    groups = None
+    if args.group_split:
+        index_values = df["index"] if "index" in df.columns else pd.Series(range(len(df)))
+        groups = load_cluster_groups(df_path, index_values)
+        if groups is not None:
+            groups = groups[rows][mask]
+    _, X_test, _, y_test = split_train_test(X, y, groups=groups)
+    X_calib, X_eval, y_calib, y_eval = split_train_test(X_test, y_test, test_size=0.5)
+    print(f"📊 Hiệu chỉnh trên {len(y_calib)} mẫu, kiểm tra trên {len(y_eval)} mẫu.")
+
+    result = calibrate_thresholds(positive_proba(cheap, X_calib), strong.predict(X_calib), y_calib,
+                                  max_accuracy_loss=args.max_accuracy_loss)
+    print(f"🎯 Dải chuyển lên: ({result['low']:.4f}, {result['high']:.4f}), "
+          f"escalation={result['escalation_rate']:.3f}")
+    print(f"   accuracy (calib): cheap={result['accuracy_cheap']:.4f} strong={result['accuracy_strong']:.4f} "
+          f"cascade={result['accuracy_cascade']:.4f}")
+
+    # Kiểm tra lại trên nửa còn lại
+    cascade = CascadeModel(cheap, strong, result["low"], result["high"])
+    acc_cascade = float(np.mean(cascade.predict(X_eval) == y_eval))
+    acc_strong = float(np.mean(np.asarray(strong.predict(X_eval)) == y_eval))
+    eval_stats = cascade.stats()
+    print(f"🔍 Kiểm tra: strong={acc_strong:.4f} cascade={acc_cascade:.4f} "
+          f"escalation={eval_stats['escalation_rate']:.3f}")
+    if acc_strong - acc_cascade > args.max_accuracy_loss:
+        print(f"⚠️ Accuracy giảm {acc_strong - acc_cascade:.4f} > {args.max_accuracy_loss} trên tập kiểm tra.")
+
+    config = {
+        "cheap": os.path.basename(cheap_path),
+        "strong": os.path.basename(strong_path),
+        "low": result["low"],
+        "high": result["high"],
+        "max_accuracy_loss": args.max_accuracy_loss,
+        "escalation_rate": result["escalation_rate"],
+        "calibration": result,
+        "evaluation": {
+            "n": int(len(y_eval)),
+            "accuracy_strong": acc_strong,
+            "accuracy_cascade": acc_cascade,
+            "escalation_rate": eval_stats["escalation_rate"],
+        },
+    }
+    if args.dry_run:
+        return
+    path = save_cascade_config(attack_dir, config)
+    print(f"💾 Đã lưu {path}")
+
+
+if __name__ == "__main__":
+    main()
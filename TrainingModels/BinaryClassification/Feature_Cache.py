@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Feature_Cache.py
+
+Cache ma trận feature đã fit giữa các lần train.
+
+Key = checksum của dataset + cấu hình vectorizer. Mỗi entry lưu:
+  - vectorizer.pkl : vectorizer đã fit
+  - data.npy, indices.npy, indptr.npy, meta.json : ma trận CSR (load bằng memory-map)
+  - rows.npy : vị trí dòng trong CSV tương ứng với từng hàng của ma trận
+
+SQL.py và XSS.py dùng chung cache, nên chạy lại (hoặc chạy script còn lại)
+sẽ bỏ qua bước fit vectorizer và vào thẳng bước train model.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(SCRIPT_DIR, "feature_cache")
+
+# tăng khi thay đổi cách làm sạch payload để cache cũ tự hết hiệu lực
+CLEANING_VERSION = 1
+
+
+# =====================================================
+# 🔹 Key
+# =====================================================
+
+def file_checksum(path, chunk_size=1 << 20):
+    """SHA-256 của file (đọc theo chunk)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def vectorizer_config(vectorizer):
+    """Tham số vectorizer dạng JSON ổn định (callable được thay bằng tên của nó)."""
+    config = {}
+    for k, v in sorted(vectorizer.get_params().items()):
+        if callable(v):
+            v = getattr(v, "__name__", repr(v))
+        config[k] = v
+    config["__class__"] = type(vectorizer).__name__
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+def cache_key(dataset_checksum, vectorizer):
+    raw = f"{dataset_checksum}|{CLEANING_VERSION}|{vectorizer_config(vectorizer)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:20]
+
+
+# =====================================================
+# 🔹 Làm sạch payload (vector hóa, không dùng apply)
+# =====================================================
+
+def clean_payload_rows(payloads):
+    """
+    payloads: Series payload thô theo thứ tự trong CSV.
+    Trả về (rows, cleaned): vị trí các dòng giữ lại (không rỗng, lần xuất hiện đầu tiên)
+    và Series payload đã strip tương ứng.
+    """
+    s = payloads.astype(str).fillna("").str.strip()
+    keep = (s != "") & ~s.duplicated(keep="first")
+    rows = np.flatnonzero(keep.values)
+    return rows, s.iloc[rows]
+
+
+def to_int_labels(series):
+    """Giống to_int_lbl cũ: int(float(x)), nếu không parse được thì 1 khi không rỗng, 0 khi rỗng."""
+    s = series.astype(str)
+    num = pd.to_numeric(s, errors="coerce")
+    fallback = (s.str.strip() != "").astype(int)
+    return np.trunc(num).where(num.notna(), fallback).astype(int)
+
+
+def load_cluster_groups(dataset_path, index_values):
+    """
+    Đọc processed/clusters.csv (tạo bởi data/Near_Duplicates.py --mode annotate) cạnh dataset.
+    index_values: cột index của dataset theo thứ tự dòng. Trả về mảng cluster_id
+    (dòng không có trong file được coi là cluster riêng), hoặc None nếu chưa có file.
+    """
+    clusters_path = os.path.join(os.path.dirname(dataset_path), "clusters.csv")
+    if not os.path.exists(clusters_path):
+        return None
+    clusters = pd.read_csv(clusters_path, dtype=str, keep_default_na=False)
+    mapping = dict(zip(clusters["index"], clusters["cluster_id"]))
+    index_values = pd.Series(index_values).astype(str)
+    return index_values.map(mapping).fillna("row:" + index_values).values
+
+
+def split_train_test(X, y, groups=None, test_size=0.2, random_state=42):
+    """
+    train_test_split stratify như cũ; nếu có groups thì dùng GroupShuffleSplit để mọi payload
+    gần trùng (cùng cluster) nằm hoàn toàn ở train hoặc test.
+    """
+    from sklearn.model_selection import train_test_split, GroupShuffleSplit
+
+    if groups is None:
+        return train_test_split(X, y, test_size=test_size, random_state=random_state, stratify=y)
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    train_idx, test_idx = next(splitter.split(X, y, groups))
+    return X[train_idx], X[test_idx], y[train_idx], y[test_idx]
+
+
+# =====================================================
+# 🔹 Lưu / load ma trận CSR
+# =====================================================
+
+def save_matrix(entry_dir, X):
+    X = sp.csr_matrix(X)
+    np.save(os.path.join(entry_dir, "data.npy"), X.data)
+    np.save(os.path.join(entry_dir, "indices.npy"), X.indices)
+    np.save(os.path.join(entry_dir, "indptr.npy"), X.indptr)
+    with open(os.path.join(entry_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"shape": list(X.shape)}, f)
+
+
+def load_matrix(entry_dir, mmap=True):
+    """Load CSR với mmap_mode='r' để không phải copy toàn bộ ma trận vào RAM."""
+    mode = "r" if mmap else None
+    data = np.load(os.path.join(entry_dir, "data.npy"), mmap_mode=mode)
+    indices = np.load(os.path.join(entry_dir, "indices.npy"), mmap_mode=mode)
+    indptr = np.load(os.path.join(entry_dir, "indptr.npy"), mmap_mode=mode)
+    with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+        shape = tuple(json.load(f)["shape"])
+    return sp.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+# =====================================================
+# 🔹 API chính
+# =====================================================
+
+def cache_entry_dir(dataset_checksum, vectorizer, cache_dir=CACHE_DIR):
+    """Thư mục entry của cache cho dataset + cấu hình vectorizer (có thể chưa tồn tại)."""
+    return os.path.join(cache_dir, cache_key(dataset_checksum, vectorizer))
+
+
+def load_or_build_features(dataset_path, payloads, vectorizer, cache_dir=CACHE_DIR, dataset_checksum=None):
+    """
+    Trả về (vectorizer đã fit, X, rows).
+
+    - payloads: Series payload thô đọc từ dataset_path (đúng thứ tự dòng)
+    - vectorizer: vectorizer chưa fit, dùng để xác định cấu hình (key)
+    - rows: vị trí dòng CSV của từng hàng trong X, để script lấy nhãn tương ứng
+
+    Nếu cache có entry trùng key thì load (memory-map), nếu không thì fit và lưu lại.
+    """
+    dataset_checksum = dataset_checksum or file_checksum(dataset_path)
+    key = cache_key(dataset_checksum, vectorizer)
+    entry_dir = cache_entry_dir(dataset_checksum, vectorizer, cache_dir)
+
+    # thư mục entry có sẵn nhưng không load được (hỏng / ghi dở): phải bỏ đi, nếu không os.replace bên dưới
+    # thất bại mãi (thư mục đích không rỗng) và mọi lần chạy đều build lại
+    broken = os.path.isdir(entry_dir)
+    if os.path.exists(os.path.join(entry_dir, "meta.json")):
+        try:
+            fitted = joblib.load(os.path.join(entry_dir, "vectorizer.pkl"))
+            X = load_matrix(entry_dir)
+            rows = np.load(os.path.join(entry_dir, "rows.npy"))
+            print(f"⚡ Dùng feature cache {key} ({X.shape[0]} x {X.shape[1]})")
+            return fitted, X, rows
+        except Exception as e:
+            print(f"⚠️ Feature cache {key} hỏng, build lại: {e}")
+
+    rows, cleaned = clean_payload_rows(payloads)
+    print(f"🧮 Fit vectorizer trên {len(rows)} payload (cache miss {key})...")
+    X = vectorizer.fit_transform(cleaned)
+
+    # ghi vào thư mục tạm rồi rename để các script chạy song song không đọc entry dở dang
+    tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    joblib.dump(vectorizer, os.path.join(tmp_dir, "vectorizer.pkl"))
+    np.save(os.path.join(tmp_dir, "rows.npy"), rows)
+    save_matrix(tmp_dir, X)
+    if broken:
+        # rename sang chỗ khác trước khi xóa: process khác không thấy entry xóa dở
+        aside = f"{entry_dir}.bad{os.getpid()}"
+        try:
+            os.replace(entry_dir, aside)
+            shutil.rmtree(aside, ignore_errors=True)
+        except OSError:
+            pass
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # entry đã được process khác ghi xong trước
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return vectorizer, X, rows
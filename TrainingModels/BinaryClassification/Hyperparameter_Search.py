@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hyperparameter_Search.py
+
+Tìm hyperparameter (vectorizer + classifier) bằng successive halving thay cho GridSearchCV:
+mọi cấu hình được train trên một phần nhỏ dữ liệu, chỉ 1/eta cấu hình tốt nhất được
+đi tiếp lên rung sau với lượng dữ liệu gấp eta lần.
+
+- Các cấu hình trong cùng rung được train song song trên process pool.
+- Ma trận feature lấy từ Feature_Cache (mỗi cấu hình vectorizer chỉ fit một lần,
+  worker load bằng memory-map).
+- Trạng thái được ghi sau mỗi cấu hình vào search_state.json, chạy lại sẽ tiếp tục
+  từ chỗ bị ngắt.
+- Cấu hình thắng được ghi vào saved_models/<attack>/best_config.json.
+
+Usage:
+    python Hyperparameter_Search.py --attack SQLInjection --families nb,lr,sgd --cpus 8
+    python Hyperparameter_Search.py --attack XSS --families mlp --n-candidates 20
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.neural_network import MLPClassifier
+
+from Feature_Cache import load_or_build_features, load_matrix, cache_entry_dir, file_checksum, to_int_labels
+from Parallel_Training import available_cpus
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def custom_tokenizer(text):
+    return text.split()
+
+
+def find_dataset():
+    """Tìm processed_payloads.csv giống SQL.py / XSS.py."""
+    candidates = [
+        os.path.join(SCRIPT_DIR, 'data', 'processed', 'processed_payloads.csv'),
+        os.path.join(SCRIPT_DIR, '..', 'data', 'processed', 'processed_payloads.csv'),
+        os.path.join(SCRIPT_DIR, '..', '..', 'data', 'processed', 'processed_payloads.csv'),
+    ]
+    for p in candidates:
+        if os.path.exists(p):
+            return os.path.abspath(p)
+    raise FileNotFoundError("Không tìm thấy dataset. Đã thử:\n" + "\n".join(candidates))
+
+
+# =====================================================
+# 🔹 Không gian tìm kiếm
+# =====================================================
+
+VECTORIZER_SPACE = {
+    "min_df": [1, 2, 5, 10, 20, 40],
+    "ngram_range": [(1, 1), (1, 2), (1, 3)],
+}
+
+# Tham số MLP theo TrainingModels/note.txt (24/10/2025)
+CLASSIFIER_SPACE = {
+    "nb": ("MultinomialNB", {"alpha": [0.01, 0.1, 0.5, 1.0]}),
+    "lr": ("LogisticRegression", {"C": [0.1, 1.0, 10.0]}),
+    "sgd": ("SGDClassifier", {"alpha": [1e-6, 1e-5, 1e-4], "loss": ["hinge", "log_loss"]}),
+    "mlp": ("MLPClassifier", {
+        "hidden_layer_sizes": [(500, 250, 125, 62), (256,), (128, 64)],
+        "alpha": [0.0005, 0.001, 0.01, 0.1, 1],
+        "learning_rate": ["constant", "invscaling"],
+        "learning_rate_init": [0.001, 0.01, 0.1, 1],
+        "momentum": [0, 0.9],
+    }),
+}
+
+
+def make_vectorizer(params):
+    # cùng cách khởi tạo với SQL.py / XSS.py để dùng chung entry trong Feature_Cache
+    return CountVectorizer(min_df=params["min_df"], tokenizer=custom_tokenizer,
+                           ngram_range=tuple(params["ngram_range"]))
+
+
+def make_classifier(name, params):
+    params = {k: (tuple(v) if isinstance(v, list) else v) for k, v in params.items()}
+    if name == "MultinomialNB":
+        return MultinomialNB(**params)
+    if name == "LogisticRegression":
+        return LogisticRegression(max_iter=2000, **params)
+    if name == "SGDClassifier":
+        return SGDClassifier(random_state=42, **params)
+    if name == "MLPClassifier":
+        # momentum chỉ dùng với solver sgd; early stopping như trong note
+        return MLPClassifier(solver="sgd", early_stopping=True, n_iter_no_change=10, max_iter=200,
+                             random_state=42, **params)
+    raise ValueError(f"Classifier không hỗ trợ: {name}")
+
+
+def expand(space):
+    keys = sorted(space)
+    for values in itertools.product(*(space[k] for k in keys)):
+        yield {k: (list(v) if isinstance(v, tuple) else v) for k, v in zip(keys, values)}
+
+
+def config_id(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def sample_candidates(families, n_candidates, seed):
+    """Toàn bộ grid (vectorizer x classifier), lấy ngẫu nhiên n_candidates nếu grid lớn hơn."""
+    grid = []
+    for family in families:
+        clf_name, clf_space = CLASSIFIER_SPACE[family]
+        for vec_params, clf_params in itertools.product(expand(VECTORIZER_SPACE), expand(clf_space)):
+            grid.append({"vectorizer": vec_params, "classifier": clf_name, "params": clf_params})
+    if n_candidates and len(grid) > n_candidates:
+        grid = random.Random(seed).sample(grid, n_candidates)
+    return grid
+
+
+# =====================================================
+# 🔹 Trạng thái (resume)
+# =====================================================
+
+def load_state(state_path, fingerprint):
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("fingerprint") == fingerprint:
+            return state
+        print("⚠️ search_state.json thuộc lần tìm kiếm khác (dataset/tham số đổi), bắt đầu lại.")
+    return {"fingerprint": fingerprint, "scores": {}}
+
+
+def save_state(state_path, state):
+    tmp = state_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, state_path)
+
+
+# =====================================================
+# 🔹 Worker
+# =====================================================
+
+_SHARED = {}
+
+
+def _init_worker(y_all):
+    _SHARED["y"] = y_all
+    _SHARED["X"] = {}
+
+
+def _evaluate(config, entry_dir, train_rows, val_rows, scoring):
+    X = _SHARED["X"].get(entry_dir)
+    if X is None:
+        X = load_matrix(entry_dir)
+        _SHARED["X"][entry_dir] = X
+    y = _SHARED["y"]
+    clf = make_classifier(config["classifier"], config["params"])
+    start = time.perf_counter()
+    clf.fit(X[train_rows], y[train_rows])
+    y_pred = clf.predict(X[val_rows])
+    if scoring == "f1":
+        score = f1_score(y[val_rows], y_pred, zero_division=0)
+    else:
+        score = accuracy_score(y[val_rows], y_pred)
+    return float(score), time.perf_counter() - start
+
+
+# =====================================================
+# 🔹 Successive halving
+# =====================================================
+
+def stratified_prefix(train_rows, y, n):
+    """Tập con n dòng của train_rows, giữ tỉ lệ nhãn, cố định theo seed để resume cho cùng kết quả."""
+    if n >= len(train_rows):
+        return train_rows
+    subset, _ = train_test_split(train_rows, train_size=n, random_state=0, stratify=y[train_rows])
+    return np.sort(subset)
+
+
+def successive_halving(candidates, entry_dirs, y_all, train_rows, val_rows, state, state_path,
+                       min_resources, eta, cpus, scoring):
+    alive = list(candidates)
+    n_rungs = max(1, int(math.ceil(math.log(max(len(alive), 1), eta))) + 1)
+    history = []
+
+    with ProcessPoolExecutor(max_workers=cpus, initializer=_init_worker, initargs=(y_all,)) as pool:
+        for rung in range(n_rungs):
+            n_samples = min(len(train_rows), int(min_resources * (eta ** rung)))
+            if rung == n_rungs - 1:
+                n_samples = len(train_rows)
+            rung_rows = stratified_prefix(train_rows, y_all, n_samples)
+            print(f"\n🪜 Rung {rung}: {len(alive)} cấu hình x {len(rung_rows)} mẫu")
+
+            futures = {}
+            for config in alive:
+                key = f"{rung}:{config_id(config)}"
+                if key in state["scores"]:
+                    continue
+                entry_dir = entry_dirs[config_id(config["vectorizer"])]
+                futures[pool.submit(_evaluate, config, entry_dir, rung_rows, val_rows, scoring)] = key
+
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    score, seconds = future.result()
+                except Exception as e:
+                    print(f"❌ {key} lỗi: {e}")
+                    score, seconds = float("-inf"), 0.0
+                state["scores"][key] = score
+                save_state(state_path, state)
+                print(f"   {key} {scoring}={score:.4f} ({seconds:.1f}s)")
+
+            ranked = sorted(alive, key=lambda c: state["scores"][f"{rung}:{config_id(c)}"], reverse=True)
+            history.append({"rung": rung, "n_samples": int(len(rung_rows)), "n_configs": len(alive)})
+            if len(ranked) == 1 or rung == n_rungs - 1:
+                best = ranked[0]
+                return best, state["scores"][f"{rung}:{config_id(best)}"], history
+            alive = ranked[:max(1, len(ranked) // eta)]
+
+    return None, None, history
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter search")
+    parser.add_argument("--attack", default="SQLInjection", help="Thư mục trong saved_models (SQLInjection, XSS)")
+    parser.add_argument("--label-col", default="is_malicious")
+    parser.add_argument("--dataset", default=None,
+                        help="Mặc định: data/processed/processed_payloads.csv (hoặc file của Near_Duplicates.py --mode collapse)")
+    parser.add_argument("--families", default="nb,lr,sgd", help=f"Trong {sorted(CLASSIFIER_SPACE)}")
+    parser.add_argument("--n-candidates", type=int, default=64, help="Số cấu hình ban đầu (0 = toàn bộ grid)")
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--min-resources", type=int, default=2000, help="Số mẫu train ở rung đầu tiên")
+    parser.add_argument("--scoring", default="accuracy", choices=["accuracy", "f1"])
+    parser.add_argument("--cpus", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    families = [f.strip() for f in args.families.split(",") if f.strip()]
+    unknown = [f for f in families if f not in CLASSIFIER_SPACE]
+    if unknown:
+        print(f"ERROR: family không hỗ trợ: {unknown}")
+        sys.exit(1)
+
+    try:
+        df_path = os.path.abspath(args.dataset) if args.dataset else find_dataset()
+    except FileNotFoundError as ex:
+        print("ERROR:", ex)
+        sys.exit(1)
+
+    save_dir = os.path.join(SCRIPT_DIR, "saved_models", args.attack)
+    os.makedirs(save_dir, exist_ok=True)
+    state_path = os.path.join(save_dir, "search_state.json")
+
+    print("📂 Đang load dataset từ:", df_path)
+    df = pd.read_csv(df_path, dtype=str, keep_default_na=False)
+    cols = {c.lower(): c for c in df.columns}
+    payload_col = cols.get("payload", df.columns[0])
+    label_col = cols.get(args.label_col.lower(), df.columns[1])
+    checksum = file_checksum(df_path)
+
+    candidates = sample_candidates(families, args.n_candidates, args.seed)
+    fingerprint = hashlib.sha1(json.dumps({
+        "dataset": checksum, "label_col": label_col, "candidates": [config_id(c) for c in candidates],
+        "eta": args.eta, "min_resources": args.min_resources, "scoring": args.scoring, "seed": args.seed,
+    }, sort_keys=True).encode("utf-8")).hexdigest()
+    state = load_state(state_path, fingerprint)
+    print(f"🔎 {len(candidates)} cấu hình, {len(state['scores'])} kết quả đã có từ lần chạy trước.")
+
+    # mỗi cấu hình vectorizer chỉ fit một lần (hoặc lấy thẳng từ cache)
+    entry_dirs = {}
+    rows = None
+    for vec_params in {json.dumps(c["vectorizer"], sort_keys=True) for c in candidates}:
+        vec_params = json.loads(vec_params)
+        vectorizer = make_vectorizer(vec_params)
+        _, _, rows = load_or_build_features(df_path, df[payload_col], vectorizer, dataset_checksum=checksum)
+        entry_dirs[config_id(vec_params)] = cache_entry_dir(checksum, vectorizer)
+
+    # nhãn cho từng hàng của ma trận (-1 = nhãn không hợp lệ, không dùng)
+    labels = to_int_labels(df[label_col]).values[rows]
+    y_all = np.where(np.isin(labels, [0, 1]), labels, -1)
+    valid = np.flatnonzero(y_all >= 0)
+    train_rows, val_rows = train_test_split(valid, test_size=0.2, random_state=args.seed, stratify=y_all[valid])
+
+    cpus = max(1, args.cpus or available_cpus())
+    start = time.perf_counter()
+    best, score, history = successive_halving(candidates, entry_dirs, y_all, np.sort(train_rows),
+                                              np.sort(val_rows), state, state_path, args.min_resources,
+                                              args.eta, cpus, args.scoring)
+    if best is None:
+        print("❌ Không tìm được cấu hình nào.")
+        sys.exit(1)
+
+    result = {
+        "attack": args.attack,
+        "dataset_sha256": checksum,
+        "scoring": args.scoring,
+        "score": score,
+        "vectorizer": best["vectorizer"],
+        "classifier": best["classifier"],
+        "params": best["params"],
+        "rungs": history,
+        "search_seconds": round(time.perf_counter() - start, 1),
+    }
+    best_path = os.path.join(save_dir, "best_config.json")
+    with open(best_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n🏆 {best['classifier']} {best['params']} + vectorizer {best['vectorizer']} ({args.scoring}={score:.4f})")
+    print(f"💾 Đã lưu cấu hình tốt nhất -> {best_path}")
+
+
+if __name__ == "__main__":
+    main()
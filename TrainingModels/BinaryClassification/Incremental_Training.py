@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental_Training.py
+
+Train out-of-core: đọc processed_payloads.csv theo từng chunk, trích feature bằng
+HashingVectorizer (stateless, không cần fit vocabulary) và cập nhật model bằng partial_fit.
+RAM tối đa chỉ phụ thuộc chunksize và n_features, không phụ thuộc kích thước dataset.
+
+Có thể train tiếp từ model đã lưu khi có dữ liệu gán nhãn mới (--resume --data new.csv).
+
+Kết quả lưu trong saved_models/<attack>/streaming/:
+  - <Model>_stream.pkl      : model
+  - vectorizer_stream.pkl   : HashingVectorizer dùng khi serving
+  - stream_state.json       : số dòng / dataset đã train
+
+Usage:
+    python Incremental_Training.py --attack SQLInjection --model SGD
+    python Incremental_Training.py --attack XSS --model NaiveBayes --resume --data captured.csv
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.metrics import confusion_matrix
+
+from Feature_Cache import to_int_labels, file_checksum
+from Parallel_Training import save_result
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CLASSES = np.array([0, 1])
+
+# tên file results theo từng attack (giống SQL.py / XSS.py)
+RESULTS_FILES = {"SQLInjection": "results.csv", "XSS": "results_xss.csv"}
+
+
+def custom_tokenizer(text):
+    return text.split()
+
+
+def find_dataset():
+    """Tìm processed_payloads.csv giống SQL.py / XSS.py."""
+    candidates = [
+        os.path.join(SCRIPT_DIR, 'data', 'processed', 'processed_payloads.csv'),
+        os.path.join(SCRIPT_DIR, '..', 'data', 'processed', 'processed_payloads.csv'),
+        os.path.join(SCRIPT_DIR, '..', '..', 'data', 'processed', 'processed_payloads.csv'),
+    ]
+    for p in candidates:
+        if os.path.exists(p):
+            return os.path.abspath(p)
+    raise FileNotFoundError("Không tìm thấy dataset. Đã thử:\n" + "\n".join(candidates))
+
+
+def make_vectorizer(n_features):
+    # alternate_sign=False để feature không âm (MultinomialNB yêu cầu)
+    return HashingVectorizer(tokenizer=custom_tokenizer, token_pattern=None, ngram_range=(1, 3),
+                             n_features=n_features, alternate_sign=False, norm="l2")
+
+
+def make_model(name):
+    if name == "SGD":
+        return SGDClassifier(loss="log_loss", alpha=1e-6, random_state=42)
+    if name == "NaiveBayes":
+        return MultinomialNB(alpha=0.01)
+    raise ValueError(f"Model không hỗ trợ partial_fit: {name}")
+
+
+def is_test_row(payload, test_percent):
+    """Chia train/test ổn định theo hash của payload (không cần giữ index trong RAM)."""
+    return zlib.crc32(payload.encode("utf-8", "ignore")) % 100 < test_percent
+
+
+def iter_chunks(dataset_path, chunksize, label_col):
+    """Sinh (payloads, labels) đã làm sạch cho từng chunk của CSV."""
+    for chunk in pd.read_csv(dataset_path, dtype=str, keep_default_na=False, chunksize=chunksize):
+        cols = {c.lower(): c for c in chunk.columns}
+        payload_col = cols.get("payload", chunk.columns[0])
+        lbl_col = cols.get(label_col.lower(), chunk.columns[-1])
+        payloads = chunk[payload_col].astype(str).str.strip()
+        labels = to_int_labels(chunk[lbl_col])
+        keep = (payloads != "") & labels.isin([0, 1])
+        yield payloads[keep].tolist(), labels[keep].values
+
+
+def test_mask_for(payloads, test_percent):
+    return np.fromiter((is_test_row(p, test_percent) for p in payloads), dtype=bool, count=len(payloads))
+
+
+def train_stream(model, vectorizer, dataset_path, chunksize, label_col, test_percent, epochs):
+    rows = 0
+    for epoch in range(epochs):
+        for i, (payloads, labels) in enumerate(iter_chunks(dataset_path, chunksize, label_col)):
+            if not payloads:
+                continue
+            train_mask = ~test_mask_for(payloads, test_percent)
+            if not train_mask.any():
+                continue
+            X = vectorizer.transform([p for p, keep in zip(payloads, train_mask) if keep])
+            model.partial_fit(X, labels[train_mask], classes=CLASSES)
+            rows += int(train_mask.sum())
+            print(f"  epoch {epoch + 1} chunk {i + 1}: {rows} dòng đã train")
+    return rows
+
+
+def evaluate_stream(model, vectorizer, dataset_path, chunksize, label_col, test_percent):
+    """Đánh giá trên tập test (hash split) bằng một lượt đọc stream nữa; chỉ giữ confusion matrix."""
+    cm = np.zeros((2, 2), dtype=np.int64)
+    for payloads, labels in iter_chunks(dataset_path, chunksize, label_col):
+        test_mask = test_mask_for(payloads, test_percent)
+        if not test_mask.any():
+            continue
+        X = vectorizer.transform([p for p, keep in zip(payloads, test_mask) if keep])
+        cm += confusion_matrix(labels[test_mask], model.predict(X), labels=CLASSES)
+    return cm
+
+
+def format_report(cm):
+    tn, fp, fn, tp = cm.ravel()
+    total = cm.sum()
+    accuracy = (tp + tn) / total if total else 0.0
+    precision = tp / (tp + fp) if (tp + fp) else 0.0
+    recall = tp / (tp + fn) if (tp + fn) else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if (precision + recall) else 0.0
+    report = (
+        f"confusion_matrix (rows=true, cols=pred, labels=[0, 1]):\n{cm}\n\n"
+        f"accuracy  {accuracy:.4f}\n"
+        f"precision {precision:.4f}\n"
+        f"recall    {recall:.4f}\n"
+        f"f1        {f1:.4f}\n"
+        f"support   {total}\n"
+    )
+    return accuracy, report
+
+
+def load_state(state_path):
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"rows_trained": 0, "runs": []}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming/incremental training bằng partial_fit")
+    parser.add_argument("--attack", default="SQLInjection", help="Thư mục trong saved_models (SQLInjection, XSS)")
+    parser.add_argument("--model", default="SGD", choices=["SGD", "NaiveBayes"])
+    parser.add_argument("--data", default=None, help="CSV có cột payload + nhãn (mặc định processed_payloads.csv)")
+    parser.add_argument("--label-col", default="is_malicious")
+    parser.add_argument("--chunksize", type=int, default=20000)
+    parser.add_argument("--n-features", type=int, default=2 ** 20)
+    parser.add_argument("--epochs", type=int, default=1)
+    parser.add_argument("--test-percent", type=int, default=20)
+    parser.add_argument("--resume", action="store_true", help="Train tiếp từ model đã lưu")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        dataset_path = os.path.abspath(args.data) if args.data else find_dataset()
+    except FileNotFoundError as ex:
+        print("ERROR:", ex)
+        sys.exit(1)
+
+    save_dir = os.path.join(SCRIPT_DIR, "saved_models", args.attack, "streaming")
+    os.makedirs(save_dir, exist_ok=True)
+    model_name = f"{args.model}_stream"
+    model_path = os.path.join(save_dir, f"{model_name}.pkl")
+    vectorizer_path = os.path.join(save_dir, "vectorizer_stream.pkl")
+    state_path = os.path.join(save_dir, "stream_state.json")
+    state = load_state(state_path)
+
+    if args.resume and os.path.exists(model_path) and os.path.exists(vectorizer_path):
+        print(f"🔁 Train tiếp từ {model_path}")
+        model = joblib.load(model_path)
+        vectorizer = joblib.load(vectorizer_path)
+    else:
+        if args.resume:
+            print("⚠️ Chưa có model để train tiếp, bắt đầu model mới.")
+        model = make_model(args.model)
+        vectorizer = make_vectorizer(args.n_features)
+        state = {"rows_trained": 0, "runs": []}
+
+    print(f"📂 Streaming dataset: {dataset_path} (chunksize={args.chunksize})")
+    start = time.perf_counter()
+    rows = train_stream(model, vectorizer, dataset_path, args.chunksize, args.label_col,
+                        args.test_percent, args.epochs)
+    elapsed = time.perf_counter() - start
+    if rows == 0:
+        print("❌ Không có dòng nào để train.")
+        sys.exit(1)
+
+    cm = evaluate_stream(model, vectorizer, dataset_path, args.chunksize, args.label_col, args.test_percent)
+    accuracy, report = format_report(cm)
+    print(f"{model_name} Accuracy: {accuracy:.4f} ({rows} dòng, {elapsed:.1f}s)")
+    print(report)
+
+    joblib.dump(model, model_path)
+    joblib.dump(vectorizer, vectorizer_path)
+    state["rows_trained"] += rows
+    state["runs"].append({
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "dataset": dataset_path,
+        "dataset_sha256": file_checksum(dataset_path),
+        "rows": rows,
+        "epochs": args.epochs,
+        "accuracy": accuracy,
+    })
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    print(f"💾 Đã lưu model -> {model_path}")
+    print(f"💾 Đã lưu vectorizer -> {vectorizer_path}")
+
+    results_file = RESULTS_FILES.get(args.attack, "results.csv")
+    save_result(os.path.join(SCRIPT_DIR, "saved_models", args.attack, results_file),
+                model_name, accuracy, report, model_path)
+    print("\n🎯 Hoàn tất!")
+
+
+if __name__ == "__main__":
+    main()
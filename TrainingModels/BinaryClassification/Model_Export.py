@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Model_Export.py
+
+Xuất model tuyến tính (LogisticRegression, SGDClassifier, LinearSVC, MultinomialNB) ra dạng gọn
+<tên>_compact.npz: trọng số float32 hoặc int8 + scale, chỉ giữ các feature có trọng số khác base
+(|w - base| > --tol). WAF tự dùng file này thay cho <tên>.pkl khi nó mới hơn file pickle.
+
+Trước khi ghi, model gọn được kiểm tra trên toàn bộ processed_payloads.csv: tỉ lệ dự đoán
+trùng với model gốc phải >= --min-agreement, nếu không file sẽ không được ghi.
+
+Usage:
+    python Model_Export.py --attack SQLInjection [--dtype float32|int8] [--tol 1e-4]
+    python Model_Export.py --model saved_models/XSS/LogisticRegression_xss.pkl --vectorizer saved_models/XSS/vectorizer_xss.pkl
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from Feature_Cache import clean_payload_rows, to_int_labels
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# WAF_Compact chỉ phụ thuộc numpy, import trực tiếp để không kéo theo Flask của package WAF
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "WAF"))
+from WAF_Compact import CompactLinearModel, COMPACT_DTYPES, COMPACT_SUFFIX  # noqa: E402
+
+ATTACK_FILES = {
+    "SQLInjection": ("sqli.pkl", "vectorizer.pkl"),
+    "XSS": ("xss.pkl", "vectorizer_xss.pkl"),
+}
+
+
+def custom_tokenizer(text):
+    return text.split()
+
+
+def find_dataset():
+    candidates = [
+        os.path.join(SCRIPT_DIR, "..", "data", "processed", "processed_payloads.csv"),
+        os.path.join(SCRIPT_DIR, "data", "processed", "processed_payloads.csv"),
+    ]
+    for p in candidates:
+        if os.path.exists(p):
+            return os.path.abspath(p)
+    raise FileNotFoundError("Không tìm thấy dataset. Đã thử:\n" + "\n".join(candidates))
+
+
+# =====================================================
+# 🔹 Kiểm tra
+# =====================================================
+
+def verify_agreement(original, compact, X, y=None, batch_size=4096):
+    """So sánh predict của hai model trên X (theo batch). Trả về dict thống kê."""
+    disagreements = 0
+    correct_original = correct_compact = 0
+    for start in range(0, X.shape[0], batch_size):
+        batch = X[start:start + batch_size]
+        p_orig = original.predict(batch)
+        p_comp = compact.predict(batch)
+        disagreements += int(np.sum(p_orig != p_comp))
+        if y is not None:
+            y_batch = y[start:start + batch_size]
+            correct_original += int(np.sum(p_orig == y_batch))
+            correct_compact += int(np.sum(p_comp == y_batch))
+    n = X.shape[0]
+    stats = {"n": n, "disagreements": disagreements, "agreement": 1.0 - disagreements / max(n, 1)}
+    if y is not None:
+        stats["accuracy_original"] = correct_original / max(n, 1)
+        stats["accuracy_compact"] = correct_compact / max(n, 1)
+    return stats
+
+
+def load_seconds(loader, path, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        loader(path)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+# =====================================================
+# 🔹 Main
+# =====================================================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export linear models as float32/int8 sparse coefficients")
+    parser.add_argument("--attack", choices=sorted(ATTACK_FILES), default=None,
+                        help="Xuất model chính của attack (sqli.pkl / xss.pkl)")
+    parser.add_argument("--model", default=None, help="Đường dẫn model .pkl (thay cho --attack)")
+    parser.add_argument("--vectorizer", default=None, help="Vectorizer tương ứng với --model")
+    parser.add_argument("--dtype", default="float32", choices=COMPACT_DTYPES)
+    parser.add_argument("--tol", type=float, default=0.0, help="Bỏ các trọng số có |w - base| <= tol")
+    parser.add_argument("--min-agreement", type=float, default=0.999,
+                        help="Tỉ lệ dự đoán trùng tối thiểu với model gốc để được ghi file")
+    parser.add_argument("--dataset", default=None, help="Mặc định: data/processed/processed_payloads.csv")
+    args = parser.parse_args(argv)
+    if args.attack is None and (args.model is None or args.vectorizer is None):
+        parser.error("cần --attack hoặc --model và --vectorizer")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.attack is not None:
+        attack_dir = os.path.join(SCRIPT_DIR, "saved_models", args.attack)
+        model_name, vectorizer_name = ATTACK_FILES[args.attack]
+        model_path = args.model or os.path.join(attack_dir, model_name)
+        vectorizer_path = args.vectorizer or os.path.join(attack_dir, vectorizer_name)
+    else:
+        model_path, vectorizer_path = args.model, args.vectorizer
+
+    print(f"📦 Model: {model_path}")
+    original = joblib.load(model_path)
+    vectorizer = joblib.load(vectorizer_path)
+    try:
+        compact = CompactLinearModel.from_estimator(original, dtype=args.dtype, tol=args.tol)
+    except ValueError as ex:
+        print("ERROR:", ex)
+        sys.exit(1)
+    n_features = compact.n_features_in_
+    print(f"🔧 {compact.source}: giữ {len(compact.indices)}/{n_features} trọng số "
+          f"({args.dtype}, base={compact.base:.6g})")
+
+    df_path = args.dataset or find_dataset()
+    print("📂 Kiểm tra trên:", df_path)
+    df = pd.read_csv(df_path, dtype=str, keep_default_na=False)
+    rows, cleaned = clean_payload_rows(df["payload"])
+    X = vectorizer.transform(cleaned)
+    y = to_int_labels(df["is_malicious"]).values[rows] if "is_malicious" in df.columns else None
+    stats = verify_agreement(original, compact, X, y)
+    print(f"🔍 Trùng dự đoán: {stats['agreement']:.6f} ({stats['disagreements']} khác / {stats['n']} payload)")
+    if y is not None:
+        print(f"   accuracy gốc={stats['accuracy_original']:.4f} gọn={stats['accuracy_compact']:.4f}")
+
+    if stats["agreement"] < args.min_agreement:
+        print(f"❌ Agreement < {args.min_agreement}; không ghi file. Thử --dtype float32 hoặc giảm --tol.")
+        sys.exit(1)
+
+    compact_path = os.path.splitext(model_path)[0] + COMPACT_SUFFIX
+    tmp_path = compact_path + ".tmp"
+    compact.save(tmp_path)
+    os.replace(tmp_path, compact_path)
+
+    size_orig = os.path.getsize(model_path)
+    size_comp = os.path.getsize(compact_path)
+    print(f"💾 Đã lưu {compact_path}")
+    print(f"   kích thước: {size_orig / 1e6:.2f}MB -> {size_comp / 1e6:.2f}MB")
+    print(f"   thời gian load: {load_seconds(joblib.load, model_path) * 1000:.1f}ms -> "
+          f"{load_seconds(CompactLinearModel.load, compact_path) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
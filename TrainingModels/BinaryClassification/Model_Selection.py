@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Model_Selection.py
+
+Đo chi phí serving của từng model (latency từng payload / theo batch, kích thước file,
+RAM khi load) và chọn model theo chính sách có tính đến chi phí, thay vì chỉ accuracy.
+
+Chính sách (--policy):
+  - accuracy : accuracy cao nhất (như trước)
+  - latency  : accuracy cao nhất trong các model có latency_single_ms <= --latency-budget-ms
+  - pareto   : trên Pareto frontier (accuracy, latency, size), chọn model rẻ nhất
+               có accuracy >= accuracy tốt nhất - --accuracy-tolerance
+--min-precision / --min-recall (lớp malicious) được áp dụng như điều kiện lọc cho mọi chính sách.
+"""
+
+import os
+import time
+import tracemalloc
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import precision_recall_fscore_support, accuracy_score, classification_report
+
+from Parallel_Training import save_result
+
+POLICIES = ("accuracy", "latency", "pareto")
+COST_COLUMNS = ["latency_single_ms", "latency_single_p99_ms", "latency_batch_ms",
+                "model_size_bytes", "load_memory_bytes"]
+METRIC_COLUMNS = ["precision_malicious", "recall_malicious", "f1_malicious"]
+
+
+# =====================================================
+# 🔹 Đo metric / chi phí
+# =====================================================
+
+def malicious_metrics(y_true, y_pred):
+    """Precision / recall / f1 cho lớp malicious (1)."""
+    p, r, f, _ = precision_recall_fscore_support(y_true, y_pred, labels=[1], zero_division=0)
+    return {"precision_malicious": float(p[0]), "recall_malicious": float(r[0]), "f1_malicious": float(f[0])}
+
+
+def measure_costs(model_path, X_sample, n_single=200, batch_size=256):
+    """
+    Load model từ model_path và đo:
+      - load_memory_bytes: RAM được giữ lại sau khi load (tracemalloc)
+      - model_size_bytes: kích thước file
+      - latency_single_ms / latency_single_p99_ms: predict từng payload một (median / p99)
+      - latency_batch_ms: thời gian trung bình mỗi payload khi predict theo batch
+    """
+    tracemalloc.start()
+    try:
+        model = joblib.load(model_path)
+        load_memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    n_single = min(n_single, X_sample.shape[0])
+    # warm-up để không tính chi phí lần gọi đầu
+    model.predict(X_sample[:1])
+    timings = []
+    for i in range(n_single):
+        row = X_sample[i:i + 1]
+        start = time.perf_counter()
+        model.predict(row)
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    batch = X_sample[:min(batch_size, X_sample.shape[0])]
+    start = time.perf_counter()
+    model.predict(batch)
+    batch_ms = (time.perf_counter() - start) * 1000.0 / max(1, batch.shape[0])
+
+    return {
+        "latency_single_ms": float(np.median(timings)) if timings else float("nan"),
+        "latency_single_p99_ms": float(np.percentile(timings, 99)) if timings else float("nan"),
+        "latency_batch_ms": batch_ms,
+        "model_size_bytes": os.path.getsize(model_path),
+        "load_memory_bytes": int(load_memory),
+    }
+
+
+# =====================================================
+# 🔹 Đọc results + bổ sung metric còn thiếu
+# =====================================================
+
+def resolve_model_file(row, save_dir, model_suffix=""):
+    """Đường dẫn model của một dòng results; thử model_file trước, sau đó <save_dir>/<model><suffix>.pkl."""
+    candidate = row.get("model_file")
+    if isinstance(candidate, str) and candidate and os.path.exists(candidate):
+        return candidate
+    fallback = os.path.join(save_dir, f"{row['model']}{model_suffix}.pkl")
+    return fallback if os.path.exists(fallback) else None
+
+
+def latest_results(results_path):
+    """results CSV chỉ append, nên giữ dòng mới nhất của mỗi model."""
+    if not os.path.exists(results_path):
+        return pd.DataFrame(columns=["model", "accuracy", "report_file", "model_file"])
+    df = pd.read_csv(results_path)
+    return df.drop_duplicates(subset=["model"], keep="last").reset_index(drop=True)
+
+
+def backfill_metrics(results_path, save_dir, X_test, y_test, model_suffix="", report_digits=None):
+    """
+    Đo metric + chi phí cho các model cũ trong results chưa có các cột mới,
+    rồi append một dòng đầy đủ cho model đó.
+    """
+    df = latest_results(results_path)
+    for _, row in df.iterrows():
+        if all(c in row and pd.notna(row[c]) for c in COST_COLUMNS + METRIC_COLUMNS):
+            continue
+        model_file = resolve_model_file(row, save_dir, model_suffix)
+        if model_file is None or os.path.dirname(os.path.abspath(model_file)) != os.path.abspath(save_dir):
+            # model của không gian feature khác (ví dụ streaming/) không đo được bằng X_test này
+            continue
+        print(f"📏 Đo chi phí cho {row['model']} ({model_file})...")
+        try:
+            model = joblib.load(model_file)
+            y_pred = model.predict(X_test)
+            extra = malicious_metrics(y_test, y_pred)
+            extra.update(measure_costs(model_file, X_test))
+        except Exception as e:
+            print(f"⚠️ Không đo được {row['model']}: {e}")
+            continue
+        if report_digits is None:
+            report = classification_report(y_test, y_pred)
+        else:
+            report = classification_report(y_test, y_pred, digits=report_digits)
+        save_result(results_path, row["model"], accuracy_score(y_test, y_pred), report, model_file, extra=extra)
+
+
+# =====================================================
+# 🔹 Chọn model
+# =====================================================
+
+def pareto_frontier(df, maximize=("accuracy",), minimize=("latency_single_ms", "model_size_bytes")):
+    """Các dòng không bị dòng nào khác dominate."""
+    values = df[list(maximize) + list(minimize)].astype(float).values
+    signs = np.array([-1.0] * len(maximize) + [1.0] * len(minimize))
+    costs = values * signs  # mọi cột: càng nhỏ càng tốt
+    keep = []
+    for i in range(len(costs)):
+        dominated = np.any(np.all(costs <= costs[i], axis=1) & np.any(costs < costs[i], axis=1))
+        keep.append(not dominated)
+    return df[np.array(keep, dtype=bool)]
+
+
+def select_best_model(df, policy="accuracy", latency_budget_ms=None, min_precision=None,
+                      min_recall=None, accuracy_tolerance=0.01):
+    """
+    Trả về dòng (Series) của model được chọn, hoặc None.
+    df cần cột accuracy; các chính sách latency/pareto cần thêm cột chi phí.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"policy phải là một trong {POLICIES}, nhận {policy!r}")
+    df = df.copy()
+    for c in ["accuracy"] + COST_COLUMNS + METRIC_COLUMNS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    df = df[df["accuracy"].notna()]
+
+    if min_precision is not None:
+        df = df[df.get("precision_malicious", pd.Series(index=df.index, dtype=float)) >= min_precision]
+    if min_recall is not None:
+        df = df[df.get("recall_malicious", pd.Series(index=df.index, dtype=float)) >= min_recall]
+
+    if policy != "accuracy":
+        missing = [c for c in ("latency_single_ms", "model_size_bytes") if c not in df.columns]
+        if missing:
+            print(f"⚠️ Thiếu cột {missing}; quay về chính sách accuracy.")
+            policy = "accuracy"
+        else:
+            df = df[df["latency_single_ms"].notna() & df["model_size_bytes"].notna()]
+
+    if df.empty:
+        return None
+
+    if policy == "accuracy":
+        return df.loc[df["accuracy"].idxmax()]
+
+    if policy == "latency":
+        if latency_budget_ms is None:
+            raise ValueError("policy 'latency' cần latency_budget_ms")
+        within = df[df["latency_single_ms"] <= latency_budget_ms]
+        if within.empty:
+            print(f"⚠️ Không model nào <= {latency_budget_ms}ms; chọn model nhanh nhất.")
+            return df.loc[df["latency_single_ms"].idxmin()]
+        return within.loc[within["accuracy"].idxmax()]
+
+    frontier = pareto_frontier(df)
+    print("📈 Pareto frontier (accuracy / latency / size):")
+    for _, r in frontier.sort_values("latency_single_ms").iterrows():
+        print(f"   {r['model']:<20} acc={r['accuracy']:.4f} "
+              f"latency={r['latency_single_ms']:.3f}ms size={int(r['model_size_bytes'])}B")
+    if latency_budget_ms is not None:
+        within = frontier[frontier["latency_single_ms"] <= latency_budget_ms]
+        if not within.empty:
+            frontier = within
+    good_enough = frontier[frontier["accuracy"] >= frontier["accuracy"].max() - accuracy_tolerance]
+    return good_enough.loc[good_enough["latency_single_ms"].idxmin()]
+
+
+def add_selection_args(parser):
+    parser.add_argument("--policy", default="accuracy", choices=POLICIES,
+                        help="Chính sách chọn model xuất ra cho WAF")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Latency tối đa cho một payload (policy latency/pareto)")
+    parser.add_argument("--min-precision", type=float, default=None, help="Precision tối thiểu lớp malicious")
+    parser.add_argument("--min-recall", type=float, default=None, help="Recall tối thiểu lớp malicious")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01,
+                        help="Policy pareto: chấp nhận giảm accuracy tối đa bao nhiêu để lấy model rẻ hơn")
+    return parser
+
+
+def choose_and_load(results_path, save_dir, args, model_suffix=""):
+    """
+    Chọn model theo args (từ add_selection_args) trong các model của save_dir.
+    Trả về (model_name, row, model) hoặc (None, None, None).
+    """
+    df = latest_results(results_path)
+    if df.empty:
+        print(f"⚠️ {results_path} rỗng — không có model nào để chọn.")
+        return None, None, None
+
+    df["resolved_file"] = [resolve_model_file(r, save_dir, model_suffix) for _, r in df.iterrows()]
+    same_dir = df["resolved_file"].map(
+        lambda p: p is not None and os.path.dirname(os.path.abspath(p)) == os.path.abspath(save_dir))
+    df = df[same_dir]
+
+    row = select_best_model(df, policy=args.policy, latency_budget_ms=args.latency_budget_ms,
+                            min_precision=args.min_precision, min_recall=args.min_recall,
+                            accuracy_tolerance=args.accuracy_tolerance)
+    if row is None:
+        print("⚠️ Không có model nào thỏa điều kiện chọn.")
+        return None, None, None
+
+    latency = row.get("latency_single_ms")
+    latency_txt = f", latency={latency:.3f}ms" if pd.notna(latency) else ""
+    print(f"✅ Model được chọn ({args.policy}): {row['model']} (accuracy={row['accuracy']:.4f}{latency_txt})")
+    return row["model"], row, joblib.load(row["resolved_file"])
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parallel_Training.py
+
+Runner dùng chung cho SQL.py và XSS.py: train các classifier độc lập song song
+trên một process pool, mỗi model có CPU budget riêng để không bị oversubscription
+với các estimator đã dùng n_jobs (RandomForest, Bagging, Stacking...).
+
+Kết quả chỉ được ghi bởi process cha, qua append_result() có khóa file,
+nên results.csv an toàn kể cả khi SQL.py và XSS.py chạy cùng lúc.
+"""
+
+import os
+import csv
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import joblib
+from sklearn.metrics import accuracy_score, classification_report, precision_recall_fscore_support
+
+RESULT_COLUMNS = ["model", "accuracy", "report_file", "model_file"]
+
+
+# =====================================================
+# 🔹 Ghi kết quả an toàn khi chạy đồng thời
+# =====================================================
+
+@contextlib.contextmanager
+def file_lock(path, timeout=120.0, stale_after=600.0):
+    """
+    Khóa đơn giản bằng file <path>.lock (tạo với O_EXCL, chạy được trên cả Windows và Linux).
+    Lock cũ hơn stale_after giây (process bị kill) sẽ bị gỡ.
+    """
+    lock_path = path + ".lock"
+    start = time.monotonic()
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"Không lấy được lock {lock_path} sau {timeout}s")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def append_result(results_path, row):
+    """
+    Thêm một dòng vào results CSV dưới khóa file.
+    Nếu dòng có cột mới chưa có trong header, file được viết lại một lần (atomic) với header mở rộng.
+    """
+    d = os.path.dirname(results_path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+
+    with file_lock(results_path):
+        header = None
+        if os.path.exists(results_path) and os.path.getsize(results_path) > 0:
+            with open(results_path, "r", newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), None)
+
+        if header is None:
+            header = list(RESULT_COLUMNS) + [k for k in row if k not in RESULT_COLUMNS]
+            with open(results_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=header)
+                writer.writeheader()
+                writer.writerow({k: row.get(k, "") for k in header})
+            return
+
+        new_cols = [k for k in row if k not in header]
+        if new_cols:
+            header = header + new_cols
+            tmp_path = results_path + ".tmp"
+            with open(results_path, "r", newline="", encoding="utf-8") as src, \
+                    open(tmp_path, "w", newline="", encoding="utf-8") as dst:
+                writer = csv.DictWriter(dst, fieldnames=header)
+                writer.writeheader()
+                for old in csv.DictReader(src):
+                    writer.writerow({k: old.get(k) or "" for k in header})
+                writer.writerow({k: row.get(k, "") for k in header})
+            os.replace(tmp_path, results_path)
+            return
+
+        with open(results_path, "a", newline="", encoding="utf-8") as f:
+            csv.DictWriter(f, fieldnames=header).writerow({k: row.get(k, "") for k in header})
+
+
+def save_result(results_path, model_name, accuracy, report_text, model_file, extra=None):
+    """Ghi kết quả mới vào CSV và lưu report ra file riêng."""
+    base_dir = os.path.dirname(results_path)
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+
+    # Lưu file report chi tiết
+    report_path = os.path.join(base_dir, f"{model_name}_report.txt")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(report_text)
+
+    row = {
+        "model": model_name,
+        "accuracy": accuracy,
+        "report_file": report_path,
+        "model_file": model_file,
+    }
+    if extra:
+        row.update(extra)
+    append_result(results_path, row)
+    print(f"✅ Đã lưu kết quả của {model_name} vào {results_path}")
+
+
+# =====================================================
+# 🔹 CPU budget
+# =====================================================
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def uses_n_jobs(clf):
+    return any(k == "n_jobs" or k.endswith("__n_jobs") for k in clf.get_params(deep=True))
+
+
+def default_cpu_budget(clf, total_cpus):
+    """Estimator có n_jobs được nửa số core, còn lại 1 core."""
+    if uses_n_jobs(clf):
+        return max(1, total_cpus // 2)
+    return 1
+
+
+def apply_cpu_budget(clf, n_cpus):
+    """
+    Đặt n_jobs ngoài cùng = n_cpus và mọi n_jobs lồng bên trong = 1,
+    để một model không dùng nhiều core hơn budget của nó.
+    """
+    params = {}
+    for key in clf.get_params(deep=True):
+        if key == "n_jobs":
+            params[key] = n_cpus
+        elif key.endswith("__n_jobs"):
+            params[key] = 1
+    if params:
+        clf.set_params(**params)
+    return clf
+
+
+# =====================================================
+# 🔹 Worker
+# =====================================================
+
+_DATA = {}
+
+
+def _init_worker(X_train, y_train, X_test, y_test):
+    # dữ liệu được gửi một lần cho mỗi worker thay vì một lần cho mỗi model
+    _DATA.update(X_train=X_train, y_train=y_train, X_test=X_test, y_test=y_test)
+
+
+def _fit_and_evaluate(model_name, clf, model_path, n_cpus, report_digits):
+    try:
+        from threadpoolctl import threadpool_limits
+        limits = threadpool_limits(limits=n_cpus)
+    except ImportError:
+        limits = contextlib.nullcontext()
+
+    with limits:
+        apply_cpu_budget(clf, n_cpus)
+        start = time.perf_counter()
+        clf.fit(_DATA["X_train"], _DATA["y_train"])
+        fit_seconds = time.perf_counter() - start
+        y_pred = clf.predict(_DATA["X_test"])
+
+    acc = accuracy_score(_DATA["y_test"], y_pred)
+    if report_digits is None:
+        report = classification_report(_DATA["y_test"], y_pred)
+    else:
+        report = classification_report(_DATA["y_test"], y_pred, digits=report_digits)
+    p, r, f, _ = precision_recall_fscore_support(_DATA["y_test"], y_pred, labels=[1], zero_division=0)
+    joblib.dump(clf, model_path)
+    return {
+        "model": model_name,
+        "accuracy": acc,
+        "report": report,
+        "model_file": model_path,
+        "fit_seconds": fit_seconds,
+        "precision_malicious": float(p[0]),
+        "recall_malicious": float(r[0]),
+        "f1_malicious": float(f[0]),
+    }
+
+
+# =====================================================
+# 🔹 Runner
+# =====================================================
+
+def train_models_parallel(models, X_train, y_train, X_test, y_test, save_dir, results_path,
+                          model_suffix="", report_digits=None, total_cpus=None, cpu_budgets=None):
+    """
+    Train các model (list of (name, estimator)) song song.
+
+    - total_cpus: tổng số core được dùng (mặc định: tất cả core khả dụng)
+    - cpu_budgets: dict name -> số core cho model đó (mặc định: default_cpu_budget)
+
+    Kết quả của mỗi model được ghi vào results_path ngay khi model đó train xong (run bị dừng giữa chừng
+    không mất các model đã xong). Cột chi phí (latency, bộ nhớ) chưa được đo ở đây vì latency bị nhiễu
+    bởi các model đang train: caller gọi Model_Selection.backfill_metrics sau khi pool kết thúc.
+
+    Một model chỉ được khởi chạy khi tổng budget của các model đang chạy còn đủ chỗ,
+    nên tổng số thread không vượt total_cpus.
+    Trả về list dict kết quả của các model train thành công.
+    """
+    if not models:
+        return []
+
+    total_cpus = max(1, total_cpus or available_cpus())
+    cpu_budgets = cpu_budgets or {}
+    queue = []
+    for name, clf in models:
+        budget = cpu_budgets.get(name) or default_cpu_budget(clf, total_cpus)
+        queue.append((name, clf, min(total_cpus, max(1, int(budget)))))
+    # model cần nhiều core chạy trước để các model 1 core lấp chỗ trống còn lại
+    queue.sort(key=lambda item: -item[2])
+
+    results = []
+    running = {}
+    free = total_cpus
+    max_workers = min(len(queue), total_cpus)
+    print(f"⚙️ Training {len(queue)} model trên {total_cpus} core ({max_workers} worker)...")
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(X_train, y_train, X_test, y_test)) as pool:
+        while queue or running:
+            # khởi chạy mọi model còn vừa budget
+            i = 0
+            while i < len(queue):
+                name, clf, budget = queue[i]
+                if budget <= free or not running:
+                    queue.pop(i)
+                    model_path = os.path.join(save_dir, f"{name}{model_suffix}.pkl")
+                    print(f"\n🚀 Training {name} ({budget} core)...")
+                    future = pool.submit(_fit_and_evaluate, name, clf, model_path, budget, report_digits)
+                    running[future] = (name, budget)
+                    free -= budget
+                else:
+                    i += 1
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, budget = running.pop(future)
+                free += budget
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Lỗi khi train {name}: {e}")
+                    continue
+
+                print(f"{name} Accuracy: {result['accuracy']:.4f} (fit {result['fit_seconds']:.1f}s)")
+                print(result["report"])
+                extra = {k: result[k] for k in ("fit_seconds", "precision_malicious", "recall_malicious",
+                                                "f1_malicious")}
+                save_result(results_path, result["model"], result["accuracy"], result["report"],
+                            result["model_file"], extra=extra)
+                results.append(result)
+
+    return results
@@ -7,16 +7,16 @@ Chạy training/evaluation cho SQLi dataset (CountVectorizer + nhiều classifie
 Lưu NB model và vectorizer ra disk, và kết quả training ra file CSV.
 
 Usage:
-    python train_sql_models.py
+    python train_sql_models.py [--cpus N] [--top-k K] [--vocab-sweep K1,K2,...] [--policy accuracy|latency|pareto] [--latency-budget-ms MS]
 """
 
 import os
 import sys
+import argparse
 import joblib
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, classification_report
 
 # classifiers
 from sklearn.naive_bayes import MultinomialNB
@@ -25,6 +25,11 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import BaggingClassifier, AdaBoostClassifier, RandomForestClassifier, StackingClassifier
 
+from Parallel_Training import train_models_parallel
+from Model_Selection import add_selection_args, backfill_metrics, choose_and_load
+from Vocabulary_Pruning import add_pruning_args, parse_k_values, prune_vectorizer, select_features, vocabulary_sweep
+from Feature_Cache import load_or_build_features, to_int_labels, load_cluster_groups, split_train_test
+
 
 # =====================================================
 # 🔹 Các hàm tiện ích
@@ -66,29 +71,6 @@ def load_previous_results(results_path):
         return pd.DataFrame(columns=["model", "accuracy", "report_file", "model_file"])
 
 
-def save_result(results_path, model_name, accuracy, report_text, model_file):
-    """Ghi kết quả mới vào CSV và lưu report ra file riêng."""
-    ensure_dir(results_path)
-    base_dir = os.path.dirname(results_path)
-
-    # Lưu file report chi tiết
-    report_path = os.path.join(base_dir, f"{model_name}_report.txt")
-    with open(report_path, "w", encoding="utf-8") as f:
-        f.write(report_text)
-
-    # Ghi summary vào CSV
-    df = load_previous_results(results_path)
-    new_row = pd.DataFrame([{
-        "model": model_name,
-        "accuracy": accuracy,
-        "report_file": report_path,
-        "model_file": model_file
-    }])
-    df = pd.concat([df, new_row], ignore_index=True)
-    df.to_csv(results_path, index=False)
-    print(f"✅ Đã lưu kết quả của {model_name} vào {results_path}")
-
-
 def model_already_trained(results_df, model_name):
     """Kiểm tra mô hình đã được train chưa."""
     return model_name in results_df["model"].values
@@ -98,10 +80,24 @@ def model_already_trained(results_df, model_name):
 # 🔹 Hàm chính
 # =====================================================
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train SQLi classifiers")
+    parser.add_argument("--cpus", type=int, default=None,
+                        help="Tổng số core dùng để train song song (mặc định: tất cả)")
+    parser.add_argument("--dataset", default=None,
+                        help="Mặc định: data/processed/processed_payloads.csv (hoặc file của Near_Duplicates.py --mode collapse)")
+    parser.add_argument("--group-split", action="store_true",
+                        help="Chia train/test theo cluster gần trùng (processed/clusters.csv từ Near_Duplicates.py)")
+    add_pruning_args(parser)
+    add_selection_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     print("🔍 Đang tìm dataset...")
     try:
-        df_path = find_dataset()
+        df_path = os.path.abspath(args.dataset) if args.dataset else find_dataset()
     except FileNotFoundError as ex:
         print("ERROR:", ex)
         sys.exit(1)
@@ -114,34 +110,55 @@ def main():
     payload_col = df.columns[cols.index('payload')] if 'payload' in cols else df.columns[0]
     label_col = df.columns[cols.index('is_malicious')] if 'is_malicious' in cols else df.columns[1]
 
-    df = df[[payload_col, label_col]].copy()
-    df.columns = ['payload', 'is_malicious']
+    # Vector hóa (dùng feature cache nếu dataset + cấu hình vectorizer không đổi)
+    vectorizer = CountVectorizer(min_df=1, tokenizer=custom_tokenizer, ngram_range=(1, 3))
+    vectorizer, X, rows = load_or_build_features(df_path, df[payload_col], vectorizer)
 
     # Chuyển nhãn thành số
-    def to_int_lbl(x):
-        try:
-            return int(float(x))
-        except Exception:
-            return 1 if str(x).strip() else 0
-
-    df['payload'] = df['payload'].astype(str).fillna('').apply(lambda s: s.strip())
-    df['is_malicious'] = df['is_malicious'].apply(to_int_lbl).astype(int)
-    df = df[df['payload'] != ''].drop_duplicates(subset=['payload'])
-    df = df[df['is_malicious'].isin([0, 1])]
+    labels = to_int_labels(df[label_col]).values[rows]
+    mask = np.isin(labels, [0, 1])
+    X = X[mask]
+    y = labels[mask]
+
+    print("📊 Dataset:", len(y), "mẫu.")
+    print(pd.Series(y).value_counts())
+
+    groups = None
+    if args.group_split:
+        index_col = df.columns[cols.index('index')] if 'index' in cols else None
+        index_values = df[index_col] if index_col is not None else pd.Series(range(len(df)))
+        groups = load_cluster_groups(df_path, index_values)
+        if groups is None:
+            print("⚠️ Không có clusters.csv (chạy data/Near_Duplicates.py --mode annotate); dùng split thường.")
+        else:
+            groups = groups[rows][mask]
+            print(f"🧩 Split theo {len(set(groups))} cluster gần trùng.")
 
-    print("📊 Dataset:", len(df), "mẫu.")
-    print(df['is_malicious'].value_counts())
-
-    # Vector hóa
-    vectorizer = CountVectorizer(min_df=1, tokenizer=custom_tokenizer, ngram_range=(1, 3))
-    X = vectorizer.fit_transform(df['payload'])
-    y = df['is_malicious'].values
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    X_train, X_test, y_train, y_test = split_train_test(X, y, groups=groups)
 
     # Thư mục lưu model + kết quả
     script_dir = os.path.dirname(os.path.abspath(__file__))  # => .../TrainingModels/BinaryClassification
     save_dir = os.path.join(script_dir, "saved_models", "SQLInjection")  # ✅ thư mục mới
     os.makedirs(save_dir, exist_ok=True)
+    export_dir = save_dir  # sqli.pkl + vectorizer.pkl cho Flask
+
+    # =====================================================
+    # 🔸 Prune vocabulary (chọn feature trên tập train)
+    # =====================================================
+    if args.vocab_sweep:
+        payloads = df[payload_col].astype(str).str.strip().values[rows][mask]
+        vocabulary_sweep(vectorizer, X_train, y_train, X_test, y_test, parse_k_values(args.vocab_sweep),
+                         payloads, os.path.join(save_dir, "vocab_sweep.csv"), method=args.selection)
+
+    if args.top_k:
+        keep = select_features(X_train, y_train, args.top_k, args.selection)
+        print(f"✂️ Giữ {len(keep)}/{X_train.shape[1]} feature ({args.selection}).")
+        vectorizer = prune_vectorizer(vectorizer, keep)
+        X_train, X_test = X_train[:, keep], X_test[:, keep]
+        # model của không gian feature đã prune được lưu riêng, không lẫn với model full vocabulary
+        save_dir = os.path.join(save_dir, f"top{len(keep)}_{args.selection}")
+        os.makedirs(save_dir, exist_ok=True)
+
     results_path = os.path.join(save_dir, "results.csv")  # ✅ file CSV nằm trong SQLInjection
 
     results_df = load_previous_results(results_path)
@@ -169,78 +186,39 @@ def main():
     ]
 
     # =====================================================
-    # 🔸 Train từng mô hình (chỉ train nếu chưa có kết quả)
+    # 🔸 Train các mô hình song song (chỉ train nếu chưa có kết quả)
     # =====================================================
-    best_model_name = None
-    best_acc = 0
-    best_model = None
-
+    pending = []
     for model_name, clf in models:
         if model_already_trained(results_df, model_name):
             print(f"⏩ Bỏ qua {model_name} (đã có trong kết quả trước đó).")
             continue
+        pending.append((model_name, clf))
 
-        print(f"\n🚀 Training {model_name}...")
-        clf.fit(X_train, y_train)
-        y_pred = clf.predict(X_test)
-
-        acc = accuracy_score(y_test, y_pred)
-        report = classification_report(y_test, y_pred)
-
-        print(f"{model_name} Accuracy: {acc:.4f}")
-        print(report)
-
-        # Lưu model tạm thời
-        model_path = os.path.join(save_dir, f"{model_name}.pkl")
-        joblib.dump(clf, model_path)
-
-        # Ghi kết quả
-        save_result(results_path, model_name, acc, report, model_path)
-
-        # Cập nhật model tốt nhất
-        if acc > best_acc:
-            best_acc = acc
-            best_model_name = model_name
-            best_model = clf
+    train_models_parallel(pending, X_train, y_train, X_test, y_test, save_dir, results_path,
+                          total_cpus=args.cpus)
 
     # =====================================================
-    # 🔸 Nếu không có model mới nào được train, chọn từ file results.csv
+    # 🔸 Đo chi phí cho model vừa train / model cũ còn thiếu, rồi chọn model theo chính sách
     # =====================================================
-    if best_model is None:
-        print("⚠️ Không có model nào được train mới. Đang chọn model tốt nhất từ kết quả trước đó...")
-
-        if os.path.exists(results_path):
-            df_results = pd.read_csv(results_path)
-            if not df_results.empty:
-                df_results["accuracy"] = pd.to_numeric(df_results["accuracy"], errors="coerce")
-                best_row = df_results.loc[df_results["accuracy"].idxmax()]
-                best_model_name = best_row["model"]
-                best_acc = best_row["accuracy"]
-
-                # Tạo đường dẫn model từ save_dir
-                best_model_path = os.path.join(save_dir, f"{best_model_name}.pkl")
-
-                print(f"✅ Model tốt nhất trước đó: {best_model_name} (accuracy={best_acc:.4f})")
-                best_model = joblib.load(best_model_path)
-            else:
-                print("⚠️ File results.csv rỗng — không có model nào để chọn.")
-        else:
-            print("⚠️ Chưa có file results.csv để đọc kết quả trước đó.")
+    backfill_metrics(results_path, save_dir, X_test, y_test)
+    best_model_name, _, best_model = choose_and_load(results_path, save_dir, args)
 
     # =====================================================
     # 🔸 Lưu model và vectorizer chuẩn cho Flask sử dụng
     # =====================================================
     if best_model is not None:
-        sqli_model_path = os.path.join(save_dir, "sqli.pkl")
+        sqli_model_path = os.path.join(export_dir, "sqli.pkl")
         joblib.dump(best_model, sqli_model_path)
         print(f"💾 Đã lưu model tốt nhất ({best_model_name}) -> {sqli_model_path}")
     else:
         print("❌ Không thể tạo sqli.pkl vì không tìm thấy model nào hợp lệ.")
 
-    # Lưu vectorizer (luôn cập nhật)
-    vectorizer_path = os.path.join(save_dir, "vectorizer.pkl")
-    joblib.dump(vectorizer, vectorizer_path)
-    print(f"💾 Đã lưu vectorizer -> {vectorizer_path}")
+    # Lưu vectorizer (luôn cập nhật, trừ khi vectorizer đã prune mà không có model đi kèm)
+    if best_model is not None or not args.top_k:
+        vectorizer_path = os.path.join(export_dir, "vectorizer.pkl")
+        joblib.dump(vectorizer, vectorizer_path)
+        print(f"💾 Đã lưu vectorizer -> {vectorizer_path}")
 
     print("\n🎯 Hoàn tất training tất cả mô hình!")
 
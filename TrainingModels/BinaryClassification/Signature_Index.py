@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Signature_Index.py
+
+Xây index chữ ký (WAF/WAF_Signatures.py) từ các bộ payload tấn công trong data/raw
+(SQLCollection.txt, XSSCollection.txt, ShellCollection.txt). Mỗi payload được canonicalize giống hệt
+middleware (WAF_Canonical.canonicalize), payload trùng với một payload lành tính
+(non-maliciousCollection.txt) bị loại. Kết quả: saved_models/signatures.npz, WAF load khi khởi động
+và chặn ngay các payload khớp trước khi chạy model.
+
+Usage:
+    python Signature_Index.py [--fpr 0.001] [--output saved_models/signatures.npz]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "data"))
+# WAF_Signatures / WAF_Canonical không cần Flask, import trực tiếp từ thư mục WAF
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "WAF"))
+from Data_Cleaning import FILES, INPUT_DIR, load_all_payloads  # noqa: E402
+from WAF_Canonical import canonicalize  # noqa: E402
+from WAF_Signatures import (SignatureIndex, SIGNATURES_FILE, DEFAULT_BLOOM_FPR, signature_key, digest64,  # noqa: E402
+                            is_signature_key)
+
+# injection_type của Data_Cleaning -> tên attack trong WAF (ATTACK_NAMES của WAF_Flask)
+ATTACK_TYPES = {
+    "SQL": "SQLInjection",
+    "XSS": "XSS",
+    "SHELL": "Shell",
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the known-payload signature index")
+    parser.add_argument("--input-dir", default=str(INPUT_DIR), help="Thư mục chứa các file *Collection.txt")
+    parser.add_argument("--fpr", type=float, default=DEFAULT_BLOOM_FPR,
+                        help="Tỉ lệ dương tính giả mục tiêu của Bloom filter")
+    parser.add_argument("--output", default=os.path.join(SCRIPT_DIR, "saved_models", SIGNATURES_FILE))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("📂 Đọc payload từ:", args.input_dir)
+    records = load_all_payloads(args.input_dir, FILES)
+    attacks = [(canonicalize(p), ATTACK_TYPES[t]) for p, label, t in records if label == 1 and t in ATTACK_TYPES]
+    benign = [canonicalize(p) for p, label, _ in records if label == 0]
+    print(f"📊 {len(attacks)} payload tấn công, {len(benign)} payload lành tính.")
+    if not attacks:
+        print("ERROR: không có payload tấn công nào.")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    index = SignatureIndex.build(attacks, fpr=args.fpr, exclude=benign)
+    print(f"🔧 Index: {len(index)} chữ ký, bỏ {index.meta['excluded']} trùng payload lành tính, "
+          f"{index.meta['weak']} quá ngắn / không có ký tự tấn công ({time.perf_counter() - start:.2f}s)")
+    for i, name in enumerate(index.attacks):
+        print(f"   {name}: {int((index.labels == i).sum())}")
+
+    # Kiểm tra: mọi payload tấn công (không bị loại) phải khớp, payload lành tính không được khớp
+    benign_keys = {digest64(signature_key(t)) for t in benign}
+    missed = sum(1 for t, _ in attacks
+                 if is_signature_key(signature_key(t)) and digest64(signature_key(t)) not in benign_keys
+                 and index.lookup(t)[0] is None)
+    bloom_hits = matches = 0
+    for t in benign:
+        attack, bloom_hit = index.lookup(t)
+        bloom_hits += bloom_hit
+        matches += attack is not None
+    expected = index.expected_fpr()
+    print(f"🔍 Payload tấn công không khớp: {missed}")
+    print(f"   Bloom dương tính giả trên tập lành tính: {bloom_hits / max(len(benign), 1):.5f} "
+          f"(lý thuyết {expected['bloom']:.5f}); khớp nhầm sau xác nhận: {matches}")
+    if missed or matches:
+        print("❌ Index không nhất quán; không ghi file.")
+        sys.exit(1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp_path = args.output + ".tmp.npz"
+    index.save(tmp_path)
+    os.replace(tmp_path, args.output)
+    print(f"💾 Đã lưu {args.output} ({os.path.getsize(args.output) / 1e6:.2f}MB, "
+          f"bloom {index.m} bit / {index.k} hash)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tree_Parity.py
+
+Kiểm tra model cây / ensemble đã biên dịch (WAF/WAF_TreeCompiler.py) cho kết quả giống hệt
+sklearn trên toàn bộ processed_payloads.csv: predict phải trùng 100%, và in sai khác lớn nhất
+của predict_proba. Đồng thời so latency predict một payload (dense, như WAF gọi).
+
+Usage:
+    python Tree_Parity.py --attack SQLInjection
+    python Tree_Parity.py --attack XSS --models DecisionTree_xss.pkl AdaBoost_xss.pkl
+"""
+
+import os
+import sys
+import time
+import glob
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from Feature_Cache import clean_payload_rows
+# custom_tokenizer phải có trong __main__ để unpickle vectorizer
+from Model_Export import ATTACK_FILES, SCRIPT_DIR, custom_tokenizer, find_dataset, verify_agreement  # noqa: F401
+
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "WAF"))
+from WAF_TreeCompiler import compile_model  # noqa: E402
+
+
+def max_proba_diff(original, compiled, X, batch_size=4096):
+    if not hasattr(original, "predict_proba"):
+        return None
+    diff = 0.0
+    for start in range(0, X.shape[0], batch_size):
+        batch = X[start:start + batch_size]
+        diff = max(diff, float(np.max(np.abs(original.predict_proba(batch) - compiled.predict_proba(batch)))))
+    return diff
+
+
+def single_latency_ms(model, X, n=200):
+    timings = []
+    for i in range(min(n, X.shape[0])):
+        row = X[i:i + 1].toarray()
+        start = time.perf_counter()
+        model.predict(row)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings)) if timings else float("nan")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Parity check for compiled tree models")
+    parser.add_argument("--attack", choices=sorted(ATTACK_FILES), required=True)
+    parser.add_argument("--models", nargs="*", default=None,
+                        help="Tên file model trong saved_models/<attack> (mặc định: mọi .pkl không phải vectorizer)")
+    parser.add_argument("--dataset", default=None, help="Mặc định: data/processed/processed_payloads.csv")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    attack_dir = os.path.join(SCRIPT_DIR, "saved_models", args.attack)
+    vectorizer = joblib.load(os.path.join(attack_dir, ATTACK_FILES[args.attack][1]))
+    if args.models:
+        model_paths = [os.path.join(attack_dir, m) for m in args.models]
+    else:
+        model_paths = [p for p in sorted(glob.glob(os.path.join(attack_dir, "*.pkl")))
+                       if "vectorizer" not in os.path.basename(p).lower()]
+
+    df_path = args.dataset or find_dataset()
+    print("📂 Dataset:", df_path)
+    df = pd.read_csv(df_path, dtype=str, keep_default_na=False)
+    _, cleaned = clean_payload_rows(df["payload"])
+    X = vectorizer.transform(cleaned)
+
+    failed = False
+    for path in model_paths:
+        original = joblib.load(path)
+        compiled = compile_model(original)
+        name = os.path.basename(path)
+        if compiled is None:
+            print(f"⏩ {name}: {type(original).__name__} không phải model cây, bỏ qua.")
+            continue
+        stats = verify_agreement(original, compiled, X)
+        proba_diff = max_proba_diff(original, compiled, X)
+        ok = stats["disagreements"] == 0
+        failed = failed or not ok
+        proba_txt = f", max |Δproba|={proba_diff:.3g}" if proba_diff is not None else ""
+        print(f"{'✅' if ok else '❌'} {name}: {stats['disagreements']} khác / {stats['n']}{proba_txt}")
+        print(f"   latency 1 payload: sklearn={single_latency_ms(original, X):.3f}ms "
+              f"compiled={single_latency_ms(compiled, X):.3f}ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vocabulary_Pruning.py
+
+Giới hạn vocabulary của CountVectorizer(min_df=1, ngram_range=(1,3)) còn top-K feature
+(chi-squared hoặc |trọng số| của LogisticRegression), chọn trên tập train.
+
+- prune_vectorizer() tạo CountVectorizer cùng cấu hình với vocabulary cố định = K feature đã chọn,
+  dùng làm vectorizer serving (vectorizer.pkl / vectorizer_xss.pkl) -> pickle nhỏ hơn, lookup nhẹ hơn.
+- vocabulary_sweep() thử nhiều K và ghi accuracy / bộ nhớ / latency của từng K
+  vào vocab_sweep.csv để chọn K với chi phí accuracy đã biết.
+"""
+
+import time
+import pickle
+import tracemalloc
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.feature_selection import chi2
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+
+from Parallel_Training import append_result
+from Model_Selection import malicious_metrics
+
+SELECTION_METHODS = ("chi2", "weights")
+
+
+# =====================================================
+# 🔹 Chọn feature
+# =====================================================
+
+def feature_scores(X, y, method="chi2"):
+    if method == "chi2":
+        scores, _ = chi2(X, y)
+        return np.nan_to_num(scores)
+    if method == "weights":
+        clf = LogisticRegression(max_iter=2000).fit(X, y)
+        return np.abs(clf.coef_).ravel()
+    raise ValueError(f"method phải là một trong {SELECTION_METHODS}, nhận {method!r}")
+
+
+def select_features(X, y, k, method="chi2", scores=None):
+    """Chỉ số cột (tăng dần) của top-k feature; k >= số feature thì giữ tất cả."""
+    n_features = X.shape[1]
+    if k is None or k >= n_features:
+        return np.arange(n_features)
+    if scores is None:
+        scores = feature_scores(X, y, method)
+    keep = np.argpartition(-scores, k - 1)[:k]
+    return np.sort(keep)
+
+
+def prune_vectorizer(vectorizer, keep_idx):
+    """
+    CountVectorizer mới cùng tham số với vectorizer đã fit, vocabulary chỉ gồm các cột keep_idx
+    (theo đúng thứ tự), nên pruned.transform(p) == vectorizer.transform(p)[:, keep_idx].
+    """
+    terms = np.empty(len(vectorizer.vocabulary_), dtype=object)
+    for term, i in vectorizer.vocabulary_.items():
+        terms[i] = term
+    vocabulary = {terms[j]: i for i, j in enumerate(keep_idx)}
+    pruned = clone(vectorizer).set_params(vocabulary=vocabulary)
+    # vocabulary cố định: fit chỉ kiểm tra vocabulary, không học thêm gì
+    pruned.fit([""])
+    return pruned
+
+
+# =====================================================
+# 🔹 Sweep K
+# =====================================================
+
+def serving_costs(vectorizer, model, payloads, n_single=200):
+    """Kích thước / RAM khi load vectorizer và latency vectorize + predict một payload thô."""
+    blob = pickle.dumps(vectorizer)
+    tracemalloc.start()
+    try:
+        pickle.loads(blob)
+        load_memory, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    sample = list(payloads[:n_single])
+    if sample:
+        model.predict(vectorizer.transform(sample[:1]))
+    for p in sample:
+        start = time.perf_counter()
+        model.predict(vectorizer.transform([p]))
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    return {
+        "vectorizer_size_bytes": len(blob),
+        "vectorizer_memory_bytes": int(load_memory),
+        "model_size_bytes": len(pickle.dumps(model)),
+        "latency_single_ms": float(np.median(timings)) if timings else float("nan"),
+        "latency_single_p99_ms": float(np.percentile(timings, 99)) if timings else float("nan"),
+    }
+
+
+def vocabulary_sweep(vectorizer, X_train, y_train, X_test, y_test, k_values, payloads, sweep_path,
+                     method="chi2", model_name="LogisticRegression", make_model=None):
+    """
+    Với mỗi K (và toàn bộ vocabulary để so sánh): chọn feature trên train, train model tham chiếu,
+    rồi ghi accuracy, precision/recall lớp malicious, bộ nhớ và latency vào sweep_path.
+    """
+    make_model = make_model or (lambda: LogisticRegression(max_iter=2000))
+    n_features = X_train.shape[1]
+    scores = feature_scores(X_train, y_train, method)
+    k_values = sorted({min(int(k), n_features) for k in k_values} | {n_features})
+
+    rows = []
+    for k in k_values:
+        keep = select_features(X_train, y_train, k, method, scores=scores)
+        pruned = vectorizer if k == n_features else prune_vectorizer(vectorizer, keep)
+        clf = make_model().fit(X_train[:, keep], y_train)
+        y_pred = clf.predict(X_test[:, keep])
+        acc = accuracy_score(y_test, y_pred)
+
+        row = {"model": f"{model_name}@k={k}", "accuracy": acc, "report_file": "", "model_file": "",
+               "k": k, "selection": method if k < n_features else "none"}
+        row.update(malicious_metrics(y_test, y_pred))
+        row.update(serving_costs(pruned, clf, payloads))
+        append_result(sweep_path, row)
+        rows.append(row)
+        print(f"📐 k={k:<8} acc={acc:.4f} vectorizer={row['vectorizer_size_bytes'] / 1e6:.2f}MB "
+              f"latency={row['latency_single_ms']:.3f}ms")
+
+    print(f"✅ Đã ghi kết quả sweep vào {sweep_path}")
+    return rows
+
+
+def add_pruning_args(parser):
+    parser.add_argument("--top-k", type=int, default=None,
+                        help="Giữ top-K feature cho vectorizer serving (mặc định: toàn bộ vocabulary)")
+    parser.add_argument("--selection", default="chi2", choices=SELECTION_METHODS,
+                        help="Cách chấm điểm feature khi prune")
+    parser.add_argument("--vocab-sweep", default=None,
+                        help="Danh sách K cách nhau bởi dấu phẩy, ví dụ 1000,5000,20000")
+    return parser
+
+
+def parse_k_values(text):
+    return [int(k) for k in text.split(",") if k.strip()]
@@ -5,15 +5,18 @@
 Train binary classifiers chỉ cho XSS (binary classification).
 Sử dụng CountVectorizer + một số classifier.
 Lưu kết quả vào thư mục saved_models/XSS.
+
+Usage:
+    python XSS.py [--cpus N] [--top-k K] [--vocab-sweep K1,K2,...] [--policy accuracy|latency|pareto] [--latency-budget-ms MS]
 """
 
 import os
 import sys
+import argparse
 import joblib
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, classification_report
 
 # classifiers
 from sklearn.naive_bayes import MultinomialNB
@@ -22,6 +25,11 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import BaggingClassifier, AdaBoostClassifier, RandomForestClassifier, StackingClassifier
 
+from Parallel_Training import train_models_parallel
+from Model_Selection import add_selection_args, backfill_metrics, choose_and_load
+from Vocabulary_Pruning import add_pruning_args, parse_k_values, prune_vectorizer, select_features, vocabulary_sweep
+from Feature_Cache import load_or_build_features, load_cluster_groups, split_train_test
+
 
 # ---------------------------
 # Utility functions
@@ -65,26 +73,6 @@ def load_previous_results(results_path):
         return pd.DataFrame(columns=["model", "accuracy", "report_file", "model_file"])
 
 
-def save_result(results_path, model_name, accuracy, report_text, model_file):
-    ensure_dir(results_path)
-    base_dir = os.path.dirname(results_path)
-
-    report_path = os.path.join(base_dir, f"{model_name}_report.txt")
-    with open(report_path, "w", encoding="utf-8") as f:
-        f.write(report_text)
-
-    df = load_previous_results(results_path)
-    new_row = pd.DataFrame([{
-        "model": model_name,
-        "accuracy": accuracy,
-        "report_file": report_path,
-        "model_file": model_file
-    }])
-    df = pd.concat([df, new_row], ignore_index=True)
-    df.to_csv(results_path, index=False)
-    print(f"✅ Đã lưu kết quả của {model_name} vào {results_path}")
-
-
 def model_already_trained(results_df, model_name):
     return model_name in results_df["model"].values
 
@@ -122,12 +110,26 @@ def extract_xss_label(df):
 # Main
 # ---------------------------
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train XSS classifiers")
+    parser.add_argument("--cpus", type=int, default=None,
+                        help="Tổng số core dùng để train song song (mặc định: tất cả)")
+    parser.add_argument("--dataset", default=None,
+                        help="Mặc định: data/processed/processed_payloads.csv (hoặc file của Near_Duplicates.py --mode collapse)")
+    parser.add_argument("--group-split", action="store_true",
+                        help="Chia train/test theo cluster gần trùng (processed/clusters.csv từ Near_Duplicates.py)")
+    add_pruning_args(parser)
+    add_selection_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     attack_name = "XSS"
     print(f"🔍 Attack target: {attack_name}")
 
     try:
-        df_path = find_dataset()
+        df_path = os.path.abspath(args.dataset) if args.dataset else find_dataset()
     except FileNotFoundError as ex:
         print("ERROR:", ex)
         sys.exit(1)
@@ -148,28 +150,54 @@ def main():
         print("ERROR:", ex)
         sys.exit(1)
 
-    df_payloads = df[payload_col].astype(str).fillna('').apply(lambda s: s.strip())
-    combined = pd.DataFrame({'payload': df_payloads, 'label': y_series})
-    combined = combined[combined['payload'] != ''].drop_duplicates(subset=['payload'])
-    combined = combined[combined['label'].isin([0,1])]
-    combined = combined.reset_index(drop=True)
+    # Vector hóa (dùng feature cache nếu dataset + cấu hình vectorizer không đổi)
+    vectorizer = CountVectorizer(min_df=1, tokenizer=custom_tokenizer, ngram_range=(1,3))
+    vectorizer, X, rows = load_or_build_features(df_path, df[payload_col], vectorizer)
 
-    print("📊 Dataset sau xử lý:", len(combined), "mẫu.")
-    print(combined['label'].value_counts())
+    labels = y_series.values[rows]
+    mask = np.isin(labels, [0, 1])
+    X = X[mask]
+    y = labels[mask]
 
-    vectorizer = CountVectorizer(min_df=1, tokenizer=custom_tokenizer, ngram_range=(1,3))
-    X = vectorizer.fit_transform(combined['payload'])
-    y = combined['label'].values
+    print("📊 Dataset sau xử lý:", len(y), "mẫu.")
+    print(pd.Series(y).value_counts())
 
     if len(y) < 10:
         print("⚠️ Dataset quá nhỏ để train (ít hơn 10 mẫu). Dừng.")
         sys.exit(1)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    groups = None
+    if args.group_split:
+        index_col = df.columns[cols.index('index')] if 'index' in cols else None
+        index_values = df[index_col] if index_col is not None else pd.Series(range(len(df)))
+        groups = load_cluster_groups(df_path, index_values)
+        if groups is None:
+            print("⚠️ Không có clusters.csv (chạy data/Near_Duplicates.py --mode annotate); dùng split thường.")
+        else:
+            groups = groups[rows][mask]
+            print(f"🧩 Split theo {len(set(groups))} cluster gần trùng.")
+
+    X_train, X_test, y_train, y_test = split_train_test(X, y, groups=groups)
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     save_dir = os.path.join(script_dir, "saved_models", "XSS")
     os.makedirs(save_dir, exist_ok=True)
+    export_dir = save_dir  # xss.pkl + vectorizer_xss.pkl cho Flask
+
+    # prune vocabulary (chọn feature trên tập train)
+    if args.vocab_sweep:
+        payloads = df[payload_col].astype(str).str.strip().values[rows][mask]
+        vocabulary_sweep(vectorizer, X_train, y_train, X_test, y_test, parse_k_values(args.vocab_sweep),
+                         payloads, os.path.join(save_dir, "vocab_sweep_xss.csv"), method=args.selection)
+
+    if args.top_k:
+        keep = select_features(X_train, y_train, args.top_k, args.selection)
+        print(f"✂️ Giữ {len(keep)}/{X_train.shape[1]} feature ({args.selection}).")
+        vectorizer = prune_vectorizer(vectorizer, keep)
+        X_train, X_test = X_train[:, keep], X_test[:, keep]
+        # model của không gian feature đã prune được lưu riêng, không lẫn với model full vocabulary
+        save_dir = os.path.join(save_dir, f"top{len(keep)}_{args.selection}")
+        os.makedirs(save_dir, exist_ok=True)
 
     results_path = os.path.join(save_dir, "results_xss.csv")
     results_df = load_previous_results(results_path)
@@ -192,68 +220,32 @@ def main():
         # ))
     ]
 
-    best_model_name = None
-    best_acc = 0
-    best_model = None
-    any_trained = False
-
+    pending = []
     for model_name, clf in models:
         if model_already_trained(results_df, model_name):
             print(f"⏩ Bỏ qua {model_name} (đã có trong {results_path}).")
             continue
+        pending.append((model_name, clf))
 
-        print(f"\n🚀 Training {model_name} for {attack_name}...")
-        try:
-            clf.fit(X_train, y_train)
-        except Exception as e:
-            print(f"❌ Lỗi khi train {model_name}: {e}")
-            continue
+    print(f"\n🚀 Training {len(pending)} model for {attack_name}...")
+    train_models_parallel(pending, X_train, y_train, X_test, y_test, save_dir, results_path,
+                          model_suffix="_xss", report_digits=4, total_cpus=args.cpus)
 
-        y_pred = clf.predict(X_test)
-        acc = accuracy_score(y_test, y_pred)
-        report = classification_report(y_test, y_pred, digits=4)
-
-        print(f"{model_name} Accuracy: {acc:.4f}")
-        print(report)
-
-        model_path = os.path.join(save_dir, f"{model_name}_xss.pkl")
-        joblib.dump(clf, model_path)
-
-        save_result(results_path, model_name, acc, report, model_path)
-
-        any_trained = True
-        if acc > best_acc:
-            best_acc = acc
-            best_model_name = model_name
-            best_model = clf
-
-    # nếu không có model mới, chọn best từ file results
-    if not any_trained:
-        print("⚠️ Không có model nào được train mới. Chọn model tốt nhất từ results trước đó...")
-        if os.path.exists(results_path):
-            df_results = pd.read_csv(results_path)
-            df_results["accuracy"] = pd.to_numeric(df_results["accuracy"], errors="coerce")
-            df_results = df_results[df_results["model_file"].notna() & df_results["accuracy"].notna()]
-            if not df_results.empty:
-                best_row = df_results.loc[df_results["accuracy"].idxmax()]
-                best_model_name = best_row["model"]
-                best_acc = best_row["accuracy"]
-                candidate_path = best_row.get("model_file", None)
-                if pd.notna(candidate_path) and os.path.exists(candidate_path):
-                    best_model = joblib.load(candidate_path)
-                    print(f"✅ Model tốt nhất trước đó: {best_model_name} (accuracy={best_acc:.4f})")
-                else:
-                    print(f"⚠️ Không tìm thấy file model tại {candidate_path}")
+    # đo chi phí cho model vừa train / model cũ còn thiếu, rồi chọn model theo chính sách
+    backfill_metrics(results_path, save_dir, X_test, y_test, model_suffix="_xss", report_digits=4)
+    best_model_name, _, best_model = choose_and_load(results_path, save_dir, args, model_suffix="_xss")
 
     # lưu model chính và vectorizer
     if best_model is not None:
-        main_model_path = os.path.join(save_dir, "xss.pkl")
+        main_model_path = os.path.join(export_dir, "xss.pkl")
         joblib.dump(best_model, main_model_path)
-        print(f"💾 Đã lưu model tốt nhất -> {main_model_path}")
+        print(f"💾 Đã lưu model tốt nhất ({best_model_name}) -> {main_model_path}")
 
-    vectorizer_path = os.path.join(save_dir, "vectorizer_xss.pkl")
-    joblib.dump(vectorizer, vectorizer_path)
-    print(f"💾 Đã lưu vectorizer -> {vectorizer_path}")
+    # vectorizer đã prune chỉ được xuất cùng model train trên nó
+    if best_model is not None or not args.top_k:
+        vectorizer_path = os.path.join(export_dir, "vectorizer_xss.pkl")
+        joblib.dump(vectorizer, vectorizer_path)
+        print(f"💾 Đã lưu vectorizer -> {vectorizer_path}")
 
     print("\n🎯 Hoàn tất!")
 
@@ -74,6 +74,56 @@ def normalize_payload(s):
     s = s.replace("\r", " ").replace("\n", " ")
     return s
 
+def parse_legal_row(row):
+    """
+    Parse một dòng (đã tách bằng csv.reader) của file LEGAL.
+    Trả về (payload, is_malicious, injection_type) với payload đã normalize, hoặc None nếu bỏ qua.
+    """
+    if not row:
+        return None
+    # We expect something like: id,payload,is_malicious,injection_type
+    # But be tolerant: payload might contain commas; so handle len >= 2
+    if len(row) >= 4:
+        # typical case
+        # id = row[0]
+        payload = ",".join(row[1:-2]) if len(row) > 4 else row[1]
+        # but more robust approach: assume last two columns are is_malicious and injection_type
+        try:
+            is_mal = int(row[-2])
+        except Exception:
+            # fallback if not int
+            is_mal = 0
+        inj_t = row[-1] if row[-1] else "LEGAL"
+    elif len(row) == 3:
+        # maybe id,payload,injection_type  or id,payload,is_malicious
+        # We'll assume format id,payload,is_malicious
+        payload = row[1]
+        try:
+            is_mal = int(row[2])
+        except Exception:
+            is_mal = 0
+        inj_t = "LEGAL"
+    elif len(row) == 2:
+        # maybe payload,is_malicious
+        payload = row[0] if row[0] else row[1]
+        try:
+            is_mal = int(row[1])
+        except Exception:
+            is_mal = 0
+        inj_t = "LEGAL"
+    else:
+        # len(row)==1 -> it's a raw payload token (unexpected for LEGAL file), treat as payload
+        payload = row[0]
+        is_mal = 0
+        inj_t = "LEGAL"
+
+    payload = normalize_payload(payload)
+    # skip truly empty
+    if payload == "":
+        return None
+    return payload, int(is_mal), inj_t
+
+
 def load_all_payloads(input_dir, files_map):
     """
     Trả về list of tuples (payload_string, is_malicious_int, injection_type_str)
@@ -92,49 +142,9 @@ def load_all_payloads(input_dir, files_map):
                 with open(p, "r", encoding="utf-8", errors="ignore") as f:
                     reader = csv.reader(f)
                     for row in reader:
-                        if not row:
-                            continue
-                        # We expect something like: id,payload,is_malicious,injection_type
-                        # But be tolerant: payload might contain commas; so handle len >= 2
-                        if len(row) >= 4:
-                            # typical case
-                            # id = row[0]
-                            payload = ",".join(row[1:-2]) if len(row) > 4 else row[1]
-                            # but more robust approach: assume last two columns are is_malicious and injection_type
-                            try:
-                                is_mal = int(row[-2])
-                            except Exception:
-                                # fallback if not int
-                                is_mal = 0
-                            inj_t = row[-1] if row[-1] else "LEGAL"
-                        elif len(row) == 3:
-                            # maybe id,payload,injection_type  or id,payload,is_malicious
-                            # We'll assume format id,payload,is_malicious
-                            payload = row[1]
-                            try:
-                                is_mal = int(row[2])
-                            except Exception:
-                                is_mal = 0
-                            inj_t = "LEGAL"
-                        elif len(row) == 2:
-                            # maybe payload,is_malicious
-                            payload = row[0] if row[0] else row[1]
-                            try:
-                                is_mal = int(row[1])
-                            except Exception:
-                                is_mal = 0
-                            inj_t = "LEGAL"
-                        else:
-                            # len(row)==1 -> it's a raw payload token (unexpected for LEGAL file), treat as payload
-                            payload = row[0]
-                            is_mal = 0
-                            inj_t = "LEGAL"
-
-                        payload = normalize_payload(payload)
-                        # skip truly empty
-                        if payload == "":
-                            continue
-                        records.append((payload, int(is_mal), inj_t))
+                        parsed = parse_legal_row(row)
+                        if parsed is not None:
+                            records.append(parsed)
             except Exception as e:
                 print(f"[ERROR] Failed to parse LEGAL file {p}: {e}", file=sys.stderr)
             continue
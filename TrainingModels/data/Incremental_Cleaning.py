@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental_Cleaning.py
+
+Phiên bản streaming / incremental của Data_Cleaning.py:
+- Đọc từng file raw theo dòng (không gom toàn bộ vào một list trong RAM).
+- Khử trùng lặp bằng digest cố định 16 byte (blake2b) của payload thay vì set các chuỗi đầy đủ.
+  Digest được lưu trong processed/payload_digests.bin để các lần chạy sau dùng lại.
+- Manifest processed/manifest.json lưu fingerprint (size, mtime, sha256 phần đã xử lý) của từng file raw:
+    + file không đổi            -> bỏ qua
+    + file chỉ được append thêm -> chỉ xử lý phần mới (từ byte offset cũ)
+    + file bị sửa               -> xử lý lại cả file (digest đảm bảo không ghi trùng)
+- Bản ghi mới được append vào processed_payloads.csv, index tiếp tục từ lần trước.
+- Normalize + tính digest chạy song song trên nhiều process (--workers).
+
+Lưu ý: dòng bị xóa khỏi file raw không bị xóa khỏi output; dùng --rebuild để dựng lại từ đầu.
+File LEGAL được parse từng dòng bằng csv.reader (không hỗ trợ field nhiều dòng trong dấu nháy).
+
+Usage:
+  python Incremental_Cleaning.py [--workers N] [--rebuild]
+"""
+
+import os
+import csv
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+from Data_Cleaning import FILES, INPUT_DIR, OUTPUT_FILE, normalize_payload, parse_legal_row
+
+MANIFEST_FILE = OUTPUT_FILE.parent / "manifest.json"
+DIGEST_FILE = OUTPUT_FILE.parent / "payload_digests.bin"
+DIGEST_SIZE = 16
+CHUNK_LINES = 50000
+HEADER = ["index", "payload", "is_malicious", "injection_type"]
+
+
+def payload_digest(payload):
+    return hashlib.blake2b(payload.encode("utf-8", "surrogatepass"), digest_size=DIGEST_SIZE).digest()
+
+
+# =====================================================
+# Worker: normalize + digest một chunk dòng
+# =====================================================
+
+def process_chunk(args):
+    """
+    args: (inj_type, lines) với lines là list str (đã bỏ newline).
+    Trả về list (payload, is_malicious, injection_type, digest).
+    """
+    inj_type, lines = args
+    out = []
+    if inj_type == "LEGAL":
+        for row in csv.reader(lines):
+            parsed = parse_legal_row(row)
+            if parsed is not None:
+                payload, label, inj = parsed
+                out.append((payload, label, inj, payload_digest(payload)))
+        return out
+
+    for line in lines:
+        if line.startswith("\ufeff"):
+            line = line.lstrip("\ufeff")
+        if line == "":
+            continue
+        cleaned = normalize_payload(line)
+        if cleaned == "":
+            continue
+        out.append((cleaned, 1, inj_type, payload_digest(cleaned)))
+    return out
+
+
+# =====================================================
+# Fingerprint / manifest
+# =====================================================
+
+def sha256_prefix(path, n_bytes, chunk_size=1 << 20):
+    """SHA-256 của n_bytes đầu tiên trong file."""
+    h = hashlib.sha256()
+    remaining = n_bytes
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h.hexdigest()
+
+
+def load_manifest():
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+
+def save_manifest(manifest):
+    tmp = MANIFEST_FILE.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_FILE)
+
+
+def plan_file(path, entry):
+    """
+    So sánh file hiện tại với entry trong manifest.
+    Trả về (start_offset, size) cần xử lý, hoặc None nếu file không đổi.
+    """
+    st = path.stat()
+    if entry is None:
+        return 0, st.st_size
+    if st.st_size == entry["size"] and int(st.st_mtime) == entry["mtime"]:
+        return None
+    processed = entry["size"]
+    if st.st_size >= processed and sha256_prefix(path, processed) == entry["sha256"]:
+        if st.st_size == processed:
+            return None
+        return processed, st.st_size
+    return 0, st.st_size
+
+
+def iter_line_chunks(path, start, end, chunk_lines=CHUNK_LINES):
+    """Đọc các dòng trong khoảng byte [start, end) theo từng chunk, không load cả file."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        pos = start
+        chunk = []
+        while pos < end:
+            raw = f.readline()
+            if not raw:
+                break
+            pos += len(raw)
+            chunk.append(raw.decode("utf-8", errors="ignore").rstrip("\r\n"))
+            if len(chunk) >= chunk_lines:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+# =====================================================
+# Digest store + output
+# =====================================================
+
+def load_digests():
+    seen = set()
+    if DIGEST_FILE.exists():
+        with open(DIGEST_FILE, "rb") as f:
+            while True:
+                block = f.read(DIGEST_SIZE * 65536)
+                if not block:
+                    break
+                for i in range(0, len(block) - DIGEST_SIZE + 1, DIGEST_SIZE):
+                    seen.add(block[i:i + DIGEST_SIZE])
+    return seen
+
+
+def bootstrap_from_output():
+    """
+    Chưa có manifest nhưng đã có processed_payloads.csv (tạo bởi Data_Cleaning.py):
+    dựng digest store từ output hiện có để không ghi trùng. Trả về (seen, next_index).
+    """
+    seen = set()
+    next_index = 0
+    with open(OUTPUT_FILE, "r", newline="", encoding="utf-8") as f, open(DIGEST_FILE, "wb") as out:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 2:
+                continue
+            d = payload_digest(row[1])
+            if d not in seen:
+                seen.add(d)
+                out.write(d)
+            next_index += 1
+    return seen, next_index
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental streaming payload cleaner")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--rebuild", action="store_true", help="Bỏ manifest/output cũ và dựng lại từ đầu")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("== Incremental payload cleaning ==")
+    print(f"Input dir: {INPUT_DIR}")
+    print(f"Output file: {OUTPUT_FILE}")
+
+    manifest = None if args.rebuild else load_manifest()
+    if manifest is None:
+        if not args.rebuild and OUTPUT_FILE.exists():
+            print("[INFO] No manifest found; seeding digests from existing output.")
+            seen, next_index = bootstrap_from_output()
+        else:
+            seen, next_index = set(), 0
+            with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(HEADER)
+            open(DIGEST_FILE, "wb").close()
+        manifest = {"version": 1, "files": {}, "next_index": next_index}
+    else:
+        seen = load_digests()
+        next_index = manifest["next_index"]
+    print(f"Known payload digests: {len(seen)}")
+
+    added_total = 0
+    pool = Pool(args.workers) if args.workers > 1 else None
+    try:
+        with open(OUTPUT_FILE, "a", newline="", encoding="utf-8") as out_csv, open(DIGEST_FILE, "ab") as out_dig:
+            writer = csv.writer(out_csv, quoting=csv.QUOTE_MINIMAL)
+            for fname, inj_type in FILES.items():
+                path = Path(INPUT_DIR) / fname
+                if not path.exists():
+                    print(f"[INFO] Missing file: {path} -- skipping.")
+                    continue
+                plan = plan_file(path, manifest["files"].get(fname))
+                if plan is None:
+                    print(f"[SKIP] {fname} unchanged.")
+                    continue
+                start, end = plan
+                mode = "append-only" if start > 0 else "full"
+                print(f"[READ] {fname}: bytes {start}..{end} ({mode})")
+
+                tasks = ((inj_type, chunk) for chunk in iter_line_chunks(path, start, end))
+                results = pool.imap(process_chunk, tasks) if pool else map(process_chunk, tasks)
+                added = 0
+                for records in results:
+                    for payload, label, inj, digest in records:
+                        if digest in seen:
+                            continue
+                        seen.add(digest)
+                        out_dig.write(digest)
+                        writer.writerow([next_index, payload, label, inj])
+                        next_index += 1
+                        added += 1
+                out_csv.flush()
+                out_dig.flush()
+                added_total += added
+                print(f"[ADD] {fname}: {added} new unique payloads.")
+
+                st = path.stat()
+                manifest["files"][fname] = {
+                    "size": end,
+                    "mtime": int(st.st_mtime) if st.st_size == end else 0,
+                    "sha256": sha256_prefix(path, end),
+                }
+                manifest["next_index"] = next_index
+                save_manifest(manifest)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    save_manifest(manifest)
+    print(f"Added {added_total} payloads; total rows: {next_index}.")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
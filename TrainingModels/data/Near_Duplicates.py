@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Near_Duplicates.py
+
+Phát hiện payload gần trùng (chỉ khác whitespace, hoa/thường, số, encoding...) trong
+processed_payloads.csv mà deduplicate_preserve_order (so khớp chính xác) bỏ sót.
+
+Các bước:
+  1. Canonicalize: URL-decode / HTML-unescape (tối đa vài lớp), lowercase, mọi dãy số -> "0",
+     gộp whitespace. Payload có cùng dạng canonical thuộc cùng một cluster.
+  2. MinHash trên shingle ký tự của các dạng canonical còn lại + LSH (banding)
+     để chỉ so sánh các cặp ứng viên -> dưới bậc hai theo số payload.
+  3. Cặp ứng viên có Jaccard ước lượng >= --threshold được gộp bằng union-find.
+
+Modes:
+  - report   : chỉ in thống kê cluster
+  - collapse : ghi <input>_collapsed.csv (hoặc --output), giữ 1 đại diện cho mỗi (cluster, nhãn);
+               train trên file này bằng SQL.py / XSS.py --dataset <file>
+  - annotate : ghi clusters.csv (index, cluster_id) cạnh --input để train split theo cluster
+               (SQL.py / XSS.py --group-split), tránh near-copy nằm ở cả train và test
+
+Usage:
+  python Near_Duplicates.py --mode report --threshold 0.8
+  python Near_Duplicates.py --mode annotate
+  python Near_Duplicates.py --mode collapse && python ../BinaryClassification/SQL.py \
+      --dataset processed/processed_payloads_collapsed.csv
+"""
+
+import re
+import csv
+import html
+import zlib
+import argparse
+from pathlib import Path
+from collections import Counter, defaultdict
+from urllib.parse import unquote
+
+import numpy as np
+
+BASE = Path(__file__).resolve().parent
+PROCESSED_DIR = BASE / "processed"
+INPUT_FILE = PROCESSED_DIR / "processed_payloads.csv"
+# Tên file ra, đặt cạnh --input (clusters.csv là file Feature_Cache.load_cluster_groups tìm cạnh dataset)
+COLLAPSED_SUFFIX = "_collapsed"
+CLUSTERS_FILE_NAME = "clusters.csv"
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+# =====================================================
+# Canonical form + shingles
+# =====================================================
+
+def canonicalize(payload, max_layers=3):
+    s = payload
+    for _ in range(max_layers):
+        decoded = html.unescape(unquote(s))
+        if decoded == s:
+            break
+        s = decoded
+    s = s.lower()
+    s = _DIGITS.sub("0", s)
+    s = _SPACES.sub(" ", s).strip()
+    return s
+
+
+def shingle_hashes(text, k):
+    if len(text) <= k:
+        return np.array([zlib.crc32(text.encode("utf-8", "ignore"))], dtype=np.uint64)
+    data = text.encode("utf-8", "ignore")
+    return np.fromiter({zlib.crc32(data[i:i + k]) for i in range(len(data) - k + 1)}, dtype=np.uint64)
+
+
+# =====================================================
+# MinHash + LSH
+# =====================================================
+
+class MinHasher:
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes):
+        # (a*x + b) mod p, rút gọn về 32 bit; overflow uint64 là xác định nên vẫn là một họ hash hợp lệ
+        with np.errstate(over="ignore"):
+            hv = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME
+        return (hv & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+def choose_bands(num_perm, threshold):
+    """Chọn (bands, rows) với bands*rows = num_perm sao cho (1/bands)^(1/rows) gần threshold nhất."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        approx = (1.0 / bands) ** (1.0 / rows)
+        if best is None or abs(approx - threshold) < best[0]:
+            best = (abs(approx - threshold), bands, rows)
+    return best[1], best[2]
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            # giữ phần tử xuất hiện trước làm gốc để đại diện ổn định
+            if ry < rx:
+                rx, ry = ry, rx
+            self.parent[ry] = rx
+
+
+def cluster_payloads(payloads, threshold=0.8, num_perm=64, shingle_k=4):
+    """
+    Trả về list cluster_id (int) cho từng payload; cluster_id = vị trí của đại diện (lần xuất hiện đầu).
+    """
+    canon = [canonicalize(p) for p in payloads]
+    first_of = {}
+    uf = UnionFind(len(payloads))
+    uniques = []
+    for i, c in enumerate(canon):
+        if c in first_of:
+            uf.union(first_of[c], i)
+        else:
+            first_of[c] = i
+            uniques.append(i)
+
+    hasher = MinHasher(num_perm=num_perm)
+    bands, rows = choose_bands(num_perm, threshold)
+    signatures = np.empty((len(uniques), num_perm), dtype=np.uint32)
+    for j, i in enumerate(uniques):
+        signatures[j] = hasher.signature(shingle_hashes(canon[i], shingle_k))
+
+    for band in range(bands):
+        buckets = defaultdict(list)
+        block = signatures[:, band * rows:(band + 1) * rows]
+        for j in range(len(uniques)):
+            buckets[block[j].tobytes()].append(j)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            # so với phần tử đầu của bucket thay vì mọi cặp để giữ chi phí tuyến tính theo bucket
+            head = members[0]
+            for j in members[1:]:
+                if uf.find(uniques[head]) == uf.find(uniques[j]):
+                    continue
+                similarity = float(np.mean(signatures[head] == signatures[j]))
+                if similarity >= threshold:
+                    uf.union(uniques[head], uniques[j])
+
+    return [uf.find(i) for i in range(len(payloads))]
+
+
+# =====================================================
+# IO + report
+# =====================================================
+
+def read_processed(path):
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [row for row in reader if len(row) >= 4]
+    return header, rows
+
+
+def report(rows, cluster_ids):
+    sizes = Counter(cluster_ids)
+    labels = defaultdict(set)
+    for row, cid in zip(rows, cluster_ids):
+        labels[cid].add(row[2])
+    n = len(rows)
+    n_clusters = len(sizes)
+    multi = [s for s in sizes.values() if s > 1]
+    mixed = sum(1 for v in labels.values() if len(v) > 1)
+    print(f"Payloads: {n}")
+    print(f"Clusters: {n_clusters} ({n_clusters / max(n, 1):.1%} of payloads)")
+    print(f"Clusters with near-duplicates: {len(multi)} covering {sum(multi)} payloads")
+    print(f"Removable by collapsing: {n - n_clusters} ({(n - n_clusters) / max(n, 1):.1%})")
+    print(f"Clusters with mixed labels: {mixed}")
+    print("Largest clusters:")
+    for cid, size in sizes.most_common(10):
+        if size < 2:
+            break
+        print(f"  {size:6d}  e.g. {rows[cid][1][:80]!r}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Near-duplicate payload detection (MinHash/LSH)")
+    parser.add_argument("--mode", default="report", choices=["report", "collapse", "annotate"])
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard tối thiểu để coi là gần trùng")
+    parser.add_argument("--num-perm", type=int, default=64)
+    parser.add_argument("--shingle", type=int, default=4, help="Độ dài shingle ký tự")
+    parser.add_argument("--input", default=str(INPUT_FILE))
+    parser.add_argument("--output", default=None,
+                        help="File ra của mode collapse (mặc định: <input>_collapsed.csv cạnh --input)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"== Near-duplicate detection (threshold={args.threshold}) ==")
+    header, rows = read_processed(args.input)
+    cluster_ids = cluster_payloads([r[1] for r in rows], threshold=args.threshold,
+                                   num_perm=args.num_perm, shingle_k=args.shingle)
+    report(rows, cluster_ids)
+
+    input_path = Path(args.input)
+    if args.mode == "collapse":
+        collapsed_path = Path(args.output) if args.output else \
+            input_path.with_name(input_path.stem + COLLAPSED_SUFFIX + input_path.suffix)
+        kept = set()
+        with open(collapsed_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(header)
+            i = 0
+            for row, cid in zip(rows, cluster_ids):
+                key = (cid, row[2])
+                if key in kept:
+                    continue
+                kept.add(key)
+                # giữ index gốc: clusters.csv của --input vẫn dùng được cho --group-split
+                writer.writerow(row)
+                i += 1
+        print(f"Saved {i} representatives -> {collapsed_path}")
+    elif args.mode == "annotate":
+        clusters_path = input_path.with_name(CLUSTERS_FILE_NAME)
+        with open(clusters_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", "cluster_id"])
+            for row, cid in zip(rows, cluster_ids):
+                writer.writerow([row[0], rows[cid][0]])
+        print(f"Saved cluster ids -> {clusters_path}")
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
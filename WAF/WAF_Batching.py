@@ -0,0 +1,165 @@
+# WAF/WAF_Batching.py
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from WAF.WAF_Metrics import Counters, Histogram
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+QUEUE_DELAY_US_BUCKETS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000]
+
+
+def predict_payloads(detector, payloads):
+    """
+    Vectorize + predict cả list payload trong một lần gọi.
+    Trả về list dự đoán theo thứ tự payload; None cho payload không có token nào
+    (không đưa vào model, giống preprocess_single_payload).
+    """
+    predictions = [None] * len(payloads)
+    if not payloads or detector.model is None or detector.vectorizer is None:
+        return predictions
+    X = detector.vectorizer.transform(payloads).tocsr()
+    meaningful = np.flatnonzero(np.diff(X.indptr) > 0)
+    if len(meaningful):
+        for i, p in zip(meaningful, detector.model.predict(X[meaningful])):
+            predictions[i] = p
+    return predictions
+
+
+class BatchTimeout(Exception):
+    """Job chưa có kết quả trước hạn chót của request."""
+
+
+class _Job:
+    __slots__ = ('attack_name', 'payloads', 'enqueued', 'done', 'result', 'error', 'abandoned')
+
+    def __init__(self, attack_name, payloads):
+        self.attack_name = attack_name
+        self.payloads = payloads
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # request đã hết hạn chờ (BatchTimeout): không predict nữa
+        self.abandoned = False
+
+
+class BatchingEngine:
+    """
+    Gom payload của nhiều request đồng thời thành batch để mỗi detector chỉ
+    vectorize + predict một lần cho cả batch thay vì một lần cho mỗi payload.
+
+    Worker flush khi tổng số payload đang chờ >= max_batch hoặc khi job đầu tiên
+    trong batch đã chờ max_wait_us micro giây. Mỗi request chờ kết quả của chính nó
+    (predict(...) trả list dự đoán theo đúng thứ tự payload; None = payload không có token nào).
+    """
+
+    def __init__(self, detectors, max_batch=64, max_wait_us=500):
+        self.detectors = detectors
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0, max_wait_us) / 1e6
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self.counters = Counters('jobs', 'payloads', 'flushes', 'timeouts', 'abandoned', 'errors')
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delay_us = Histogram(QUEUE_DELAY_US_BUCKETS)
+        self._thread = threading.Thread(target=self._run, name='waf-batching', daemon=True)
+        self._thread.start()
+
+    def predict(self, attack_name, payloads, timeout=None):
+        """
+        Đưa payloads vào batch kế tiếp và chờ kết quả.
+        Raise BatchTimeout nếu quá timeout (giây), hoặc lỗi của model nếu predict thất bại.
+        """
+        job = _Job(attack_name, list(payloads))
+        with self._cond:
+            self._queue.append(job)
+            self._cond.notify()
+        self.counters.incr('jobs')
+        self.counters.incr('payloads', len(job.payloads))
+        if not job.done.wait(timeout):
+            self.counters.incr('timeouts')
+            with self._cond:
+                job.abandoned = True
+                try:
+                    # còn trong hàng đợi: bỏ ra luôn để không chiếm chỗ trong batch
+                    self._queue.remove(job)
+                    self.counters.incr('abandoned')
+                except ValueError:
+                    pass
+            raise BatchTimeout(f"batch for {attack_name} not ready after {timeout}s")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    # -----------------------------
+    # Worker
+    # -----------------------------
+    def _collect(self):
+        """Chờ job đầu tiên, rồi gom thêm đến khi đủ max_batch payload hoặc hết max_wait."""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0].enqueued + self.max_wait
+            while sum(len(j.payloads) for j in self._queue) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            size = 0
+            while self._queue and (not batch or size + len(self._queue[0].payloads) <= self.max_batch):
+                job = self._queue.popleft()
+                batch.append(job)
+                size += len(job.payloads)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            if not batch:
+                # mọi job đang gom đã hết hạn và bị bỏ khỏi hàng đợi
+                continue
+            start = time.perf_counter()
+            for job in batch:
+                self.queue_delay_us.observe((start - job.enqueued) * 1e6)
+            self.batch_size.observe(size)
+            self.counters.incr('flushes')
+
+            by_attack = {}
+            for job in batch:
+                by_attack.setdefault(job.attack_name, []).append(job)
+            for attack_name, jobs in by_attack.items():
+                try:
+                    self._flush(attack_name, jobs)
+                except Exception as e:
+                    self.counters.incr('errors')
+                    for job in jobs:
+                        job.error = e
+                for job in jobs:
+                    job.done.set()
+
+    def _flush(self, attack_name, jobs):
+        # job đã được gom vào batch rồi mới hết hạn: bỏ qua, không ai chờ kết quả
+        live = [job for job in jobs if not job.abandoned]
+        if len(live) < len(jobs):
+            self.counters.incr('abandoned', len(jobs) - len(live))
+        if not live:
+            return
+        jobs = live
+        payloads = [p for job in jobs for p in job.payloads]
+        predictions = predict_payloads(self.detectors[attack_name], payloads)
+        offset = 0
+        for job in jobs:
+            job.result = predictions[offset:offset + len(job.payloads)]
+            offset += len(job.payloads)
+
+    def stats(self):
+        data = self.counters.snapshot()
+        data['batch_size'] = self.batch_size.snapshot()
+        data['queue_delay_us'] = self.queue_delay_us.snapshot()
+        with self._cond:
+            data['queued_jobs'] = len(self._queue)
+        return data
@@ -0,0 +1,255 @@
+# WAF/WAF_Canonical.py
+import html
+import io
+import json
+import unicodedata
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import unquote
+
+try:
+    from WAF.WAF_Metrics import Counters
+except ImportError:
+    # import trực tiếp từ script train (sys.path trỏ vào WAF/, không load package WAF / Flask)
+    from WAF_Metrics import Counters
+
+# Số lớp decode tối đa (URL + HTML entity) cho payload bị encode lồng nhau, ví dụ %2527 -> %27 -> '
+MAX_DECODE_LAYERS = 3
+# Chuỗi dài hơn không được memoize để cache không giữ body lớn
+MAX_CACHED_LENGTH = 4096
+MAX_JSON_DEPTH = 32
+# Số byte đầu của mỗi file upload (multipart) được kiểm tra
+MAX_FILE_PREFIX_BYTES = 64 * 1024
+BODY_PREFIX_KEY = 'waf.body_prefix'
+
+CANONICAL_COUNTERS = Counters('requests', 'parts', 'inspected_chars', 'duplicate_chars', 'body_skipped')
+
+
+class PayloadItem(namedtuple('PayloadItem', ['text', 'sources'])):
+    """Một payload đã canonicalize và danh sách nguồn của nó (ví dụ 'query:id', 'json:user.name', 'body')."""
+    __slots__ = ()
+
+
+def _decode_layers(text, max_layers):
+    s = text
+    for _ in range(max_layers):
+        decoded = s
+        if '%' in decoded:
+            decoded = unquote(decoded)
+        if '&' in decoded:
+            decoded = html.unescape(decoded)
+        if decoded == s:
+            break
+        s = decoded
+    if not s.isascii():
+        s = unicodedata.normalize('NFKC', s)
+    return s.strip()
+
+
+@lru_cache(maxsize=8192)
+def _canonicalize_cached(text, max_layers):
+    return _decode_layers(text, max_layers)
+
+
+def canonicalize(text, max_layers=MAX_DECODE_LAYERS):
+    """
+    Dạng canonical của một giá trị đã được Werkzeug decode một lần:
+    decode thêm tối đa max_layers lớp URL / HTML entity (chỉ khi còn ký tự encode), rồi NFKC.
+    Kết quả được memoize cho chuỗi ngắn (giá trị lặp lại giữa các request: tên field, token...).
+    """
+    if len(text) <= MAX_CACHED_LENGTH:
+        return _canonicalize_cached(text, max_layers)
+    return _decode_layers(text, max_layers)
+
+
+def _iter_json_values(value, prefix='', depth=0):
+    """
+    Các phần của JSON kèm đường dẫn: mọi key (source 'json-key') và mọi giá trị lá (source 'json');
+    số / bool được chuyển thành chuỗi, null bỏ qua. Phần lồng sâu hơn MAX_JSON_DEPTH được kiểm tra nguyên khối.
+    """
+    if depth > MAX_JSON_DEPTH:
+        yield 'json', prefix or '$', json.dumps(value, ensure_ascii=False)
+        return
+    if isinstance(value, str):
+        yield 'json', prefix or '$', value
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            path = f"{prefix}.{k}" if prefix else str(k)
+            yield 'json-key', path, str(k)
+            yield from _iter_json_values(v, path, depth + 1)
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            yield from _iter_json_values(v, f"{prefix}[{i}]", depth + 1)
+    elif value is not None:
+        # json.dumps: true / false / 1.5 giống như trong raw body
+        yield 'json', prefix or '$', json.dumps(value)
+
+
+class _ChainedStream(io.RawIOBase):
+    """Phần body WAF đã đọc trước + phần còn lại của stream gốc: form / JSON / app vẫn đọc được cả body."""
+
+    def __init__(self, head, rest):
+        self._head = head
+        self._rest = rest
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._head:
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        data = self._rest.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def read_body_prefix(req, max_body_bytes):
+    """
+    (max_body_bytes byte đầu của body, True nếu body lớn hơn max_body_bytes).
+    Chỉ đọc tối đa max_body_bytes + 1 byte từ stream, kể cả body chunked không có Content-Length,
+    nên giới hạn chặn được cả bộ nhớ lẫn thời gian đọc. Body có Content-Length nằm trong giới hạn không bị
+    đọc ở đây (prefix = None). Kết quả giữ trong environ để chỉ đọc một lần cho mỗi request.
+    """
+    cached = req.environ.get(BODY_PREFIX_KEY)
+    if cached is not None:
+        return cached
+    if req.content_length is not None and req.content_length <= max_body_bytes:
+        result = (None, False)
+    else:
+        stream = req.stream
+        chunks, size = [], 0
+        while size <= max_body_bytes:
+            chunk = stream.read(max_body_bytes + 1 - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        head = b''.join(chunks)
+        # Request.stream là cached_property: thay bằng stream nối lại phần đã đọc
+        req.__dict__['stream'] = io.BufferedReader(_ChainedStream(head, stream))
+        result = (head[:max_body_bytes], len(head) > max_body_bytes)
+    req.environ[BODY_PREFIX_KEY] = result
+    return result
+
+
+def body_exceeds(req, max_body_bytes):
+    """Body lớn hơn max_body_bytes? (xem read_body_prefix; không đọc quá max_body_bytes + 1 byte)."""
+    if max_body_bytes is None:
+        return False
+    try:
+        return read_body_prefix(req, max_body_bytes)[1]
+    except Exception:
+        return False
+
+
+def _read_file_prefix(storage, limit):
+    """limit byte đầu của một FileStorage (đưa con trỏ về đầu để app vẫn đọc được cả file)."""
+    try:
+        data = storage.stream.read(limit)
+        storage.stream.seek(0)
+    except Exception:
+        return ''
+    return data.decode('utf-8', errors='replace')
+
+
+def iter_request_parts(req, parts=None, max_body_bytes=None):
+    """
+    Các phần của request, mỗi phần đúng một lần, dạng (source, text) đã được Werkzeug decode:
+      - đoạn cuối của path
+      - giá trị query string
+      - key + giá trị form (multipart: thêm tên file và phần đầu nội dung mỗi file),
+        hoặc key + giá trị lá (chuỗi, số, bool) của JSON body
+      - raw body chỉ khi không parse được form / JSON (nếu không nó lặp lại đúng các field trên)
+    parts: tập tên phần cần lấy ('path', 'query', 'form', 'json', 'body'), None = tất cả.
+    max_body_bytes: body lớn hơn không được parse form / JSON; max_body_bytes byte đầu của raw body
+    luôn được kiểm tra (kể cả khi parts không có 'body'), để body quá lớn không lọt qua mà không bị xem.
+    """
+    if parts is None or 'path' in parts:
+        last_segment = (req.path or '').split('/')[-1]
+        if last_segment:
+            yield 'path', last_segment
+
+    if parts is None or 'query' in parts:
+        for k, v in req.args.items(multi=True):
+            if v:
+                yield f'query:{k}', v
+
+    oversize = body_exceeds(req, max_body_bytes)
+    body_parsed = False
+    if not oversize and (parts is None or 'form' in parts):
+        try:
+            form = req.form
+            files = req.files
+            if form or files:
+                body_parsed = True
+                for k in form.keys():
+                    yield f'form-key:{k}', k
+                for k, v in form.items(multi=True):
+                    if v:
+                        yield f'form:{k}', v
+                # multipart: Werkzeug đã đọc hết stream, raw body không còn -> kiểm tra trực tiếp các file
+                for k, f in files.items(multi=True):
+                    yield f'form-key:{k}', k
+                    if f.filename:
+                        yield f'file-name:{k}', f.filename
+                    content = _read_file_prefix(f, MAX_FILE_PREFIX_BYTES if max_body_bytes is None
+                                                else min(max_body_bytes, MAX_FILE_PREFIX_BYTES))
+                    if content.strip():
+                        yield f'file:{k}', content
+        except Exception:
+            pass
+
+    if not body_parsed and not oversize and (parts is None or 'json' in parts):
+        json_body = req.get_json(silent=True)
+        if json_body is not None:
+            body_parsed = True
+            for kind, path, v in _iter_json_values(json_body):
+                if v:
+                    yield f'{kind}:{path}', v
+
+    if body_parsed:
+        CANONICAL_COUNTERS.incr('body_skipped')
+        return
+    if not oversize and parts is not None and 'body' not in parts:
+        return
+    try:
+        # body quá lớn: chỉ phần đầu đã đọc sẵn, không đọc hết body vào bộ nhớ
+        raw = read_body_prefix(req, max_body_bytes)[0] if oversize else req.get_data(cache=True)
+        raw = raw.decode('utf-8', errors='replace')
+    except Exception:
+        raw = ''
+    if raw and raw.strip():
+        yield 'body', raw
+
+
+def extract_payload_items(req, max_layers=MAX_DECODE_LAYERS, parts=None, max_body_bytes=None):
+    """
+    Canonicalize từng phần của request một lần. Payload trùng nhau sau canonicalize
+    (ví dụ cùng giá trị ở query và form) chỉ giữ một bản, gộp nguồn vào sources.
+    parts / max_body_bytes: xem iter_request_parts (thường lấy từ policy của route).
+    """
+    items = []
+    index = {}
+    CANONICAL_COUNTERS.incr('requests')
+    for source, raw in iter_request_parts(req, parts, max_body_bytes):
+        CANONICAL_COUNTERS.incr('parts')
+        text = canonicalize(raw, max_layers)
+        if not text:
+            continue
+        if text in index:
+            items[index[text]].sources.append(source)
+            CANONICAL_COUNTERS.incr('duplicate_chars', len(text))
+            continue
+        index[text] = len(items)
+        items.append(PayloadItem(text, [source]))
+        CANONICAL_COUNTERS.incr('inspected_chars', len(text))
+    return items
+
+
+def canonical_stats():
+    stats = CANONICAL_COUNTERS.snapshot()
+    stats['cache'] = _canonicalize_cached.cache_info()._asdict()
+    return stats
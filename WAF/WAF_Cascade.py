@@ -0,0 +1,137 @@
+# WAF/WAF_Cascade.py
+# Cascade detector: model rẻ (NaiveBayes / LogisticRegression) quyết định các payload nó chắc chắn,
+# chỉ payload có xác suất tấn công nằm trong dải (low, high) mới được chuyển cho model mạnh (SVM, ensemble).
+# Ngưỡng được hiệu chỉnh lúc train (TrainingModels/BinaryClassification/Cascade_Calibration.py)
+# và lưu trong saved_models/<attack>/cascade.json.
+# Chỉ phụ thuộc numpy để script train import được mà không kéo theo Flask.
+import json
+import os
+import threading
+
+import numpy as np
+
+CASCADE_FILE = 'cascade.json'
+CALIBRATION_GRID = 201
+
+
+class CascadeModel:
+    """
+    Model ghép dùng như một model sklearn (predict / n_features_in_):
+      p = cheap.predict_proba(X)[:, 1]
+      p <= low  -> 0 (chắc chắn an toàn)
+      p >= high -> 1 (chắc chắn tấn công)
+      còn lại   -> strong.predict(X)
+    Đếm số payload đã đánh giá và số payload phải chuyển lên model mạnh.
+    """
+
+    def __init__(self, cheap, strong, low, high, name=None):
+        if not low < high:
+            raise ValueError(f"cascade thresholds need low < high, got low={low}, high={high}")
+        self.cheap = cheap
+        self.strong = strong
+        self.low = float(low)
+        self.high = float(high)
+        self.name = name
+        self.n_features_in_ = getattr(strong, 'n_features_in_', getattr(cheap, 'n_features_in_', None))
+        self._lock = threading.Lock()
+        self._payloads = 0
+        self._escalated = 0
+
+    def _positive_proba(self, X):
+        proba = np.asarray(self.cheap.predict_proba(X))
+        classes = list(getattr(self.cheap, 'classes_', [0, 1]))
+        return proba[:, classes.index(1) if 1 in classes else -1]
+
+    def predict(self, X):
+        p = self._positive_proba(X)
+        predictions = (p >= self.high).astype(int)
+        band = np.flatnonzero((p > self.low) & (p < self.high))
+        if len(band):
+            predictions[band] = np.asarray(self.strong.predict(X[band])).astype(int)
+        with self._lock:
+            self._payloads += len(p)
+            self._escalated += len(band)
+        return predictions
+
+    def stats(self):
+        with self._lock:
+            payloads, escalated = self._payloads, self._escalated
+        return {
+            'payloads': payloads,
+            'escalated': escalated,
+            'escalation_rate': escalated / payloads if payloads else 0.0,
+            'low': self.low,
+            'high': self.high,
+        }
+
+
+def calibrate_thresholds(p_cheap, strong_pred, y, max_accuracy_loss=0.001, grid=CALIBRATION_GRID):
+    """
+    Chọn (low, high) với tỉ lệ chuyển lên model mạnh nhỏ nhất sao cho
+    accuracy(cascade) >= accuracy(model mạnh) - max_accuracy_loss trên tập hiệu chỉnh.
+    p_cheap: xác suất tấn công của model rẻ; strong_pred: dự đoán của model mạnh; y: nhãn 0/1.
+    Ngưỡng ứng viên là các quantile của p_cheap (grid điểm). Trả về dict kết quả.
+    """
+    p_cheap = np.asarray(p_cheap, dtype=float)
+    strong_pred = np.asarray(strong_pred).astype(int)
+    y = np.asarray(y).astype(int)
+    n = len(y)
+    if n == 0:
+        raise ValueError("empty calibration set")
+
+    order = np.argsort(p_cheap, kind='stable')
+    p_sorted = p_cheap[order]
+    # số dự đoán đúng tích lũy theo thứ tự p tăng dần
+    correct_benign = np.concatenate([[0], np.cumsum(y[order] == 0)])
+    correct_strong = np.concatenate([[0], np.cumsum(strong_pred[order] == y[order])])
+    correct_attack = np.concatenate([[0], np.cumsum(y[order] == 1)])
+
+    candidates = np.unique(np.concatenate([[-np.inf, np.inf], np.quantile(p_cheap, np.linspace(0, 1, grid))]))
+    # i: số payload có p <= low (quyết định 0); j: số payload có p < high (từ j trở đi quyết định 1)
+    i = np.searchsorted(p_sorted, candidates, side='right')[:, None]
+    j = np.searchsorted(p_sorted, candidates, side='left')[None, :]
+    valid = candidates[:, None] < candidates[None, :]
+    j = np.maximum(i, j)
+    correct = correct_benign[i] + (correct_strong[j] - correct_strong[i]) + (correct_attack[n] - correct_attack[j])
+    accuracy = correct / n
+    escalated = (j - i) / n
+
+    strong_accuracy = correct_strong[n] / n
+    ok = valid & (accuracy >= strong_accuracy - max_accuracy_loss)
+    # luôn có nghiệm: low=-inf, high=+inf chuyển hết lên model mạnh
+    cost = np.where(ok, escalated, np.inf)
+    best = np.unravel_index(np.argmin(cost - 1e-12 * accuracy), cost.shape)
+    low, high = candidates[best[0]], candidates[best[1]]
+    return {
+        # ngưỡng vô cực (không quyết định một phía) được lưu thành giá trị ngoài [0, 1] để ghi được JSON
+        'low': float(max(low, -1.0)),
+        'high': float(min(high, 2.0)),
+        'escalation_rate': float(escalated[best]),
+        'accuracy_cascade': float(accuracy[best]),
+        'accuracy_strong': float(strong_accuracy),
+        'accuracy_cheap': float(np.mean((p_cheap >= 0.5).astype(int) == y)),
+        'max_accuracy_loss': float(max_accuracy_loss),
+        'n': int(n),
+    }
+
+
+def save_cascade_config(attack_dir, config):
+    path = os.path.join(attack_dir, CASCADE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_cascade_config(attack_dir):
+    """Đọc saved_models/<attack>/cascade.json, None nếu không có."""
+    path = os.path.join(attack_dir, CASCADE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    missing = {'cheap', 'strong', 'low', 'high'} - set(config)
+    if missing:
+        raise ValueError(f"{path}: missing keys {sorted(missing)}")
+    return config
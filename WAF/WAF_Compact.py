@@ -0,0 +1,118 @@
+# WAF/WAF_Compact.py
+# Model tuyến tính dạng gọn cho serving.
+#
+# LogisticRegression / SGDClassifier / LinearSVC / MultinomialNB (binary) đều có dạng
+# score = X @ w + b, predict = classes_[score > 0]. Thay vì pickle sklearn (float64, dense
+# trên toàn bộ vocabulary), lưu:
+#   - base: trọng số chung cho mọi feature (MultinomialNB: feature chưa gặp ở cả hai lớp)
+#   - indices / weights: các feature có |w - base| > tol, weights ở float32 hoặc int8 * scale
+# File .npz không cần pickle và không phụ thuộc sklearn khi load.
+#
+# Module chỉ dùng numpy để training scripts import được mà không cần Flask.
+import numpy as np
+
+COMPACT_SUFFIX = '_compact.npz'
+COMPACT_DTYPES = ('float32', 'int8')
+
+
+class CompactLinearModel:
+    def __init__(self, classes, indices, weights, scale, base, intercept, n_features, has_proba, source=''):
+        self.classes_ = np.asarray(classes)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights)
+        self.scale = float(scale)
+        self.base = float(base)
+        self.intercept = float(intercept)
+        self.n_features_in_ = int(n_features)
+        self.has_proba = bool(has_proba)
+        self.source = source
+        # weights đã nhân scale, tính một lần khi load
+        self._w = self.weights.astype(np.float32) * np.float32(self.scale)
+
+    # -----------------------------
+    # Convert từ estimator sklearn
+    # -----------------------------
+    @classmethod
+    def from_estimator(cls, model, dtype='float32', tol=0.0):
+        if dtype not in COMPACT_DTYPES:
+            raise ValueError(f"dtype phải là một trong {COMPACT_DTYPES}, nhận {dtype!r}")
+        classes = np.asarray(model.classes_)
+        if len(classes) != 2:
+            raise ValueError("Chỉ hỗ trợ model binary")
+        kind = type(model).__name__
+
+        if kind == 'MultinomialNB':
+            flp = np.asarray(model.feature_log_prob_, dtype=np.float64)
+            w = flp[1] - flp[0]
+            intercept = float(model.class_log_prior_[1] - model.class_log_prior_[0])
+            has_proba = True
+        elif hasattr(model, 'coef_') and hasattr(model, 'intercept_'):
+            w = np.asarray(model.coef_, dtype=np.float64).ravel()
+            intercept = float(np.ravel(model.intercept_)[0])
+            has_proba = kind == 'LogisticRegression' or getattr(model, 'loss', None) in ('log_loss', 'log')
+        else:
+            raise ValueError(f"Không hỗ trợ model {kind}")
+
+        # base = giá trị chiếm đa số (NB: mọi feature chưa gặp có cùng trọng số), nếu không thì 0
+        values, counts = np.unique(w, return_counts=True)
+        base = float(values[counts.argmax()]) if counts.max() * 2 > len(w) else 0.0
+        delta = w - base
+        indices = np.flatnonzero(np.abs(delta) > tol).astype(np.int32)
+        delta = delta[indices]
+
+        if dtype == 'int8':
+            max_abs = float(np.abs(delta).max()) if len(delta) else 0.0
+            scale = max_abs / 127.0 if max_abs > 0 else 1.0
+            weights = np.clip(np.rint(delta / scale), -127, 127).astype(np.int8)
+        else:
+            scale = 1.0
+            weights = delta.astype(np.float32)
+        return cls(classes, indices, weights, scale, base, intercept, len(w), has_proba, source=kind)
+
+    # -----------------------------
+    # Lưu / load
+    # -----------------------------
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, classes=self.classes_, indices=self.indices, weights=self.weights,
+                     scale=self.scale, base=self.base, intercept=self.intercept,
+                     n_features=self.n_features_in_, has_proba=self.has_proba, source=self.source)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['classes'], data['indices'], data['weights'], data['scale'], data['base'],
+                       data['intercept'], data['n_features'], data['has_proba'], str(data['source']))
+
+    # -----------------------------
+    # Scoring
+    # -----------------------------
+    def decision_function(self, X):
+        if hasattr(X, 'tocsr'):
+            X = X.tocsr()
+            n_rows = X.shape[0]
+            cols = X.indices
+            pos = np.minimum(np.searchsorted(self.indices, cols), max(len(self.indices) - 1, 0))
+            hit = self.indices[pos] == cols if len(self.indices) else np.zeros(len(cols), dtype=bool)
+            contrib = X.data * np.where(hit, self._w[pos] if len(self._w) else 0.0, 0.0)
+            row_ids = np.repeat(np.arange(n_rows), np.diff(X.indptr))
+            scores = np.bincount(row_ids, weights=contrib, minlength=n_rows)
+            if self.base:
+                scores = scores + self.base * np.asarray(X.sum(axis=1)).ravel()
+        else:
+            X = np.asarray(X)
+            if X.ndim == 1:
+                X = X.reshape(1, -1)
+            scores = X[:, self.indices] @ self._w
+            if self.base:
+                scores = scores + self.base * X.sum(axis=1)
+        return scores + self.intercept
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+    def predict_proba(self, X):
+        if not self.has_proba:
+            raise AttributeError(f"{self.source} không có predict_proba")
+        p1 = 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1.0 - p1, p1])
@@ -0,0 +1,299 @@
+# WAF/WAF_Denylist.py
+# Denylist dùng chung cho cả cluster: node nào phát hiện tấn công thì ghi IP vào BlockStore chung,
+# mọi node giữ bản sao trong bộ nhớ và kéo phần thay đổi (delta) định kỳ từ store.
+# Tra cứu trong luồng request chỉ đọc dict trong bộ nhớ, không bao giờ chạm tới store / network.
+import ipaddress
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+from WAF.WAF_Metrics import Counters
+
+DEFAULT_TTL_S = 3600
+DEFAULT_SYNC_S = 2.0
+DEFAULT_CLIENT_IP_HEADER = 'X-Forwarded-For'
+# Bản ghi hết hạn lâu hơn khoảng này bị xóa khỏi store
+PURGE_GRACE_S = 3600
+PULL_BATCH = 1000
+
+
+class BlockEntry(namedtuple('BlockEntry', ['ip', 'attack', 'expires_at', 'node', 'seq'])):
+    """Một IP bị chặn đến expires_at (epoch giây); seq tăng dần theo thứ tự ghi vào store."""
+    __slots__ = ()
+
+
+class BlockStore(ABC):
+    """
+    Backend lưu denylist dùng chung. Mỗi lần add / remove sinh một bản ghi có seq lớn hơn mọi bản ghi trước,
+    để các node chỉ cần kéo changes_since(cursor). Gỡ chặn = bản ghi với expires_at <= hiện tại.
+    """
+
+    @abstractmethod
+    def add(self, ip, attack, expires_at, node):
+        """Ghi (hoặc gia hạn) một IP. Trả về BlockEntry đã ghi."""
+
+    @abstractmethod
+    def changes_since(self, cursor, limit=PULL_BATCH):
+        """Các BlockEntry có seq > cursor theo thứ tự seq (tối đa limit)."""
+
+    def remove(self, ip, node=None):
+        """Gỡ chặn: bản ghi không có attack, đã hết hạn."""
+        return self.add(ip, None, 0.0, node)
+
+    def purge(self, before):
+        """Xóa các bản ghi hết hạn trước thời điểm before (tùy backend)."""
+
+    def close(self):
+        pass
+
+
+class SQLiteBlockStore(BlockStore):
+    """
+    BlockStore trên một file SQLite (WAL) dùng chung giữa các process trên một host hoặc qua thư mục chia sẻ.
+    Thay bằng backend key-value (Redis...) bằng cách cài đặt BlockStore với cùng ngữ nghĩa seq.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS blocks ('
+            ' ip TEXT PRIMARY KEY, attack TEXT, expires_at REAL NOT NULL, node TEXT, seq INTEGER NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS blocks_seq ON blocks (seq)')
+        # seq phải tăng mãi kể cả khi purge xóa các dòng có seq lớn nhất (nếu không node khác bỏ qua block mới)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL)')
+        self._conn.execute('INSERT OR IGNORE INTO meta (id, seq) SELECT 0, COALESCE(MAX(seq), 0) FROM blocks')
+
+    def add(self, ip, attack, expires_at, node):
+        with self._lock:
+            # BEGIN IMMEDIATE: lấy khóa ghi trước khi tăng meta.seq để seq không trùng giữa các process
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute('UPDATE meta SET seq = seq + 1 WHERE id = 0')
+                (seq,) = self._conn.execute('SELECT seq FROM meta WHERE id = 0').fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO blocks (ip, attack, expires_at, node, seq) VALUES (?, ?, ?, ?, ?)',
+                    (ip, attack, expires_at, node, seq))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return BlockEntry(ip, attack, expires_at, node, seq)
+
+    def changes_since(self, cursor, limit=PULL_BATCH):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT ip, attack, expires_at, node, seq FROM blocks WHERE seq > ? ORDER BY seq LIMIT ?',
+                (cursor, limit)).fetchall()
+        return [BlockEntry(*row) for row in rows]
+
+    def purge(self, before):
+        with self._lock:
+            self._conn.execute('DELETE FROM blocks WHERE expires_at < ?', (before,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_block_store(spec):
+    """
+    Tạo BlockStore từ chuỗi cấu hình: 'sqlite:///duong/dan.db' hoặc đường dẫn file .db.
+    """
+    if isinstance(spec, BlockStore):
+        return spec
+    if spec.startswith('sqlite://'):
+        return SQLiteBlockStore(spec[len('sqlite://'):])
+    if '://' in spec:
+        raise ValueError(f"Unsupported block store: {spec!r}")
+    return SQLiteBlockStore(spec)
+
+
+def default_node_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TrustedProxies:
+    """
+    Load balancer / reverse proxy đứng trước app (IP hoặc CIDR). Sau proxy, remote_addr là IP của proxy:
+    IP client thật lấy từ header (mặc định X-Forwarded-For), đọc từ phải sang trái, bỏ qua các hop là proxy
+    tin cậy. Header chỉ được tin khi request đến từ một proxy tin cậy (client không tự giả mạo được).
+    """
+
+    def __init__(self, proxies=(), header=DEFAULT_CLIENT_IP_HEADER):
+        self.networks = tuple(ipaddress.ip_network(p, strict=False) for p in proxies)
+        self.header = header
+
+    def __contains__(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+    def client_ip(self, remote_addr, header_value=None):
+        if not self.networks or remote_addr not in self or not header_value:
+            return remote_addr
+        for hop in reversed([h.strip() for h in header_value.split(',')]):
+            if hop and hop not in self:
+                return hop
+        return remote_addr
+
+
+class Denylist:
+    """
+    Bản sao trong bộ nhớ của BlockStore:
+      - is_blocked(ip): tra dict, không khóa, không I/O
+      - block(ip, attack): chặn ngay trên node này, ghi vào store ở thread nền
+      - thread nền mỗi sync_s giây (hoặc ngay khi có block mới): ghi các block đang chờ, kéo delta từ store
+    """
+
+    def __init__(self, store, ttl_s=DEFAULT_TTL_S, sync_s=DEFAULT_SYNC_S, node_id=None, whitelist=(),
+                 proxies=None):
+        self.store = store
+        self.ttl_s = ttl_s
+        self.sync_s = sync_s
+        self.node_id = node_id or default_node_id()
+        self.whitelist = frozenset(whitelist)
+        # chặn IP của proxy tin cậy = chặn mọi client đi qua nó
+        self.proxies = proxies or TrustedProxies()
+        self.counters = Counters('checks', 'hits', 'blocked', 'published', 'pulls', 'pulled', 'errors')
+        self._entries = {}   # ip -> (expires_at, attack)
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._cursor = 0
+        self._last_sync = None
+        self._last_purge = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        try:
+            self._pull()
+        except Exception as e:
+            self.counters.incr('errors')
+            print(f"[WAF] Denylist initial sync failed: {e}")
+        self._thread = threading.Thread(target=self._run, name='waf-denylist', daemon=True)
+        self._thread.start()
+
+    # -----------------------------
+    # Luồng request
+    # -----------------------------
+    def is_blocked(self, ip):
+        self.counters.incr('checks')
+        entry = self._entries.get(ip)
+        if entry is None or entry[0] <= time.time():
+            return False
+        self.counters.incr('hits')
+        return True
+
+    def block(self, ip, attack, ttl_s=None):
+        """Chặn ip trên toàn cluster. Trả về False nếu ip nằm trong whitelist hoặc là proxy tin cậy."""
+        if not ip or ip in self.whitelist or ip in self.proxies:
+            return False
+        expires_at = time.time() + (self.ttl_s if ttl_s is None else ttl_s)
+        current = self._entries.get(ip)
+        if current is not None and current[0] >= expires_at:
+            return True
+        self._entries[ip] = (expires_at, attack)
+        with self._pending_lock:
+            self._pending.append((ip, attack, expires_at))
+        self.counters.incr('blocked')
+        self._wake.set()
+        return True
+
+    def unblock(self, ip):
+        """Gỡ chặn ip trên toàn cluster."""
+        self._entries.pop(ip, None)
+        with self._pending_lock:
+            self._pending.append((ip, None, 0.0))
+        self._wake.set()
+
+    # -----------------------------
+    # Đồng bộ
+    # -----------------------------
+    def _publish(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for i, (ip, attack, expires_at) in enumerate(pending):
+            try:
+                self.store.add(ip, attack, expires_at, self.node_id)
+            except Exception:
+                # giữ lại phần chưa ghi để thử lại ở lần sync sau
+                with self._pending_lock:
+                    self._pending[:0] = pending[i:]
+                raise
+            self.counters.incr('published')
+
+    def _pull(self):
+        while True:
+            changes = self.store.changes_since(self._cursor, PULL_BATCH)
+            now = time.time()
+            for entry in changes:
+                if entry.attack is None and entry.expires_at <= now:
+                    # gỡ chặn từ node khác
+                    self._entries.pop(entry.ip, None)
+                elif entry.expires_at > now:
+                    current = self._entries.get(entry.ip)
+                    if current is None or current[0] < entry.expires_at:
+                        self._entries[entry.ip] = (entry.expires_at, entry.attack)
+                self._cursor = max(self._cursor, entry.seq)
+            self.counters.incr('pulls')
+            self.counters.incr('pulled', len(changes))
+            if len(changes) < PULL_BATCH:
+                break
+        self._last_sync = time.time()
+
+    def _purge(self):
+        now = time.time()
+        for ip, (expires_at, _) in list(self._entries.items()):
+            if expires_at <= now:
+                self._entries.pop(ip, None)
+        if now - self._last_purge >= PURGE_GRACE_S:
+            self._last_purge = now
+            self.store.purge(now - PURGE_GRACE_S)
+
+    def sync(self):
+        self._publish()
+        self._pull()
+        self._purge()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.sync_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.sync()
+            except Exception as e:
+                self.counters.incr('errors')
+                print(f"[WAF] Denylist sync failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        try:
+            self._publish()
+        except Exception as e:
+            print(f"[WAF] Denylist final publish failed: {e}")
+        self.store.close()
+
+    def stats(self):
+        data = self.counters.snapshot()
+        now = time.time()
+        data['entries'] = sum(1 for expires_at, _ in list(self._entries.values()) if expires_at > now)
+        data['cursor'] = self._cursor
+        data['node_id'] = self.node_id
+        data['seconds_since_sync'] = None if self._last_sync is None else round(now - self._last_sync, 3)
+        with self._pending_lock:
+            data['pending'] = len(self._pending)
+        return data
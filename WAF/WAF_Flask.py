@@ -1,11 +1,24 @@
 # WAF/WAF_Flask.py
-from flask import request, jsonify
-from WAF import SQLInjectionWAF_AI
+from flask import current_app, request, jsonify
+from WAF import SQLInjectionWAF_AI, block_ip, is_admin, load_model, whitelisted_ips
+from WAF.WAF_Shadow import ShadowDetector, ShadowEvaluator
+from WAF.WAF_Canonical import extract_payload_items, body_exceeds, canonical_stats
+from WAF.WAF_Policy import load_policy, POLICY_COUNTERS
+from WAF.WAF_Batching import BatchingEngine, BatchTimeout
+from WAF.WAF_Sidecar import SidecarClient, SidecarError
+from WAF.WAF_Cascade import CascadeModel, read_cascade_config
+from WAF.WAF_Profiler import SamplingProfiler, install_signal_toggle
+from WAF.WAF_Denylist import Denylist, TrustedProxies, DEFAULT_CLIENT_IP_HEADER, open_block_store
+from WAF.WAF_Signatures import SignatureIndex, SIGNATURES_FILE, requires_confirmation
+from WAF.WAF_Metrics import Counters
+from WAF.WAF_Parallel import ParallelInspector
+from WAF.WAF_Overload import (InspectionBudget, OverloadController, DEGRADATION_COUNTERS, BUDGET_POLICIES,
+                              POLICY_FAIL_CLOSED, POLICY_FALLBACK)
+import hmac
 import os
-from urllib.parse import unquote
+import threading
 import numpy as np
 import glob
-import json
 
 # --- Cập nhật đường dẫn tuyệt đối tới thư mục saved_models ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +28,8 @@ base_model_dir = os.path.abspath(base_model_dir)
 
 # Danh sách attacks mà middleware sẽ load (tên phải tương ứng với folder trong saved_models)
 ATTACK_NAMES = ['SQLInjection', 'XSS']
+# File model chính do SQL.py / XSS.py xuất ra (cùng tên với ATTACK_FILES của Model_Export.py)
+MODEL_FILES = {'SQLInjection': 'sqli.pkl', 'XSS': 'xss.pkl'}
 
 def find_vectorizer_file(attack_dir):
     """
@@ -40,6 +55,10 @@ def find_model_file(attack_dir):
     Tìm file model phù hợp trong attack_dir.
     Cố gắng chọn file rõ ràng (ví dụ sqli.pkl, *_xss.pkl), nếu không thì trả file .pkl đầu tiên không phải vectorizer.
     """
+    # file model chính được xuất cùng vectorizer (MODEL_FILES) luôn được ưu tiên
+    exported = MODEL_FILES.get(os.path.basename(attack_dir))
+    if exported and os.path.exists(os.path.join(attack_dir, exported)):
+        return os.path.join(attack_dir, exported)
     # ưu tiên các file có tên attack (case-insensitive)
     attack_name_lower = os.path.basename(attack_dir).lower()
     for p in glob.glob(os.path.join(attack_dir, '*.pkl')):
@@ -57,6 +76,39 @@ def find_model_file(attack_dir):
         return p
     return None
 
+def vocabulary_mismatch(model, vectorizer):
+    """
+    Mô tả lỗi nếu model được train trên vocabulary khác vectorizer (ví dụ vectorizer đã prune top-K
+    cạnh model full vocabulary), None nếu khớp hoặc không kiểm tra được.
+    """
+    n_features = getattr(model, 'n_features_in_', None)
+    vocabulary = getattr(vectorizer, 'vocabulary_', None)
+    if n_features is not None and vocabulary is not None and n_features != len(vocabulary):
+        return f"{n_features} features != vectorizer {len(vocabulary)}"
+    return None
+
+def attach_cascade(attack, attack_dir, detector, config):
+    """
+    Thay model của detector bằng CascadeModel(model rẻ, model mạnh) theo cascade.json.
+    detector đã load model mạnh (config['strong']). Lỗi -> giữ nguyên model mạnh.
+    """
+    if detector.model is None:
+        return
+    cheap_file = os.path.join(attack_dir, config['cheap'])
+    try:
+        cheap = load_model(cheap_file)
+        mismatch = vocabulary_mismatch(cheap, detector.vectorizer)
+        if mismatch:
+            raise ValueError(f"{config['cheap']}: {mismatch}")
+        # CompactLinearModel luôn có predict_proba, has_proba=False (SVM, hinge...) thì nó raise lúc predict
+        if not getattr(cheap, 'has_proba', True) or not hasattr(cheap, 'predict_proba'):
+            raise ValueError(f"{config['cheap']} has no predict_proba")
+        detector.model = CascadeModel(cheap, detector.model, config['low'], config['high'], name=attack)
+        print(f"[WAF] Cascade {attack}: cheap={cheap_file} band=({config['low']:.4f}, {config['high']:.4f}) "
+              f"expected escalation={config.get('escalation_rate', float('nan')):.3f}")
+    except Exception as e:
+        print(f"[WAF] Error loading cascade for {attack}: {e}. Using strong model only.")
+
 def load_detectors():
     """
     Load detector instances for all ATTACK_NAMES.
@@ -73,6 +125,15 @@ def load_detectors():
         model_file = find_model_file(attack_dir)
         vectorizer_file = find_vectorizer_file(attack_dir)
 
+        # cascade.json (Cascade_Calibration.py) chọn model mạnh + model rẻ cho attack này
+        try:
+            cascade = read_cascade_config(attack_dir)
+        except Exception as e:
+            print(f"[WAF] Invalid cascade config for {attack}: {e}")
+            cascade = None
+        if cascade is not None:
+            model_file = os.path.join(attack_dir, cascade['strong'])
+
         # if not found a model file but there's a common-named model in parent (e.g., sqli.pkl)
         if model_file is None:
             # try searching parent saved_models dir for files that mention attack
@@ -96,88 +157,175 @@ def load_detectors():
         print(f"[WAF] Loading {attack}: model={model_file}, vectorizer={vectorizer_file}")
         try:
             detector = SQLInjectionWAF_AI(model_file, vectorizer_file)
+            # model và vectorizer lệch nhau thì mọi predict đều lỗi và request lọt qua: không load
+            mismatch = vocabulary_mismatch(detector.model, detector.vectorizer)
+            if mismatch:
+                print(f"[WAF] Refusing to load {attack}: {os.path.basename(model_file)} {mismatch}")
+                detectors[attack] = None
+                continue
+            if cascade is not None:
+                attach_cascade(attack, attack_dir, detector, cascade)
             detectors[attack] = detector
         except Exception as e:
             print(f"[WAF] Error loading detector for {attack}: {e}")
             detectors[attack] = None
     return detectors
 
+# Khi đặt biến môi trường này, worker gửi payload tới sidecar (WAF/WAF_Sidecar.py)
+# và không load model trong process (fallback / shadow cũng không được load)
+SIDECAR_SOCKET_ENV = 'WAF_SIDECAR_SOCKET'
+SIDECAR_FALLBACKS = ('fail-open', 'fail-closed', 'local')
+
 # load detectors on import
-_DETECTORS = load_detectors()
+_DETECTORS = {} if os.environ.get(SIDECAR_SOCKET_ENV) else load_detectors()
+_LOCAL_LOAD_LOCK = threading.Lock()
+
+def ensure_local_detectors():
+    """Load detector trong process (lần đầu sidecar lỗi với WAF_SIDECAR_FALLBACK='local')."""
+    if _DETECTORS:
+        return
+    with _LOCAL_LOAD_LOCK:
+        if not _DETECTORS:
+            print("[WAF] Sidecar unavailable; loading detectors in-process.")
+            _DETECTORS.update(load_detectors())
+            if _BATCHER is not None:
+                # BatchingEngine được tạo lúc _DETECTORS còn rỗng (worker chạy với sidecar)
+                _BATCHER.detectors = {name: d for name, d in _DETECTORS.items() if d is not None}
+
+# Thư mục con chứa model ứng viên (shadow) của mỗi attack, ví dụ saved_models/XSS/shadow/xss.pkl
+SHADOW_DIR_NAME = 'shadow'
+SHADOW_QUEUE_SIZE = 1000
 
-def extract_payloads_from_request(req):
+def load_shadow_detectors():
     """
-    Lấy tất cả payloads khả dĩ từ request để kiểm tra:
-      - path segments (cuối path)
-      - tất cả giá trị trong query string (request.args)
-      - tất cả giá trị trong form (request.form)
-      - JSON body (nếu có)
-      - raw body (request.get_data())
-    Trả về list các chuỗi (decoded).
+    Load các model ứng viên trong saved_models/<attack>/shadow/.
+    Vectorizer lấy trong thư mục shadow nếu có, nếu không dùng vectorizer của detector live.
+    Trả về dict attack_name -> list[ShadowDetector].
     """
-    payloads = []
+    shadows = {}
+    for attack in ATTACK_NAMES:
+        shadow_dir = os.path.join(base_model_dir, attack, SHADOW_DIR_NAME)
+        if not os.path.isdir(shadow_dir):
+            continue
+        live = _DETECTORS.get(attack)
+        vectorizer_file = find_vectorizer_file(shadow_dir)
+        for model_file in sorted(glob.glob(os.path.join(shadow_dir, '*.pkl'))):
+            if 'vectorizer' in os.path.basename(model_file).lower():
+                continue
+            print(f"[WAF] Loading shadow {attack}: model={model_file}, vectorizer={vectorizer_file}")
+            try:
+                candidate = SQLInjectionWAF_AI(model_file, vectorizer_file)
+            except Exception as e:
+                print(f"[WAF] Error loading shadow detector for {attack}: {e}")
+                continue
+            vectorizer = candidate.vectorizer or (live.vectorizer if live is not None else None)
+            if candidate.model is None or vectorizer is None:
+                print(f"[WAF] Shadow model {model_file} has no usable model/vectorizer. Skipping.")
+                continue
+            mismatch = vocabulary_mismatch(candidate.model, vectorizer)
+            if mismatch:
+                print(f"[WAF] Skipping shadow {attack}: {os.path.basename(model_file)} {mismatch}")
+                continue
+            shadows.setdefault(attack, []).append(
+                ShadowDetector(attack, os.path.basename(model_file), candidate.model, vectorizer))
+    return shadows
 
-    try:
-        # path last segment
-        path = req.path or ''
-        try:
-            decoded_path = unquote(path)
-        except:
-            decoded_path = path
-        last_segment = decoded_path.split('/')[-1]
-        if last_segment:
-            payloads.append(last_segment)
-
-        # query params
-        for k, v in req.args.items():
-            if v:
-                payloads.append(unquote(v))
-
-        # form data
-        for k, v in req.form.items():
-            if v:
-                payloads.append(unquote(v))
-
-        # json body
-        try:
-            json_body = req.get_json(silent=True)
-            if isinstance(json_body, dict):
-                for k, v in json_body.items():
-                    if isinstance(v, str) and v.strip():
-                        payloads.append(v)
-                    else:
-                        # if value is list/dict -> stringify
-                        payloads.append(json.dumps(v, ensure_ascii=False))
-            elif isinstance(json_body, list):
-                payloads.append(json.dumps(json_body, ensure_ascii=False))
-        except Exception:
-            pass
-
-        # raw body
-        try:
-            raw = req.get_data(as_text=True)
-            if raw and raw.strip():
-                payloads.append(unquote(raw))
-        except Exception:
-            pass
+# Model rẻ dùng khi hết thời gian kiểm tra hoặc khi quá tải (thứ tự ưu tiên)
+FALLBACK_MODEL_NAMES = ['LogisticRegression', 'NaiveBayes']
 
-    except Exception as e:
-        print(f"[WAF] Error extracting payloads: {e}")
+def find_fallback_model_file(attack_dir):
+    """
+    Tìm model rẻ trong attack_dir theo FALLBACK_MODEL_NAMES (ví dụ LogisticRegression.pkl, NaiveBayes_xss.pkl).
+    Trả về đường dẫn hoặc None.
+    """
+    files = sorted(glob.glob(os.path.join(attack_dir, '*.pkl')))
+    for name in FALLBACK_MODEL_NAMES:
+        for p in files:
+            if os.path.basename(p).lower().startswith(name.lower()):
+                return p
+    return None
 
-    # deduplicate and filter empty
-    cleaned = []
-    seen = set()
-    for p in payloads:
-        if not p:
+def load_fallback_detectors():
+    """
+    Load detector rẻ cho mỗi attack, dùng chung vectorizer với detector chính.
+    Trả về dict attack_name -> detector (chỉ các attack có model rẻ khác model chính).
+    """
+    fallbacks = {}
+    for attack, live in _DETECTORS.items():
+        if live is None or live.vectorizer is None:
             continue
-        s = p.strip()
-        if not s:
+        model_file = find_fallback_model_file(os.path.join(base_model_dir, attack))
+        if model_file is None or os.path.abspath(model_file) == os.path.abspath(live.model_path):
             continue
-        if s in seen:
+        print(f"[WAF] Loading fallback {attack}: model={model_file}")
+        try:
+            fallback = SQLInjectionWAF_AI(model_file, live.vectorizer_path, vectorizer=live.vectorizer)
+        except Exception as e:
+            print(f"[WAF] Error loading fallback detector for {attack}: {e}")
+            continue
+        if fallback.model is None:
             continue
-        seen.add(s)
-        cleaned.append(s)
-    return cleaned
+        # model train trên vocabulary khác (ví dụ vectorizer đã prune top-K) không dùng chung được
+        mismatch = vocabulary_mismatch(fallback.model, live.vectorizer)
+        if mismatch:
+            print(f"[WAF] Skipping fallback {attack}: {mismatch}")
+            continue
+        fallbacks[attack] = fallback
+    return fallbacks
+
+_FALLBACK_DETECTORS = load_fallback_detectors()
+
+# sidecar: worker không giữ model nào; verdict shadow chỉ có trên đường kiểm tra local
+_SHADOW_DETECTORS = {} if os.environ.get(SIDECAR_SOCKET_ENV) else load_shadow_detectors()
+_SHADOW = ShadowEvaluator(
+    _SHADOW_DETECTORS,
+    max_queue=SHADOW_QUEUE_SIZE,
+    log_path=os.path.join(base_model_dir, 'shadow_disagreements.jsonl'),
+) if _SHADOW_DETECTORS else None
+
+# Index chữ ký payload tấn công đã biết (TrainingModels/BinaryClassification/Signature_Index.py)
+SIGNATURES_PATH = os.path.join(base_model_dir, SIGNATURES_FILE)
+SIGNATURE_COUNTERS = Counters('lookups', 'bloom_hits', 'bloom_false_positives', 'matches', 'confirmed', 'unconfirmed')
+
+def load_signatures(path=SIGNATURES_PATH):
+    """Load SignatureIndex nếu có file, None nếu không có hoặc lỗi."""
+    if not os.path.exists(path):
+        return None
+    try:
+        index = SignatureIndex.load(path)
+    except Exception as e:
+        print(f"[WAF] Error loading signature index {path}: {e}")
+        return None
+    print(f"[WAF] Loaded {len(index)} signatures ({', '.join(index.attacks)}), "
+          f"bloom fpr={index.expected_fpr()['bloom']:.5f}")
+    return index
+
+_SIGNATURES = load_signatures()
+
+def shadow_stats():
+    """Thống kê shadow evaluation (None nếu không có model ứng viên nào)."""
+    if _SHADOW is None:
+        return None
+    return _SHADOW.stats()
+
+def extract_payloads_from_request(req, policy=None):
+    """
+    Lấy tất cả payloads khả dĩ từ request để kiểm tra (xem WAF_Canonical.iter_request_parts):
+      - đoạn cuối của path
+      - tất cả giá trị trong query string (request.args)
+      - tất cả giá trị trong form (request.form) hoặc các chuỗi trong JSON body
+      - raw body (request.get_data()) chỉ khi body không phải form / JSON
+    Mỗi phần chỉ được decode một lần (Werkzeug đã decode URL), sau đó canonicalize có giới hạn.
+    policy (RoutePolicy): chỉ lấy các phần policy.parts, giới hạn body theo policy.max_body_bytes.
+    Trả về list các chuỗi (canonical, không trùng).
+    """
+    parts = policy.parts if policy is not None else None
+    max_body_bytes = policy.max_body_bytes if policy is not None else None
+    try:
+        return [item.text for item in extract_payload_items(req, parts=parts, max_body_bytes=max_body_bytes)]
+    except Exception as e:
+        print(f"[WAF] Error extracting payloads: {e}")
+        return []
 
 def preprocess_single_payload(payload, vectorizer):
     """
@@ -197,42 +345,168 @@ def preprocess_single_payload(payload, vectorizer):
         print(f"[WAF] Error vectorizing payload: {e}")
         return None
 
-def rusicadeWAF_AI(app):
+# Log từng prediction của detector; tắt khi đo hiệu năng (WAF_Parallel benchmark)
+LOG_PREDICTIONS = True
+
+def inspect_with_detector(attack_name, detector, payloads, budget=None, cancel=None):
     """
-    Register before_request handler to monitor incoming requests for multiple attack detectors.
+    Chạy một detector trên danh sách payloads theo thứ tự.
+    Dừng ở payload đầu tiên bị đánh giá là tấn công, hoặc khi budget hết hạn.
+    cancel (threading.Event): dừng sớm khi được set (chạy song song, một detector đứng trước đã phát hiện tấn công).
+    Trả về (is_attack, verdicts, pending):
+      - verdicts: list (payload, prediction) đã được model đánh giá
+      - pending: các payload chưa kịp kiểm tra vì hết thời gian (rỗng nếu kiểm tra xong)
     """
-    @app.before_request
-    def monitor_request():
-        client_ip = request.remote_addr
-        print(f"[WAF] Client IP: {client_ip}")
-        payloads = extract_payloads_from_request(request)
-        if not payloads:
-            # nothing to check
-            return None
+    verdicts = []
+    for i, payload in enumerate(payloads):
+        if cancel is not None and cancel.is_set():
+            return False, verdicts, []
+        if budget is not None and budget.expired():
+            return False, verdicts, payloads[i:]
 
-        # iterate detectors
-        for attack_name, detector in _DETECTORS.items():
-            if detector is None:
-                # not loaded
-                continue
+        preprocessed = preprocess_single_payload(payload, detector.vectorizer)
+        if preprocessed is None:
+            # nothing meaningful for this payload & detector
+            continue
+
+        try:
+            prediction = detector.model.predict(preprocessed) if detector.model is not None else [0]
+            if LOG_PREDICTIONS:
+                print(f"[WAF] Attack={attack_name} payload='{payload}' prediction={prediction}")
+        except Exception as e:
+            print(f"[WAF] Error during prediction for {attack_name}: {e}")
+            continue
+
+        is_attack = hasattr(prediction, '__len__') and prediction[0] == 1
+        verdicts.append((payload, 1 if is_attack else 0))
+        if is_attack:
+            return True, verdicts, []
+    return False, verdicts, []
+
+def inspect_batched(attack_name, detector, payloads, budget=None, cancel=None):
+    """
+    Giống inspect_with_detector nhưng gửi payloads qua BatchingEngine (_BATCHER) để predict
+    chung batch với các request đồng thời. Hết budget khi đang chờ batch -> toàn bộ payloads là pending.
+    """
+    timeout = budget.remaining_seconds() if budget is not None else None
+    try:
+        predictions = _BATCHER.predict(attack_name, payloads, timeout=timeout)
+    except BatchTimeout:
+        return False, [], list(payloads)
+    except Exception as e:
+        print(f"[WAF] Batched prediction failed for {attack_name}: {e}; inspecting inline.")
+        return inspect_with_detector(attack_name, detector, payloads, budget, cancel)
+
+    verdicts = []
+    for payload, prediction in zip(payloads, predictions):
+        if prediction is None:
+            continue
+        is_attack = prediction == 1
+        verdicts.append((payload, 1 if is_attack else 0))
+        if is_attack:
+            if LOG_PREDICTIONS:
+                print(f"[WAF] Attack={attack_name} payload='{payload}' prediction={prediction} (batched)")
+            return True, verdicts, []
+    return False, verdicts, []
 
-            for payload in payloads:
-                preprocessed = preprocess_single_payload(payload, detector.vectorizer)
-                if preprocessed is None:
-                    # nothing meaningful for this payload & detector
-                    continue
-
-                try:
-                    prediction = detector.model.predict(preprocessed) if detector.model is not None else [0]
-                    print(f"[WAF] Attack={attack_name} payload='{payload}' prediction={prediction}")
-                    if hasattr(prediction, '__len__') and prediction[0] == 1:
-                        # call block feature (will check admin inside)
-                        try:
-                            detector.block_ips_feature(client_ip)
-                        except Exception as e:
-                            print(f"[WAF] Error blocking IP: {e}")
-                        # return blocking page
-                        return """
+def run_detector(attack_name, detector, payloads, budget=None, degraded=False, cancel=None):
+    """
+    Kiểm tra payloads bằng một detector: detector rẻ khi quá tải (degraded), qua BatchingEngine nếu bật.
+    Trả về (is_attack, verdicts, pending, cheap).
+    """
+    cheap = degraded and attack_name in _FALLBACK_DETECTORS
+    if cheap:
+        detector = _FALLBACK_DETECTORS[attack_name]
+    if _BATCHER is not None and not cheap:
+        is_attack, verdicts, pending = inspect_batched(attack_name, detector, payloads, budget, cancel)
+    else:
+        is_attack, verdicts, pending = inspect_with_detector(
+            attack_name, detector, payloads, None if cheap else budget, cancel)
+    return is_attack, verdicts, pending, cheap
+
+def inspect_parallel(inspector, active, payloads, budget=None, degraded=False):
+    """
+    Chạy các detector trong active song song (ParallelInspector).
+    Trả về (detected, results): detected là detector đầu tiên theo thứ tự active phát hiện tấn công (hoặc None),
+    results[i] là kết quả run_detector của active[i], None nếu bị hủy / bỏ qua vì detector trước đã phát hiện.
+    """
+    tasks = [
+        (lambda cancel, name=name, detector=detector:
+            run_detector(name, detector, payloads, budget, degraded, cancel))
+        for name, detector in active
+    ]
+    # detector lỗi không được coi là sạch: mọi payload của nó thành pending (xử lý như hết budget)
+    results = inspector.evaluate(tasks, on_error=lambda index, exc: (False, [], list(payloads), False))
+    for (name, _), result in zip(active, results):
+        if result is not None and result[0]:
+            return name, results
+    return None, results
+
+def inspect_with_sidecar(attack_names, payloads, budget=None):
+    """
+    Gửi payloads tới sidecar cho các attack_names trong một lần gọi.
+    Trả về (detected, ok): detected là attack đầu tiên (theo thứ tự attack_names) có payload bị đánh giá là tấn công;
+    ok=False nếu sidecar timeout / lỗi (caller áp dụng WAF_SIDECAR_FALLBACK).
+    """
+    timeout = budget.remaining_seconds() if budget is not None else None
+    try:
+        results = _SIDECAR.inspect(payloads, attack_names, timeout=timeout)
+    except SidecarError as e:
+        print(f"[WAF] Sidecar inspection failed: {e}")
+        return None, False
+    for attack_name in attack_names:
+        for payload, prediction in zip(payloads, results.get(attack_name, ())):
+            if prediction == 1:
+                print(f"[WAF] Attack={attack_name} payload='{payload}' prediction={prediction} (sidecar)")
+                return attack_name, True
+    return None, True
+
+def match_signatures(payloads, policy=None):
+    """
+    Tra các payload (đã canonicalize) trong index chữ ký.
+    Trả về (attack_name, payload) của payload đầu tiên khớp, hoặc None.
+    Attack bị policy của route tắt thì bỏ qua.
+    """
+    for payload in payloads:
+        SIGNATURE_COUNTERS.incr('lookups')
+        attack, bloom_hit = _SIGNATURES.lookup(payload)
+        if not bloom_hit:
+            continue
+        SIGNATURE_COUNTERS.incr('bloom_hits')
+        if attack is None:
+            SIGNATURE_COUNTERS.incr('bloom_false_positives')
+            continue
+        if policy is not None and attack in ATTACK_NAMES and not policy.allows_detector(attack):
+            continue
+        SIGNATURE_COUNTERS.incr('matches')
+        return attack, payload
+    return None
+
+def confirm_signature(attack_name, payload, budget=None):
+    """
+    Xác nhận payload khớp chữ ký bằng model của attack đó (WAF_SIGNATURE_CONFIRM).
+    Attack không có model (ví dụ Shell) không xác nhận được -> False, request đi tiếp qua kiểm tra thường.
+    """
+    if _SIDECAR is not None and attack_name in ATTACK_NAMES:
+        detected, ok = inspect_with_sidecar([attack_name], [payload], budget)
+        confirmed = ok and detected is not None
+    else:
+        detector = _DETECTORS.get(attack_name)
+        confirmed = detector is not None and inspect_with_detector(attack_name, detector, [payload])[0]
+    SIGNATURE_COUNTERS.incr('confirmed' if confirmed else 'unconfirmed')
+    return confirmed
+
+def signature_stats():
+    """Thống kê index chữ ký (None nếu không có signatures.npz)."""
+    if _SIGNATURES is None:
+        return None
+    data = SIGNATURE_COUNTERS.snapshot()
+    data['signatures'] = len(_SIGNATURES)
+    data['expected_fpr'] = _SIGNATURES.expected_fpr()
+    return data
+
+def blocked_response(attack_name):
+    return """
                         <html>
                             <head><title>Access Denied :Rusicade WAF_AI</title></head>
                             <body>
@@ -242,9 +516,446 @@ def rusicadeWAF_AI(app):
                             </body>
                         </html>
                         """.format(attack=attack_name), 400
-                except Exception as e:
-                    print(f"[WAF] Error during prediction for {attack_name}: {e}")
-                    continue
 
-        # if none matched, allow request
+def degradation_stats():
+    """Bộ đếm các sự kiện degrade (hết budget, fail-open/closed, fallback, overload)."""
+    data = DEGRADATION_COUNTERS.snapshot()
+    if _OVERLOAD is not None:
+        data.update(_OVERLOAD.stats())
+    return data
+
+def policy_stats():
+    """Số request đã resolve / bỏ qua / body quá lớn theo policy, và thống kê cache của matcher."""
+    data = POLICY_COUNTERS.snapshot()
+    if _POLICY is not None:
+        data['cache'] = _POLICY.cache_info()
+    return data
+
+def denied_response():
+    return "Access denied", 403
+
+def denylist_stats():
+    """Thống kê denylist dùng chung (None nếu WAF_DENYLIST_STORE không được cấu hình)."""
+    if _DENYLIST is None:
+        return None
+    return _DENYLIST.stats()
+
+def oversize_response():
+    return "Request body too large", 413
+
+def batching_stats():
+    """Thống kê micro-batching (None nếu WAF_BATCHING tắt)."""
+    if _BATCHER is None:
+        return None
+    return _BATCHER.stats()
+
+def cascade_stats():
+    """Số payload đã đánh giá / chuyển lên model mạnh của mỗi cascade detector."""
+    return {name: d.model.stats() for name, d in _DETECTORS.items()
+            if d is not None and isinstance(d.model, CascadeModel)}
+
+def parallel_stats():
+    """Thống kê chạy detector song song (None nếu WAF_PARALLEL_DETECTORS tắt)."""
+    if _PARALLEL is None:
         return None
+    return _PARALLEL.stats()
+
+def sidecar_stats():
+    """Thống kê client sidecar (None nếu không dùng sidecar)."""
+    if _SIDECAR is None:
+        return None
+    return _SIDECAR.stats()
+
+def profiler_stats():
+    """Trạng thái profiler (None nếu WAF_PROFILER tắt)."""
+    if _PROFILER is None:
+        return None
+    return _PROFILER.stats()
+
+LOCAL_ADDRS = ('127.0.0.1', '::1')
+ADMIN_TOKEN_HEADER = 'X-WAF-Admin-Token'
+
+def admin_request_allowed():
+    """
+    Admin endpoint chỉ nhận request gửi thẳng từ localhost, có header ADMIN_TOKEN_HEADER đúng WAF_ADMIN_TOKEN.
+    Sau reverse proxy trên cùng host mọi client đều có remote_addr 127.0.0.1: request từ proxy tin cậy
+    hoặc có header forward (X-Forwarded-For...) bị từ chối.
+    """
+    token = current_app.config.get('WAF_ADMIN_TOKEN')
+    if not token or request.remote_addr not in LOCAL_ADDRS:
+        return False
+    if _PROXIES is not None and request.remote_addr in _PROXIES:
+        return False
+    header = _PROXIES.header if _PROXIES is not None else DEFAULT_CLIENT_IP_HEADER
+    if request.headers.get(header) or request.headers.get(DEFAULT_CLIENT_IP_HEADER):
+        return False
+    return hmac.compare_digest(request.headers.get(ADMIN_TOKEN_HEADER, '').encode('utf-8'), token.encode('utf-8'))
+
+def profiler_admin():
+    """
+    Admin endpoint của profiler (xem admin_request_allowed):
+      GET                                   -> trạng thái
+      POST action=start [duration=s] [fraction=0..1] -> bắt đầu phiên
+      POST action=stop                      -> kết thúc phiên, ghi file folded stacks
+    """
+    if not admin_request_allowed():
+        return "Forbidden", 403
+    if request.method == 'POST':
+        action = request.values.get('action', '')
+        if action == 'start':
+            try:
+                duration = float(request.values['duration']) if request.values.get('duration') else None
+                fraction = float(request.values.get('fraction', 1.0))
+            except ValueError:
+                return jsonify({'error': 'duration / fraction must be numbers'}), 400
+            if not _PROFILER.enable(duration_s=duration, fraction=fraction):
+                return jsonify({'error': 'profiler already running'}), 409
+        elif action == 'stop':
+            path = _PROFILER.disable()
+            return jsonify({'profile': path, **_PROFILER.stats()})
+        else:
+            return jsonify({'error': "action must be 'start' or 'stop'"}), 400
+    return jsonify(_PROFILER.stats())
+
+def waf_stats():
+    """Bộ đếm của mọi thành phần WAF (None cho thành phần không bật)."""
+    return {
+        'canonical': canonical_stats(),
+        'policy': policy_stats(),
+        'degradation': degradation_stats(),
+        'signatures': signature_stats(),
+        'shadow': shadow_stats(),
+        'cascade': cascade_stats(),
+        'batching': batching_stats(),
+        'parallel': parallel_stats(),
+        'sidecar': sidecar_stats(),
+        'denylist': denylist_stats(),
+        'profiler': profiler_stats(),
+    }
+
+def stats_admin():
+    """
+    Admin endpoint thống kê (xem admin_request_allowed): GET -> waf_stats().
+    ?disagreements=N: thêm N bất đồng gần nhất giữa model live và model shadow.
+    """
+    if not admin_request_allowed():
+        return "Forbidden", 403
+    data = waf_stats()
+    if _SHADOW is not None and request.args.get('disagreements'):
+        try:
+            limit = max(0, int(request.args['disagreements']))
+        except ValueError:
+            return jsonify({'error': 'disagreements must be an integer'}), 400
+        data['shadow_disagreements'] = _SHADOW.recent_disagreements(limit)
+    return jsonify(data)
+
+_OVERLOAD = None
+_POLICY = None
+_BATCHER = None
+_SIDECAR = None
+_PROFILER = None
+_DENYLIST = None
+_PARALLEL = None
+_PROXIES = None
+
+def rusicadeWAF_AI(app):
+    """
+    Register before_request handler to monitor incoming requests for multiple attack detectors.
+
+    Cấu hình qua app.config:
+      - WAF_INSPECTION_BUDGET_MS: thời gian kiểm tra tối đa cho một request (None/0 = không giới hạn)
+      - WAF_BUDGET_POLICY: 'fail-open' | 'fail-closed' | 'fallback' khi vượt budget
+        ('fallback' mà attack không có model rẻ thì fail-closed)
+      - WAF_OVERLOAD_LATENCY_MS, WAF_OVERLOAD_INFLIGHT, WAF_OVERLOAD_RECOVERY_RATIO:
+        ngưỡng để tự chuyển sang detector rẻ khi quá tải và quay lại khi tải giảm
+      - WAF_POLICY_FILE: file JSON chính sách theo route (xem WAF/policy_example.json);
+        None = kiểm tra mọi phần với mọi detector
+      - WAF_BATCHING: gom payload của các request đồng thời thành batch trước khi predict
+      - WAF_BATCH_MAX_SIZE, WAF_BATCH_MAX_WAIT_US: flush khi đủ số payload hoặc hết thời gian chờ
+      - WAF_SIDECAR_SOCKET: Unix socket của sidecar inference (mặc định lấy từ biến môi trường WAF_SIDECAR_SOCKET);
+        None = inference trong process
+      - WAF_SIDECAR_TIMEOUT_MS, WAF_SIDECAR_POOL_SIZE: deadline mỗi lần gọi và số kết nối tối đa
+      - WAF_SIDECAR_FALLBACK: 'fail-open' | 'fail-closed' | 'local' (mặc định) khi sidecar timeout / không kết nối được
+      - WAF_PROFILER: cho phép bật sampling profiler lúc runtime (False = không tạo profiler, không tốn gì)
+      - WAF_PROFILER_ENDPOINT: admin endpoint (chỉ localhost, không qua proxy), None = không đăng ký route
+      - WAF_ADMIN_TOKEN: token bắt buộc (header X-WAF-Admin-Token) cho admin endpoint; None = không đăng ký
+        admin endpoint nào (profiler chỉ bật / tắt được bằng SIGUSR2)
+      - WAF_STATS_ENDPOINT: admin endpoint trả về bộ đếm của mọi thành phần (waf_stats), None = không đăng ký
+      - WAF_PROFILER_SIGNAL: bật / tắt bằng SIGUSR2; WAF_PROFILER_INTERVAL_MS, WAF_PROFILER_DIR: chu kỳ lấy mẫu, thư mục ghi file
+      - WAF_DENYLIST_STORE: block store dùng chung giữa các node ('sqlite:///path.db' hoặc đường dẫn), None = tắt
+      - WAF_DENYLIST_TTL_S, WAF_DENYLIST_SYNC_S: thời gian chặn một IP và chu kỳ kéo thay đổi từ store
+      - WAF_TRUSTED_PROXIES: IP / CIDR của load balancer / reverse proxy; request từ đó lấy IP client
+        từ WAF_CLIENT_IP_HEADER (mặc định X-Forwarded-For). IP của proxy không bao giờ bị chặn
+      - WAF_SIGNATURES: chặn ngay payload khớp index chữ ký (saved_models/signatures.npz) trước khi chạy model
+      - WAF_SIGNATURE_CONFIRM: chỉ chặn khi model của attack đó cũng đánh giá payload là tấn công
+        (payload khớp chữ ký ngắn hơn CONFIRM_SIGNATURE_LENGTH luôn phải được xác nhận)
+      - WAF_PARALLEL_DETECTORS: chạy các detector của một request song song trên thread pool dùng chung
+      - WAF_PARALLEL_WORKERS: số thread của pool (dùng chung cho mọi request)
+    """
+    global _OVERLOAD, _POLICY, _BATCHER, _SIDECAR, _PROFILER, _DENYLIST, _PARALLEL, _PROXIES
+    app.config.setdefault('WAF_INSPECTION_BUDGET_MS', None)
+    app.config.setdefault('WAF_BUDGET_POLICY', POLICY_FALLBACK)
+    app.config.setdefault('WAF_OVERLOAD_LATENCY_MS', 50)
+    app.config.setdefault('WAF_OVERLOAD_INFLIGHT', 16)
+    app.config.setdefault('WAF_OVERLOAD_RECOVERY_RATIO', 0.5)
+    app.config.setdefault('WAF_POLICY_FILE', None)
+    app.config.setdefault('WAF_BATCHING', False)
+    app.config.setdefault('WAF_BATCH_MAX_SIZE', 64)
+    app.config.setdefault('WAF_BATCH_MAX_WAIT_US', 500)
+    app.config.setdefault('WAF_SIDECAR_SOCKET', os.environ.get(SIDECAR_SOCKET_ENV))
+    app.config.setdefault('WAF_SIDECAR_TIMEOUT_MS', 50)
+    app.config.setdefault('WAF_SIDECAR_POOL_SIZE', 8)
+    app.config.setdefault('WAF_SIDECAR_FALLBACK', 'local')
+    app.config.setdefault('WAF_PROFILER', False)
+    app.config.setdefault('WAF_PROFILER_ENDPOINT', '/_waf/profile')
+    app.config.setdefault('WAF_PROFILER_SIGNAL', True)
+    app.config.setdefault('WAF_PROFILER_INTERVAL_MS', 5)
+    app.config.setdefault('WAF_PROFILER_DIR', os.path.join(base_model_dir, 'profiles'))
+    app.config.setdefault('WAF_ADMIN_TOKEN', None)
+    app.config.setdefault('WAF_STATS_ENDPOINT', '/_waf/stats')
+    app.config.setdefault('WAF_DENYLIST_STORE', None)
+    app.config.setdefault('WAF_DENYLIST_TTL_S', 3600)
+    app.config.setdefault('WAF_DENYLIST_SYNC_S', 2.0)
+    app.config.setdefault('WAF_TRUSTED_PROXIES', ())
+    app.config.setdefault('WAF_CLIENT_IP_HEADER', DEFAULT_CLIENT_IP_HEADER)
+    app.config.setdefault('WAF_SIGNATURES', True)
+    app.config.setdefault('WAF_SIGNATURE_CONFIRM', False)
+    app.config.setdefault('WAF_PARALLEL_DETECTORS', False)
+    app.config.setdefault('WAF_PARALLEL_WORKERS', 4)
+
+    if app.config['WAF_BUDGET_POLICY'] not in BUDGET_POLICIES:
+        raise ValueError(f"WAF_BUDGET_POLICY must be one of {BUDGET_POLICIES}, got {app.config['WAF_BUDGET_POLICY']!r}")
+    if app.config['WAF_SIDECAR_FALLBACK'] not in SIDECAR_FALLBACKS:
+        raise ValueError(f"WAF_SIDECAR_FALLBACK must be one of {SIDECAR_FALLBACKS}, got {app.config['WAF_SIDECAR_FALLBACK']!r}")
+
+    overload = OverloadController(
+        latency_threshold_ms=app.config['WAF_OVERLOAD_LATENCY_MS'],
+        inflight_threshold=app.config['WAF_OVERLOAD_INFLIGHT'],
+        recovery_ratio=app.config['WAF_OVERLOAD_RECOVERY_RATIO'],
+    )
+    _OVERLOAD = overload
+    policies = load_policy(app.config['WAF_POLICY_FILE'], known_detectors=ATTACK_NAMES)
+    _POLICY = policies
+    if app.config['WAF_BATCHING'] and _BATCHER is None:
+        _BATCHER = BatchingEngine(
+            {name: d for name, d in _DETECTORS.items() if d is not None},
+            max_batch=app.config['WAF_BATCH_MAX_SIZE'],
+            max_wait_us=app.config['WAF_BATCH_MAX_WAIT_US'],
+        )
+    if app.config['WAF_SIDECAR_SOCKET'] and _SIDECAR is None:
+        _SIDECAR = SidecarClient(
+            app.config['WAF_SIDECAR_SOCKET'],
+            pool_size=app.config['WAF_SIDECAR_POOL_SIZE'],
+            timeout=app.config['WAF_SIDECAR_TIMEOUT_MS'] / 1000.0,
+        )
+        print(f"[WAF] Using inference sidecar at {app.config['WAF_SIDECAR_SOCKET']}")
+    proxies = TrustedProxies(app.config['WAF_TRUSTED_PROXIES'], app.config['WAF_CLIENT_IP_HEADER'])
+    _PROXIES = proxies
+    if app.config['WAF_STATS_ENDPOINT'] and app.config['WAF_ADMIN_TOKEN']:
+        app.add_url_rule(app.config['WAF_STATS_ENDPOINT'], 'waf_stats', stats_admin, methods=['GET'])
+    elif app.config['WAF_STATS_ENDPOINT']:
+        print("[WAF] WAF_ADMIN_TOKEN not set; stats endpoint disabled")
+    if app.config['WAF_PROFILER'] and _PROFILER is None:
+        _PROFILER = SamplingProfiler(
+            interval_ms=app.config['WAF_PROFILER_INTERVAL_MS'],
+            output_dir=app.config['WAF_PROFILER_DIR'],
+        )
+        if app.config['WAF_PROFILER_ENDPOINT'] and not app.config['WAF_ADMIN_TOKEN']:
+            print("[WAF] WAF_ADMIN_TOKEN not set; profiler endpoint disabled (use SIGUSR2)")
+        elif app.config['WAF_PROFILER_ENDPOINT']:
+            app.add_url_rule(app.config['WAF_PROFILER_ENDPOINT'], 'waf_profiler', profiler_admin,
+                             methods=['GET', 'POST'])
+        if app.config['WAF_PROFILER_SIGNAL'] and install_signal_toggle(_PROFILER):
+            print("[WAF] Profiler toggle installed on SIGUSR2")
+    if app.config['WAF_DENYLIST_STORE'] and _DENYLIST is None:
+        _DENYLIST = Denylist(
+            open_block_store(app.config['WAF_DENYLIST_STORE']),
+            ttl_s=app.config['WAF_DENYLIST_TTL_S'],
+            sync_s=app.config['WAF_DENYLIST_SYNC_S'],
+            whitelist=whitelisted_ips(),
+            proxies=proxies,
+        )
+        print(f"[WAF] Shared denylist: {app.config['WAF_DENYLIST_STORE']} (node {_DENYLIST.node_id})")
+    if app.config['WAF_PARALLEL_DETECTORS'] and _PARALLEL is None:
+        _PARALLEL = ParallelInspector(app.config['WAF_PARALLEL_WORKERS'])
+
+    def handle_budget_exceeded(attack_name, pending, remaining_attacks):
+        """
+        Áp dụng WAF_BUDGET_POLICY cho phần chưa kiểm tra.
+        Trả về (attack_name bị phát hiện hoặc None, True nếu chặn do fail-closed chứ không do phát hiện).
+        """
+        policy = app.config['WAF_BUDGET_POLICY']
+        DEGRADATION_COUNTERS.incr('budget_exceeded')
+        print(f"[WAF] Inspection budget exceeded at {attack_name}; policy={policy}")
+
+        if policy == POLICY_FALLBACK:
+            work = [(attack_name, pending)] + [(name, payloads_all) for name, payloads_all in remaining_attacks]
+            if all(name in _FALLBACK_DETECTORS for name, _ in work):
+                DEGRADATION_COUNTERS.incr('fallback')
+                for name, items in work:
+                    is_attack, _, _ = inspect_with_detector(name, _FALLBACK_DETECTORS[name], items)
+                    if is_attack:
+                        return name, False
+                return None, False
+            # không âm thầm bỏ qua phần chưa kiểm tra
+            print("[WAF] No fallback detector available; failing closed.")
+            policy = POLICY_FAIL_CLOSED
+
+        if policy == POLICY_FAIL_CLOSED:
+            DEGRADATION_COUNTERS.incr('fail_closed')
+            return attack_name, True
+
+        DEGRADATION_COUNTERS.incr('fail_open')
+        return None, False
+
+    @app.before_request
+    def monitor_request():
+        profiler = _PROFILER
+        if profiler is None or not profiler.enabled:
+            return inspect_request(None)
+        sampled = profiler.begin()
+        try:
+            return inspect_request(profiler if sampled else None)
+        finally:
+            if sampled:
+                profiler.end()
+
+    def inspect_request(profiler):
+        """Kiểm tra request hiện tại; profiler (nếu request được profile) nhận nhãn phase / detector."""
+        # sau load balancer, remote_addr là IP của LB: lấy IP client qua header của proxy tin cậy
+        client_ip = proxies.client_ip(request.remote_addr, request.headers.get(proxies.header))
+        # IP đã bị chặn ở bất kỳ node nào: từ chối trước khi tốn công kiểm tra
+        if _DENYLIST is not None and _DENYLIST.is_blocked(client_ip):
+            return denied_response()
+        if profiler is not None:
+            profiler.label('policy')
+        policy = policies.resolve(request.method, request.path)
+        POLICY_COUNTERS.incr('resolved')
+        if policy.skip:
+            POLICY_COUNTERS.incr('skipped')
+            return None
+        if body_exceeds(request, policy.max_body_bytes):
+            POLICY_COUNTERS.incr('oversize')
+            if policy.on_oversize == 'block':
+                return oversize_response()
+
+        print(f"[WAF] Client IP: {client_ip}")
+        if profiler is not None:
+            profiler.label('extract')
+        payloads = extract_payloads_from_request(request, policy)
+        if not payloads:
+            # nothing to check
+            return None
+
+        budget = InspectionBudget(app.config['WAF_INSPECTION_BUDGET_MS'])
+        detected = None
+        run_local = True
+        if _SIGNATURES is not None and app.config['WAF_SIGNATURES']:
+            if profiler is not None:
+                profiler.label('signatures')
+            hit = match_signatures(payloads, policy)
+            if hit is not None:
+                attack_name, payload = hit
+                print(f"[WAF] Attack={attack_name} payload='{payload}' matched known signature")
+                # khóa ngắn luôn phải được model xác nhận, tránh chặn + ban IP vì một chuỗi ngắn trùng hợp
+                confirm = app.config['WAF_SIGNATURE_CONFIRM'] or requires_confirmation(payload)
+                if not confirm or confirm_signature(attack_name, payload, budget):
+                    detected = attack_name
+                    run_local = False
+
+        if detected is None and _SIDECAR is not None:
+            names = [name for name in ATTACK_NAMES if policy.allows_detector(name)]
+            if not names:
+                return None
+            if profiler is not None:
+                profiler.label('sidecar')
+            detected, ok = inspect_with_sidecar(names, payloads, budget)
+            if ok:
+                run_local = False
+            else:
+                fallback = app.config['WAF_SIDECAR_FALLBACK']
+                if fallback == 'fail-closed':
+                    DEGRADATION_COUNTERS.incr('fail_closed')
+                    # chặn nhưng không block IP vì chưa có bằng chứng tấn công
+                    return blocked_response(names[0])
+                if fallback == 'fail-open':
+                    DEGRADATION_COUNTERS.incr('fail_open')
+                    return None
+                DEGRADATION_COUNTERS.incr('fallback')
+                ensure_local_detectors()
+
+        if run_local:
+            degraded = overload.enter()
+            try:
+                active = [(name, d) for name, d in _DETECTORS.items() if d is not None and policy.allows_detector(name)]
+                results = None
+                if _PARALLEL is not None and len(active) > 1:
+                    if profiler is not None:
+                        profiler.label('parallel_detectors')
+                    _, results = inspect_parallel(_PARALLEL, active, payloads, budget, degraded)
+                # iterate detectors (kết quả song song được xét theo đúng thứ tự như chạy tuần tự)
+                for index, (attack_name, detector) in enumerate(active):
+                    if results is None:
+                        if profiler is not None:
+                            profiler.label('cheap_detector' if degraded and attack_name in _FALLBACK_DETECTORS
+                                           else 'detector', attack_name)
+                        is_attack, verdicts, pending, cheap = run_detector(
+                            attack_name, detector, payloads, budget, degraded)
+                    elif results[index] is None:
+                        break
+                    else:
+                        is_attack, verdicts, pending, cheap = results[index]
+                    if _SHADOW is not None and not cheap:
+                        # copy verdicts sang shadow worker (không chờ)
+                        _SHADOW.submit(attack_name, verdicts)
+
+                    if is_attack:
+                        detected = attack_name
+                        break
+                    if pending:
+                        if results is None:
+                            remaining = [(name, payloads) for name, _ in active[index + 1:]]
+                        else:
+                            # detector sau đã chạy song song: nếu một detector phát hiện tấn công thì nó thắng,
+                            # nếu không chỉ còn phần payload chúng chưa kịp kiểm tra
+                            later = [(name, r) for (name, _), r in zip(active[index + 1:], results[index + 1:])
+                                     if r is not None]
+                            detected = next((name for name, r in later if r[0]), None)
+                            if detected is not None:
+                                break
+                            remaining = [(name, r[2]) for name, r in later if r[2]]
+                        if profiler is not None:
+                            profiler.label('budget_exceeded', attack_name)
+                        detected, failed_closed = handle_budget_exceeded(attack_name, pending, remaining)
+                        if failed_closed:
+                            # chặn nhưng không block IP vì chưa có bằng chứng tấn công
+                            return blocked_response(detected)
+                        break
+            finally:
+                overload.exit(budget.elapsed_ms())
+
+        if detected is None:
+            # if none matched, allow request
+            return None
+
+        # call block feature (will check admin inside)
+        if profiler is not None:
+            profiler.label('block', detected)
+        if client_ip in proxies:
+            # không xác định được client sau proxy: chặn request nhưng không chặn IP của proxy
+            print(f"[WAF] Not blocking trusted proxy {client_ip}")
+            return blocked_response(detected)
+        try:
+            detector = _DETECTORS.get(detected)
+            if detector is not None:
+                detector.block_ips_feature(client_ip)
+            else:
+                # phát hiện bởi sidecar, worker không có detector trong process
+                block_ip(client_ip, is_admin())
+        except Exception as e:
+            print(f"[WAF] Error blocking IP: {e}")
+        if _DENYLIST is not None:
+            # chia sẻ cho các node khác (ghi ở thread nền)
+            _DENYLIST.block(client_ip, detected)
+        # return blocking page
+        return blocked_response(detected)
@@ -0,0 +1,74 @@
+# WAF/WAF_Metrics.py
+import bisect
+import threading
+
+
+class Counters:
+    """
+    Bộ đếm thread-safe đơn giản (tên -> số nguyên) dùng chung cho các thành phần của WAF.
+    Các thread request và worker nền có thể cùng tăng bộ đếm mà không cần khóa riêng.
+    """
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._values = {name: 0 for name in names}
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + n
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self):
+        """Trả về bản sao dict các giá trị hiện tại."""
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram:
+    """
+    Histogram thread-safe với các bucket cố định (giới hạn trên, tăng dần), kiểu Prometheus.
+    Giá trị lớn hơn bucket cuối được đếm vào bucket '+Inf'.
+    """
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q):
+        """Ước lượng quantile theo giới hạn trên của bucket (None nếu chưa có dữ liệu)."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+        target = q * total
+        seen = 0
+        for bound, c in zip(self.bounds + [float('inf')], counts):
+            seen += c
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            data = {'count': self._count, 'sum': self._sum}
+        labels = [str(b) for b in self.bounds] + ['+Inf']
+        data['buckets'] = dict(zip(labels, counts))
+        data['mean'] = data['sum'] / data['count'] if data['count'] else None
+        data['p50'] = self.quantile(0.5)
+        data['p99'] = self.quantile(0.99)
+        return data
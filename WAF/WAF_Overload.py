@@ -0,0 +1,110 @@
+# WAF/WAF_Overload.py
+import threading
+import time
+
+from WAF.WAF_Metrics import Counters
+
+# Chính sách khi một request vượt quá thời gian kiểm tra cho phép
+POLICY_FAIL_OPEN = 'fail-open'        # cho request đi qua, bỏ phần kiểm tra còn lại
+POLICY_FAIL_CLOSED = 'fail-closed'    # chặn request
+POLICY_FALLBACK = 'fallback'          # kiểm tra phần còn lại bằng detector rẻ hơn
+BUDGET_POLICIES = (POLICY_FAIL_OPEN, POLICY_FAIL_CLOSED, POLICY_FALLBACK)
+
+# Mọi sự kiện degrade đều được đếm ở đây
+DEGRADATION_COUNTERS = Counters(
+    'budget_exceeded', 'fail_open', 'fail_closed', 'fallback',
+    'overload_enter', 'overload_exit', 'overload_requests',
+)
+
+
+class InspectionBudget:
+    """
+    Thời gian kiểm tra tối đa cho một request.
+    Deadline được kiểm tra giữa các lần gọi model (một lần predict đang chạy không bị ngắt).
+    budget_ms=None hoặc <= 0 nghĩa là không giới hạn.
+    """
+
+    def __init__(self, budget_ms):
+        self.start = time.monotonic()
+        if budget_ms is None or budget_ms <= 0:
+            self.deadline = None
+        else:
+            self.deadline = self.start + budget_ms / 1000.0
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def elapsed_ms(self):
+        return (time.monotonic() - self.start) * 1000.0
+
+    def remaining_seconds(self):
+        """Thời gian còn lại (giây), None nếu không giới hạn."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+
+class OverloadController:
+    """
+    Tự động chuyển sang chế độ kiểm tra rẻ (degraded) khi tải cao.
+
+    Theo dõi latency kiểm tra gần đây (EWMA) và số request đang được kiểm tra đồng thời.
+    Vào degraded khi một trong hai vượt ngưỡng; chỉ thoát khi cả hai xuống dưới
+    ngưỡng * recovery_ratio (hysteresis để tránh bật/tắt liên tục).
+    """
+
+    def __init__(self, latency_threshold_ms=50.0, inflight_threshold=16,
+                 recovery_ratio=0.5, smoothing=0.2, counters=DEGRADATION_COUNTERS):
+        self.latency_threshold_ms = latency_threshold_ms
+        self.inflight_threshold = inflight_threshold
+        self.recovery_ratio = recovery_ratio
+        self.smoothing = smoothing
+        self.counters = counters
+        self._lock = threading.Lock()
+        self._latency_ms = 0.0
+        self._inflight = 0
+        self._degraded = False
+
+    def enter(self):
+        """Gọi khi bắt đầu kiểm tra một request. Trả về True nếu request này nên chạy chế độ rẻ."""
+        with self._lock:
+            self._inflight += 1
+            self._update_state()
+            degraded = self._degraded
+        if degraded:
+            self.counters.incr('overload_requests')
+        return degraded
+
+    def exit(self, latency_ms):
+        """Gọi khi kiểm tra xong, với latency kiểm tra của request đó."""
+        with self._lock:
+            self._inflight = max(0, self._inflight - 1)
+            self._latency_ms += self.smoothing * (latency_ms - self._latency_ms)
+            self._update_state()
+
+    def _update_state(self):
+        # giả định đang giữ self._lock
+        over_latency = self._latency_ms > self.latency_threshold_ms
+        over_inflight = self._inflight > self.inflight_threshold
+        if not self._degraded:
+            if over_latency or over_inflight:
+                self._degraded = True
+                self.counters.incr('overload_enter')
+                print(f"[WAF] Overload: switching to cheap inspection "
+                      f"(latency={self._latency_ms:.1f}ms, inflight={self._inflight})")
+        else:
+            recovered_latency = self._latency_ms <= self.latency_threshold_ms * self.recovery_ratio
+            recovered_inflight = self._inflight <= self.inflight_threshold * self.recovery_ratio
+            if recovered_latency and recovered_inflight:
+                self._degraded = False
+                self.counters.incr('overload_exit')
+                print(f"[WAF] Overload recovered: back to full inspection "
+                      f"(latency={self._latency_ms:.1f}ms, inflight={self._inflight})")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'degraded': self._degraded,
+                'latency_ms': round(self._latency_ms, 3),
+                'inflight': self._inflight,
+            }
@@ -0,0 +1,195 @@
+# WAF/WAF_Parallel.py
+# Chạy các detector độc lập của một request song song trên một thread pool dùng chung (có giới hạn).
+# numpy / scipy / sklearn nhả GIL trong phần lớn thời gian vectorize + predict nên các detector chồng lấp được.
+# Kết quả luôn xác định: detector đứng trước (theo thứ tự ATTACK_NAMES) có kết quả tấn công thắng,
+# detector đứng sau bị hủy (chưa chạy) hoặc được báo dừng (đang chạy) và kết quả bị bỏ qua.
+#
+# Benchmark so với chạy tuần tự:  python -m WAF.WAF_Parallel --payloads 1 4 16 64 --workers 1 2 4
+import argparse
+import csv
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+try:
+    from WAF.WAF_Metrics import Counters
+except ImportError:
+    from WAF_Metrics import Counters
+
+
+class ParallelInspector:
+    """
+    Thread pool dùng chung cho mọi request. evaluate(tasks): tasks là list callable theo thứ tự detector,
+    mỗi callable nhận một threading.Event 'cancel' và trả về (is_attack, verdicts, pending, ...).
+    Task đầu tiên chạy ngay trên thread của request (không phải chờ pool), các task sau chạy trên pool.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='waf-detector')
+        self.counters = Counters('requests', 'tasks', 'cancelled', 'ignored', 'errors')
+
+    def evaluate(self, tasks, on_error=None):
+        """
+        Trả về list kết quả theo thứ tự tasks; None cho task bị hủy / bỏ qua vì một task đứng trước đã
+        phát hiện tấn công. Mọi task đứng trước task tấn công đầu tiên luôn có kết quả.
+        on_error(index, exc): kết quả thay cho task bị lỗi (không được coi là sạch); None = hủy các task
+        còn lại và raise lại lỗi.
+        """
+        self.counters.incr('requests')
+        self.counters.incr('tasks', len(tasks))
+        results = [None] * len(tasks)
+        if not tasks:
+            return results
+        cancels = [threading.Event() for _ in tasks]
+        futures = {self._executor.submit(task, cancels[i]): i for i, task in enumerate(tasks[1:], start=1)}
+
+        # vị trí của task tấn công sớm nhất đã biết; các task sau nó không cần nữa
+        first_attack = len(tasks)
+
+        def _cancel_after(index):
+            for future, i in futures.items():
+                if i > index and not cancels[i].is_set():
+                    # chưa chạy: hủy hẳn; đang chạy: detector tự dừng ở payload kế tiếp
+                    cancels[i].set()
+                    future.cancel()
+                    self.counters.incr('cancelled')
+
+        def _failed(index, exc):
+            self.counters.incr('errors')
+            print(f"[WAF] Parallel detector task failed: {exc}")
+            if on_error is None:
+                _cancel_after(-1)
+                raise exc
+            return on_error(index, exc)
+
+        try:
+            results[0] = tasks[0](cancels[0])
+        except Exception as e:
+            results[0] = _failed(0, e)
+        if results[0][0]:
+            first_attack = 0
+            _cancel_after(0)
+
+        pending_futures = {f for f, i in futures.items() if i < first_attack}
+        while pending_futures:
+            done, _ = wait(pending_futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = _failed(i, e)
+                results[i] = result
+                if result[0] and i < first_attack:
+                    first_attack = i
+                    _cancel_after(i)
+            # chỉ còn chờ các task đứng trước task tấn công sớm nhất
+            pending_futures = {f for f in pending_futures - done if futures[f] < first_attack}
+
+        for i in range(first_attack + 1, len(tasks)):
+            if results[i] is not None:
+                self.counters.incr('ignored')
+            results[i] = None
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        data = self.counters.snapshot()
+        data['max_workers'] = self.max_workers
+        return data
+
+
+# =====================================================
+# Benchmark
+# =====================================================
+
+def _load_benchmark_payloads(path, limit):
+    payloads = {0: [], 1: []}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            label = 1 if row.get('is_malicious', '0').strip() == '1' else 0
+            if row.get('payload', '').strip():
+                payloads[label].append(row['payload'].strip())
+    rng = random.Random(42)
+    for label in payloads:
+        rng.shuffle(payloads[label])
+        payloads[label] = payloads[label][:limit]
+    return payloads
+
+
+def _latency_summary(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[min(len(timings) - 1, int(0.99 * len(timings)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark parallel vs sequential detector evaluation')
+    parser.add_argument('--payloads', type=int, nargs='+', default=[1, 4, 16, 64], help='Số payload mỗi request')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=200, help='Số request đo cho mỗi cấu hình')
+    parser.add_argument('--attack-ratio', type=float, default=0.0,
+                        help='Tỉ lệ request chứa một payload tấn công (0 = toàn lành tính, mọi detector chạy hết)')
+    parser.add_argument('--dataset', default=None, help='Mặc định: TrainingModels/data/processed/processed_payloads.csv')
+    parser.add_argument('--log-predictions', action='store_true',
+                        help='In từng prediction như khi chạy thật (làm sai số đo, mặc định tắt)')
+    args = parser.parse_args(argv)
+
+    from WAF import WAF_Flask
+
+    WAF_Flask.LOG_PREDICTIONS = args.log_predictions
+    detectors = WAF_Flask._DETECTORS or WAF_Flask.load_detectors()
+    active = [(name, d) for name, d in detectors.items() if d is not None]
+    if len(active) < 2:
+        print(f"[WAF] Need at least two detectors to compare, found {[n for n, _ in active]}")
+        return
+    dataset = args.dataset or os.path.join(WAF_Flask.current_dir, '..', 'TrainingModels', 'data', 'processed',
+                                           'processed_payloads.csv')
+    pool = _load_benchmark_payloads(dataset, limit=max(args.payloads) * args.requests)
+    rng = random.Random(0)
+
+    def make_request(n):
+        items = rng.sample(pool[0], n)
+        if pool[1] and rng.random() < args.attack_ratio:
+            items[rng.randrange(n)] = rng.choice(pool[1])
+        return items
+
+    def sequential(payloads):
+        for name, detector in active:
+            if WAF_Flask.inspect_with_detector(name, detector, payloads)[0]:
+                return name
+        return None
+
+    print(f"Detectors: {[n for n, _ in active]}, {args.requests} requests/config, attack ratio {args.attack_ratio}")
+    print(f"{'payloads':>8} {'mode':>12} {'p50 ms':>9} {'p99 ms':>9} {'speedup':>8} {'same':>5}")
+    for n in args.payloads:
+        requests = [make_request(n) for _ in range(args.requests)]
+        timings, expected = [], []
+        for payloads in requests:
+            start = time.perf_counter()
+            expected.append(sequential(payloads))
+            timings.append((time.perf_counter() - start) * 1000.0)
+        base_p50, base_p99 = _latency_summary(timings)
+        rows = [('sequential', base_p50, base_p99, 1.0, True)]
+        for workers in args.workers:
+            inspector = ParallelInspector(workers)
+            timings, same = [], True
+            for payloads, want in zip(requests, expected):
+                start = time.perf_counter()
+                detected = WAF_Flask.inspect_parallel(inspector, active, payloads)[0]
+                timings.append((time.perf_counter() - start) * 1000.0)
+                same = same and detected == want
+            inspector.shutdown()
+            p50, p99 = _latency_summary(timings)
+            rows.append((f'parallel x{workers}', p50, p99, base_p50 / p50 if p50 else float('nan'), same))
+        for mode, p50, p99, speedup, same in rows:
+            print(f"{n:>8} {mode:>12} {p50:>9.3f} {p99:>9.3f} {speedup:>7.2f}x {'yes' if same else 'NO':>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# WAF/WAF_Policy.py
+import json
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from WAF.WAF_Metrics import Counters
+
+# Các phần của request có thể kiểm tra (xem WAF_Canonical.iter_request_parts)
+REQUEST_PARTS = ('path', 'query', 'form', 'json', 'body')
+OVERSIZE_ACTIONS = ('block', 'truncate')
+POLICY_CACHE_SIZE = 4096
+
+POLICY_COUNTERS = Counters('resolved', 'skipped', 'oversize')
+
+
+class RoutePolicy(namedtuple('RoutePolicy', ['name', 'skip', 'parts', 'detectors', 'max_body_bytes', 'on_oversize'])):
+    """
+    Chính sách kiểm tra đã resolve cho một request:
+      - skip: bỏ qua hoàn toàn (asset, health check...)
+      - parts: frozenset các phần cần kiểm tra
+      - detectors: tuple tên attack cần chạy, None = tất cả
+      - max_body_bytes / on_oversize: giới hạn body và cách xử lý khi vượt ('block' | 'truncate')
+    """
+    __slots__ = ()
+
+    def allows_detector(self, attack_name):
+        return self.detectors is None or attack_name in self.detectors
+
+
+DEFAULT_POLICY = RoutePolicy('default', False, frozenset(REQUEST_PARTS), None, None, 'block')
+
+
+def _compile_rule(spec, base, known_detectors, name):
+    unknown = set(spec) - {'path', 'prefix', 'pattern', 'methods', 'skip', 'inspect', 'detectors',
+                           'max_body_bytes', 'on_oversize', 'name'}
+    if unknown:
+        raise ValueError(f"Policy rule {name}: unknown keys {sorted(unknown)}")
+
+    parts = spec.get('inspect', sorted(base.parts))
+    bad = set(parts) - set(REQUEST_PARTS)
+    if bad:
+        raise ValueError(f"Policy rule {name}: unknown parts {sorted(bad)}, expected {REQUEST_PARTS}")
+
+    detectors = spec.get('detectors', '*' if base.detectors is None else list(base.detectors))
+    if detectors != '*':
+        if known_detectors is not None:
+            bad = set(detectors) - set(known_detectors)
+            if bad:
+                raise ValueError(f"Policy rule {name}: unknown detectors {sorted(bad)}")
+        detectors = tuple(detectors)
+    else:
+        detectors = None
+
+    on_oversize = spec.get('on_oversize', base.on_oversize)
+    if on_oversize not in OVERSIZE_ACTIONS:
+        raise ValueError(f"Policy rule {name}: on_oversize must be one of {OVERSIZE_ACTIONS}")
+
+    return RoutePolicy(
+        name=spec.get('name', name),
+        skip=bool(spec.get('skip', False)),
+        parts=frozenset(parts),
+        detectors=detectors,
+        max_body_bytes=spec.get('max_body_bytes', base.max_body_bytes),
+        on_oversize=on_oversize,
+    )
+
+
+def _methods(spec):
+    methods = spec.get('methods')
+    return None if methods is None else frozenset(m.upper() for m in methods)
+
+
+def _first_for_method(candidates, method):
+    for methods, policy in candidates:
+        if methods is None or method in methods:
+            return policy
+    return None
+
+
+class _TrieNode:
+    __slots__ = ('children', 'rules')
+
+    def __init__(self):
+        self.children = {}
+        self.rules = []
+
+
+class PolicyMatcher:
+    """
+    Policy đã biên dịch:
+      - 'path'    : so khớp chính xác (dict)
+      - 'pattern' : regex, gộp thành một regex duy nhất (alternation, rule đầu tiên khớp được chọn);
+                    pattern có group riêng / flag toàn cục thì không gộp, thử lần lượt theo thứ tự
+      - 'prefix'  : trie theo segment của path, prefix dài nhất thắng
+    Thứ tự ưu tiên: path > pattern > prefix > default. Rule có 'methods' chỉ áp dụng cho các method đó.
+    Kết quả resolve được cache theo (method, path).
+    """
+
+    def __init__(self, spec=None, known_detectors=None):
+        spec = spec or {}
+        self.default = _compile_rule(spec.get('default', {}), DEFAULT_POLICY, known_detectors, 'default')
+        self.exact = {}
+        self.root = _TrieNode()
+        patterns = []
+        self.pattern_rules = []
+
+        for i, rule in enumerate(spec.get('routes', [])):
+            name = rule.get('name', f'route[{i}]')
+            keys = [k for k in ('path', 'prefix', 'pattern') if k in rule]
+            if len(keys) != 1:
+                raise ValueError(f"Policy rule {name}: needs exactly one of path / prefix / pattern")
+            entry = (_methods(rule), _compile_rule(rule, self.default, known_detectors, name))
+            if 'path' in rule:
+                self.exact.setdefault(rule['path'], []).append(entry)
+            elif 'prefix' in rule:
+                node = self.root
+                for segment in self._segments(rule['prefix']):
+                    node = node.children.setdefault(segment, _TrieNode())
+                node.rules.append(entry)
+            else:
+                try:
+                    regex = re.compile(rule['pattern'])
+                except re.error as e:
+                    raise ValueError(f"Policy rule {name}: invalid pattern: {e}") from None
+                patterns.append(f"(?P<r{len(self.pattern_rules)}>{rule['pattern']})")
+                self.pattern_rules.append(entry + (regex,))
+
+        # regex gộp chỉ dùng khi không pattern nào có group riêng (group có tên trùng nhau hoặc backreference
+        # (\1...) bị lệch số thứ tự khi ghép) và phép ghép compile được (flag toàn cục như (?i) chỉ hợp lệ ở
+        # đầu regex); nếu không các pattern được thử lần lượt
+        self.pattern = None
+        if patterns and all(regex.groups == 0 for _, _, regex in self.pattern_rules):
+            try:
+                self.pattern = re.compile('|'.join(patterns))
+            except re.error:
+                pass
+        self.resolve = lru_cache(maxsize=POLICY_CACHE_SIZE)(self._resolve)
+
+    @staticmethod
+    def _segments(path):
+        return [s for s in path.split('/') if s]
+
+    def _resolve(self, method, path):
+        candidates = self.exact.get(path)
+        if candidates:
+            policy = _first_for_method(candidates, method)
+            if policy is not None:
+                return policy
+
+        if self.pattern_rules:
+            first = 0
+            if self.pattern is not None:
+                # regex gộp trả rule đầu tiên khớp; nếu rule đó không áp dụng cho method thì thử các rule sau
+                m = self.pattern.fullmatch(path)
+                first = len(self.pattern_rules) if m is None else int(m.lastgroup[1:])
+            for methods, policy, regex in self.pattern_rules[first:]:
+                if (methods is None or method in methods) and regex.fullmatch(path):
+                    return policy
+
+        node = self.root
+        best = _first_for_method(node.rules, method)
+        for segment in self._segments(path):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            policy = _first_for_method(node.rules, method)
+            if policy is not None:
+                best = policy
+        return best or self.default
+
+    def cache_info(self):
+        return self.resolve.cache_info()._asdict()
+
+
+def load_policy(path, known_detectors=None):
+    """Đọc file policy JSON và biên dịch. path None -> policy mặc định (kiểm tra mọi thứ)."""
+    if not path:
+        return PolicyMatcher(None, known_detectors)
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    return PolicyMatcher(spec, known_detectors)
@@ -0,0 +1,213 @@
+# WAF/WAF_Profiler.py
+# Sampling profiler bật lúc runtime (admin endpoint hoặc SIGUSR2) để xem monitor_request đang làm gì khi p99 tăng.
+# Một thread nền lấy stack của các thread đang kiểm tra request (sys._current_frames) mỗi interval_ms,
+# gộp theo (phase, detector) và ghi ra dạng folded stacks (flamegraph.pl, speedscope, inferno đọc được).
+# Khi tắt: không có thread nền, request không được đăng ký; monitor_request chỉ kiểm tra một cờ.
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+from WAF.WAF_Metrics import Counters
+
+PROFILE_SUFFIX = '.folded'
+MAX_STACK_DEPTH = 128
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold_stack(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    # ';' là ký tự phân cách của định dạng folded
+    return ';'.join(n.replace(';', ':') for n in names)
+
+
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu stack theo chu kỳ cho các request được chọn.
+
+    enable(duration_s, fraction): bắt đầu một phiên; mỗi request được profile với xác suất fraction,
+    phiên tự kết thúc (và ghi file) sau duration_s giây nếu có.
+    Luồng request gọi begin() / label(phase, detector) / end(); các hàm này không làm gì khi profiler tắt.
+    """
+
+    def __init__(self, interval_ms=5, output_dir=None):
+        self.interval = max(0.1, float(interval_ms)) / 1000.0
+        self.output_dir = output_dir or os.getcwd()
+        self.enabled = False
+        self.fraction = 1.0
+        self.deadline = None
+        self.started_at = None
+        self.last_profile = None
+        self.counters = Counters('sessions', 'requests', 'samples')
+        self._labels = {}   # thread id -> [phase, detector] của request đang được profile
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -----------------------------
+    # Phiên profile
+    # -----------------------------
+    def enable(self, duration_s=None, fraction=1.0):
+        with self._lock:
+            if self.enabled:
+                return False
+            self.fraction = min(1.0, max(0.0, float(fraction)))
+            self.started_at = time.time()
+            self.deadline = time.monotonic() + duration_s if duration_s else None
+            self._stacks = Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='waf-profiler', daemon=True)
+            self.enabled = True
+            self._thread.start()
+        self.counters.incr('sessions')
+        print(f"[WAF] Profiler enabled (fraction={self.fraction}, duration={duration_s}s, "
+              f"interval={self.interval * 1000:.1f}ms)")
+        return True
+
+    def disable(self, dump=True):
+        """Kết thúc phiên hiện tại. Trả về đường dẫn file profile (None nếu không ghi)."""
+        with self._lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+            self._stop.set()
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._labels.clear()
+        path = self.dump() if dump else None
+        print(f"[WAF] Profiler disabled{f', profile written to {path}' if path else ''}")
+        return path
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    # -----------------------------
+    # Luồng request
+    # -----------------------------
+    def begin(self):
+        """Đăng ký request của thread hiện tại nếu được chọn. Trả về True nếu request được profile."""
+        if not self.enabled or (self.fraction < 1.0 and random.random() >= self.fraction):
+            return False
+        self._labels[threading.get_ident()] = ['request', None]
+        self.counters.incr('requests')
+        return True
+
+    def label(self, phase, detector=None):
+        """Đặt phase / detector hiện tại cho request đang được profile trên thread này."""
+        labels = self._labels.get(threading.get_ident())
+        if labels is not None:
+            labels[0] = phase
+            labels[1] = detector
+
+    def end(self):
+        self._labels.pop(threading.get_ident(), None)
+
+    # -----------------------------
+    # Lấy mẫu
+    # -----------------------------
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                threading.Thread(target=self.disable, name='waf-profiler-stop', daemon=True).start()
+                return
+            self._sample()
+
+    def _sample(self):
+        if not self._labels:
+            return
+        frames = sys._current_frames()
+        taken = 0
+        for tid, labels in list(self._labels.items()):
+            frame = frames.get(tid)
+            if frame is None:
+                continue
+            phase, detector = labels
+            prefix = f"phase:{phase}" + (f";detector:{detector}" if detector else '')
+            key = prefix + ';' + _fold_stack(frame)
+            with self._lock:
+                self._stacks[key] += 1
+            taken += 1
+        if taken:
+            self.counters.incr('samples', taken)
+
+    # -----------------------------
+    # Kết quả
+    # -----------------------------
+    def folded(self):
+        """Các dòng 'frame;frame;... count' (định dạng folded stacks)."""
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return [f"{stack} {count}" for stack, count in items]
+
+    def summary(self):
+        """Số mẫu theo (phase, detector)."""
+        totals = Counter()
+        with self._lock:
+            for stack, count in self._stacks.items():
+                parts = stack.split(';', 2)
+                key = parts[0][len('phase:'):]
+                if len(parts) > 1 and parts[1].startswith('detector:'):
+                    key += '/' + parts[1][len('detector:'):]
+                totals[key] += count
+        return dict(totals.most_common())
+
+    def dump(self, path=None):
+        lines = self.folded()
+        if not lines:
+            return None
+        if path is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at or time.time()))
+            path = os.path.join(self.output_dir, f"waf-profile-{stamp}-{os.getpid()}{PROFILE_SUFFIX}")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+        self.last_profile = path
+        return path
+
+    def stats(self):
+        data = self.counters.snapshot()
+        data.update({
+            'enabled': self.enabled,
+            'fraction': self.fraction,
+            'interval_ms': self.interval * 1000.0,
+            'remaining_s': max(0.0, self.deadline - time.monotonic()) if self.enabled and self.deadline else None,
+            'active_requests': len(self._labels),
+            'last_profile': self.last_profile,
+            'by_phase': self.summary(),
+        })
+        return data
+
+
+def install_signal_toggle(profiler, signum=None):
+    """
+    Bật / tắt profiler bằng signal (mặc định SIGUSR2): kill -USR2 <pid>.
+    Chỉ cài được trên main thread và hệ điều hành có signal đó. Trả về True nếu đã cài.
+    """
+    signum = signum if signum is not None else getattr(signal, 'SIGUSR2', None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def _handler(signum, frame):
+        # không join / ghi file trong signal handler
+        threading.Thread(target=profiler.toggle, name='waf-profiler-toggle', daemon=True).start()
+
+    signal.signal(signum, _handler)
+    return True
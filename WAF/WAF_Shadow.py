@@ -0,0 +1,112 @@
+# WAF/WAF_Shadow.py
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from WAF.WAF_Metrics import Counters
+
+
+class ShadowDetector:
+    """
+    Model ứng viên (candidate) chạy song song với model live của một attack.
+    Chỉ dùng để so sánh verdict, không bao giờ chặn request.
+    """
+
+    def __init__(self, attack_name, name, model, vectorizer):
+        self.attack_name = attack_name
+        self.name = name
+        self.model = model
+        self.vectorizer = vectorizer
+
+    def predict_one(self, payload):
+        """Trả về 0/1 cho một payload (0 nếu vectorizer không match token nào)."""
+        vec = self.vectorizer.transform([payload])
+        if vec.nnz == 0:
+            return 0
+        prediction = self.model.predict(vec.toarray())
+        return int(prediction[0])
+
+
+class ShadowEvaluator:
+    """
+    Đánh giá các shadow detector trên một worker nền.
+
+    Request path chỉ gọi submit(): payload + verdict của model live được đẩy vào
+    một queue có giới hạn bằng put_nowait, nên không bao giờ phải chờ.
+    Khi queue đầy, mẫu bị bỏ và bộ đếm 'dropped' tăng lên.
+    """
+
+    def __init__(self, shadows, max_queue=1000, max_disagreements=500, log_path=None):
+        # shadows: dict attack_name -> list[ShadowDetector]
+        self.shadows = {k: list(v) for k, v in shadows.items() if v}
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.disagreements = deque(maxlen=max_disagreements)
+        self.log_path = log_path
+        self.counters = Counters('submitted', 'dropped', 'evaluated', 'disagreements', 'errors')
+        self._worker = threading.Thread(target=self._run, name='waf-shadow', daemon=True)
+        self._worker.start()
+
+    def submit(self, attack_name, verdicts):
+        """
+        verdicts: list of (payload, live_verdict) mà model live đã đánh giá.
+        Không block: nếu queue đầy thì bỏ mẫu và đếm 'dropped'.
+        """
+        if attack_name not in self.shadows or not verdicts:
+            return
+        try:
+            self.queue.put_nowait((attack_name, tuple(verdicts)))
+            self.counters.incr('submitted')
+        except queue.Full:
+            self.counters.incr('dropped')
+
+    def _run(self):
+        while True:
+            attack_name, verdicts = self.queue.get()
+            try:
+                self._evaluate(attack_name, verdicts)
+            finally:
+                self.queue.task_done()
+
+    def _evaluate(self, attack_name, verdicts):
+        for shadow in self.shadows.get(attack_name, []):
+            for payload, live_verdict in verdicts:
+                try:
+                    shadow_verdict = shadow.predict_one(payload)
+                except Exception as e:
+                    self.counters.incr('errors')
+                    print(f"[WAF-Shadow] Error evaluating {shadow.name} for {attack_name}: {e}")
+                    break
+                self.counters.incr('evaluated')
+                if shadow_verdict != int(live_verdict):
+                    self._record_disagreement(attack_name, shadow.name, payload, live_verdict, shadow_verdict)
+
+    def _record_disagreement(self, attack_name, shadow_name, payload, live_verdict, shadow_verdict):
+        record = {
+            'time': time.time(),
+            'attack': attack_name,
+            'shadow_model': shadow_name,
+            'payload': payload,
+            'live': int(live_verdict),
+            'shadow': int(shadow_verdict),
+        }
+        self.counters.incr('disagreements')
+        self.disagreements.append(record)
+        print(f"[WAF-Shadow] Disagreement attack={attack_name} model={shadow_name} "
+              f"live={record['live']} shadow={record['shadow']} payload='{payload}'")
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except Exception as e:
+                print(f"[WAF-Shadow] Error writing disagreement log: {e}")
+
+    def stats(self):
+        """Bộ đếm + số mẫu đang chờ trong queue."""
+        data = self.counters.snapshot()
+        data['queue_depth'] = self.queue.qsize()
+        return data
+
+    def recent_disagreements(self, limit=50):
+        return list(self.disagreements)[-limit:]
@@ -0,0 +1,320 @@
+# WAF/WAF_Sidecar.py
+# Sidecar inference qua Unix domain socket: một process mỗi host load detector từ saved_models,
+# các web worker chỉ giữ SidecarClient mỏng và gửi payload đã extract theo batch.
+#
+# Framing (big-endian):
+#   frame    := u32 độ dài body, body
+#   request  := u8 version, u8 số attack, [u8 len, tên attack]*, u32 số payload, [u32 len, utf-8]*
+#               (số attack = 0: mọi detector của sidecar)
+#   response := u8 version, u8 status (0 ok / 1 lỗi)
+#               ok : u8 số attack, [u8 len, tên attack, u32 n, n byte dự đoán (0 / 1 / 255 = không có token)]*
+#               lỗi: u32 len, thông báo utf-8
+#
+# Chạy sidecar:  python -m WAF.WAF_Sidecar --socket /run/waf/waf.sock
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from WAF.WAF_Metrics import Counters, Histogram
+from WAF.WAF_Batching import predict_payloads
+
+PROTOCOL_VERSION = 1
+STATUS_OK = 0
+STATUS_ERROR = 1
+NO_PREDICTION = 255
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+ROUNDTRIP_US_BUCKETS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000]
+
+_U8 = struct.Struct('!B')
+_U32 = struct.Struct('!I')
+
+
+class SidecarError(Exception):
+    """Không nhận được kết quả từ sidecar (timeout, mất kết nối, lỗi phía server)."""
+
+
+# =====================================================
+# Framing
+# =====================================================
+
+def _recv_exact(sock, n, deadline=None):
+    buf = bytearray()
+    while len(buf) < n:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout('sidecar deadline exceeded')
+            sock.settimeout(remaining)
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        buf += chunk
+    return bytes(buf)
+
+
+def read_frame(sock, deadline=None):
+    (length,) = _U32.unpack(_recv_exact(sock, 4, deadline))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f'frame too large: {length} bytes')
+    return _recv_exact(sock, length, deadline)
+
+
+def write_frame(sock, body):
+    sock.sendall(_U32.pack(len(body)) + body)
+
+
+def _pack_str8(text):
+    data = text.encode('utf-8')
+    return _U8.pack(len(data)) + data
+
+
+def encode_request(attack_names, payloads):
+    parts = [_U8.pack(PROTOCOL_VERSION), _U8.pack(len(attack_names))]
+    parts.extend(_pack_str8(name) for name in attack_names)
+    parts.append(_U32.pack(len(payloads)))
+    for p in payloads:
+        data = p.encode('utf-8', 'surrogatepass')
+        parts.append(_U32.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def decode_request(body):
+    view = memoryview(body)
+    version, n_attacks = view[0], view[1]
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f'unsupported protocol version {version}')
+    pos = 2
+    attack_names = []
+    for _ in range(n_attacks):
+        n = view[pos]
+        attack_names.append(bytes(view[pos + 1:pos + 1 + n]).decode('utf-8'))
+        pos += 1 + n
+    (count,) = _U32.unpack_from(body, pos)
+    pos += 4
+    payloads = []
+    for _ in range(count):
+        (n,) = _U32.unpack_from(body, pos)
+        payloads.append(bytes(view[pos + 4:pos + 4 + n]).decode('utf-8', 'surrogatepass'))
+        pos += 4 + n
+    return attack_names, payloads
+
+
+def encode_response(results):
+    parts = [_U8.pack(PROTOCOL_VERSION), _U8.pack(STATUS_OK), _U8.pack(len(results))]
+    for name, predictions in results.items():
+        parts.append(_pack_str8(name))
+        parts.append(_U32.pack(len(predictions)))
+        parts.append(bytes(NO_PREDICTION if p is None else int(p) for p in predictions))
+    return b''.join(parts)
+
+
+def encode_error(message):
+    data = message.encode('utf-8', 'replace')
+    return _U8.pack(PROTOCOL_VERSION) + _U8.pack(STATUS_ERROR) + _U32.pack(len(data)) + data
+
+
+def decode_response(body):
+    """Trả về dict attack -> list dự đoán (0 / 1 / None). Raise SidecarError nếu server báo lỗi."""
+    if body[0] != PROTOCOL_VERSION:
+        raise SidecarError(f'unsupported protocol version {body[0]}')
+    if body[1] != STATUS_OK:
+        (n,) = _U32.unpack_from(body, 2)
+        raise SidecarError(body[6:6 + n].decode('utf-8', 'replace'))
+    pos = 3
+    results = {}
+    for _ in range(body[2]):
+        n = body[pos]
+        name = body[pos + 1:pos + 1 + n].decode('utf-8')
+        pos += 1 + n
+        (count,) = _U32.unpack_from(body, pos)
+        pos += 4
+        results[name] = [None if b == NO_PREDICTION else b for b in body[pos:pos + count]]
+        pos += count
+    return results
+
+
+# =====================================================
+# Client (web worker)
+# =====================================================
+
+class SidecarClient:
+    """
+    Client có connection pool tới sidecar. inspect() dùng lại kết nối rảnh (LIFO),
+    tối đa pool_size kết nối đồng thời; mỗi lần gọi có deadline riêng (timeout giây).
+    Kết nối lỗi bị đóng và không trả về pool; kết nối cũ bị server đóng được thử lại một lần.
+    """
+
+    def __init__(self, socket_path, pool_size=8, timeout=0.05):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self.counters = Counters('requests', 'errors', 'timeouts', 'connects')
+        self.roundtrip_us = Histogram(ROUNDTRIP_US_BUCKETS)
+
+    def _connect(self, deadline):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(max(0.0, deadline - time.monotonic()))
+        try:
+            sock.connect(self.socket_path)
+        except Exception:
+            sock.close()
+            raise
+        self.counters.incr('connects')
+        return sock
+
+    def _roundtrip(self, sock, frame, deadline):
+        sock.settimeout(max(1e-6, deadline - time.monotonic()))
+        write_frame(sock, frame)
+        return read_frame(sock, deadline)
+
+    def inspect(self, payloads, attack_names=(), timeout=None):
+        """Gửi payloads, trả về dict attack -> list dự đoán. Raise SidecarError nếu thất bại."""
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        start = time.monotonic()
+        deadline = start + timeout
+        self.counters.incr('requests')
+        if not self._slots.acquire(timeout=timeout):
+            self.counters.incr('timeouts')
+            raise SidecarError('connection pool exhausted')
+        try:
+            frame = encode_request(list(attack_names), payloads)
+            for attempt in range(2):
+                try:
+                    sock = self._idle.get_nowait()
+                    pooled = True
+                except queue.Empty:
+                    sock, pooled = None, False
+                try:
+                    if sock is None:
+                        sock = self._connect(deadline)
+                    body = self._roundtrip(sock, frame, deadline)
+                except socket.timeout as e:
+                    if sock is not None:
+                        sock.close()
+                    self.counters.incr('timeouts')
+                    raise SidecarError(f'sidecar timeout: {e}') from e
+                except (OSError, ValueError) as e:
+                    if sock is not None:
+                        sock.close()
+                    # kết nối lấy từ pool có thể đã bị server đóng: thử lại bằng kết nối mới
+                    if pooled and attempt == 0:
+                        continue
+                    self.counters.incr('errors')
+                    raise SidecarError(f'sidecar unavailable: {e}') from e
+                self._idle.put(sock)
+                self.roundtrip_us.observe((time.monotonic() - start) * 1e6)
+                return decode_response(body)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        data = self.counters.snapshot()
+        data['roundtrip_us'] = self.roundtrip_us.snapshot()
+        data['idle_connections'] = self._idle.qsize()
+        return data
+
+
+# =====================================================
+# Server (sidecar process)
+# =====================================================
+
+class _SidecarHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                body = read_frame(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                attack_names, payloads = decode_request(body)
+                names = attack_names or list(server.detectors)
+                results = {}
+                for name in names:
+                    detector = server.detectors.get(name)
+                    if detector is None:
+                        continue
+                    if server.batcher is not None:
+                        results[name] = server.batcher.predict(name, payloads)
+                    else:
+                        results[name] = predict_payloads(detector, payloads)
+                response = encode_response(results)
+                server.counters.incr('requests')
+                server.counters.incr('payloads', len(payloads))
+            except Exception as e:
+                server.counters.incr('errors')
+                response = encode_error(str(e))
+            try:
+                write_frame(self.request, response)
+            except OSError:
+                return
+
+
+class SidecarServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Server Unix socket, mỗi kết nối một thread; kết nối được giữ để client dùng lại."""
+    daemon_threads = True
+
+    def __init__(self, socket_path, detectors, batcher=None):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.detectors = {name: d for name, d in detectors.items() if d is not None}
+        self.batcher = batcher
+        self.counters = Counters('requests', 'payloads', 'errors')
+        # umask khi bind: socket được tạo sẵn với quyền 0o660, không có lúc nào user khác kết nối được
+        old_umask = os.umask(0o117)
+        try:
+            super().__init__(socket_path, _SidecarHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='WAF inference sidecar (Unix domain socket)')
+    parser.add_argument('--socket', default=os.environ.get('WAF_SIDECAR_SOCKET', '/tmp/waf_sidecar.sock'))
+    parser.add_argument('--batching', action='store_true', help='Gom payload giữa các kết nối thành batch')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-us', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    from WAF import WAF_Flask
+    from WAF.WAF_Batching import BatchingEngine
+
+    # WAF_Flask bỏ qua load detector khi import nếu WAF_SIDECAR_SOCKET được đặt
+    detectors = WAF_Flask._DETECTORS or WAF_Flask.load_detectors()
+    batcher = None
+    if args.batching:
+        batcher = BatchingEngine({n: d for n, d in detectors.items() if d is not None},
+                                 max_batch=args.max_batch, max_wait_us=args.max_wait_us)
+    server = SidecarServer(args.socket, detectors, batcher)
+    print(f"[WAF] Sidecar listening on {args.socket} with detectors {sorted(server.detectors)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+# WAF/WAF_Signatures.py
+# Index chữ ký các payload tấn công đã biết (SQLCollection / XSSCollection / ShellCollection):
+# Bloom filter để loại nhanh payload không có trong index, rồi bảng digest uint64 đã sắp xếp để xác nhận.
+# Khóa là dạng canonical của payload (WAF_Canonical.canonicalize + lowercase + gộp khoảng trắng),
+# nên payload replay bị encode lại hoặc đổi hoa / thường vẫn khớp.
+# Chỉ phụ thuộc numpy + hashlib để script train (Signature_Index.py) import được mà không kéo theo Flask.
+import hashlib
+import math
+
+import numpy as np
+
+SIGNATURES_FILE = 'signatures.npz'
+SIGNATURES_VERSION = 1
+DEFAULT_BLOOM_FPR = 0.001
+# Khóa quá ngắn hoặc không chứa ký tự đặc trưng của tấn công ('?', 'os', '//'...) trùng với request lành tính
+# quá dễ: không đưa vào index. Khóa ngắn hơn CONFIRM_SIGNATURE_LENGTH chỉ chặn khi model cũng xác nhận.
+MIN_SIGNATURE_LENGTH = 6
+CONFIRM_SIGNATURE_LENGTH = 16
+ATTACK_TOKEN_CHARS = frozenset('\'"`<>()[]{};=|&$%#*\\/-+@!~^')
+
+
+def signature_key(canonical_text):
+    """Khóa so khớp từ payload đã canonicalize: lowercase, gộp khoảng trắng."""
+    return ' '.join(canonical_text.lower().split())
+
+
+def is_signature_key(key):
+    """Khóa đủ dài và có ít nhất một ký tự đặc trưng của payload tấn công."""
+    return len(key) >= MIN_SIGNATURE_LENGTH and any(c in ATTACK_TOKEN_CHARS for c in key)
+
+
+def requires_confirmation(canonical_text):
+    """Payload khớp chữ ký nhưng khóa ngắn: cần model của attack xác nhận trước khi chặn."""
+    return len(signature_key(canonical_text)) < CONFIRM_SIGNATURE_LENGTH
+
+
+def digest64(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+
+
+def bloom_parameters(n, fpr):
+    """Số bit m và số hàm hash k tối ưu cho n phần tử với tỉ lệ dương tính giả fpr."""
+    n = max(1, n)
+    m = int(math.ceil(-n * math.log(fpr) / (math.log(2) ** 2)))
+    m = max(64, (m + 7) // 8 * 8)
+    k = max(1, int(round(m / n * math.log(2))))
+    return m, k
+
+
+def _bloom_positions(digest, m, k):
+    # double hashing: h1 + i * h2 (Kirsch-Mitzenmacher), h2 lẻ để phủ đủ các vị trí
+    h1 = digest & 0xFFFFFFFF
+    h2 = (digest >> 32) | 1
+    return [(h1 + i * h2) % m for i in range(k)]
+
+
+class SignatureIndex:
+    """
+    Tập digest 64-bit của các payload tấn công đã biết, kèm nhãn attack.
+      - bloom: bit array m bit, k hàm hash (loại nhanh; dương tính giả khoảng bloom_fpr)
+      - digests: uint64 đã sắp xếp, labels: chỉ số vào attacks (xác nhận bằng searchsorted)
+    Sau bước xác nhận, dương tính giả chỉ còn do trùng digest 64-bit (~ n / 2^64).
+    """
+
+    def __init__(self, bloom, m, k, digests, labels, attacks, meta=None):
+        self.bloom = bloom
+        # bytes: đọc từng byte nhanh hơn index vào mảng numpy trong luồng request
+        self._bits = bytes(np.asarray(bloom, dtype=np.uint8))
+        self.m = int(m)
+        self.k = int(k)
+        self.digests = digests
+        self.labels = labels
+        self.attacks = list(attacks)
+        self.meta = dict(meta or {})
+
+    @classmethod
+    def build(cls, items, fpr=DEFAULT_BLOOM_FPR, exclude=()):
+        """
+        items: iterable (canonical_text, attack_name). exclude: các canonical_text lành tính
+        (khóa trùng với payload lành tính bị loại khỏi index để không chặn nhầm).
+        Payload có nhiều nhãn giữ nhãn đầu tiên; khóa không qua is_signature_key bị bỏ.
+        """
+        excluded = {digest64(signature_key(t)) for t in exclude}
+        attacks = []
+        table = {}
+        n_excluded = n_weak = 0
+        for text, attack in items:
+            key = signature_key(text)
+            if not key:
+                continue
+            if not is_signature_key(key):
+                n_weak += 1
+                continue
+            d = digest64(key)
+            if d in excluded:
+                n_excluded += 1
+                continue
+            if d in table:
+                continue
+            if attack not in attacks:
+                attacks.append(attack)
+            table[d] = attacks.index(attack)
+
+        digests = np.array(sorted(table), dtype=np.uint64)
+        labels = np.array([table[int(d)] for d in digests], dtype=np.uint8)
+        m, k = bloom_parameters(len(digests), fpr)
+        bits = np.zeros(m // 8, dtype=np.uint8)
+        for d in table:
+            for pos in _bloom_positions(d, m, k):
+                bits[pos >> 3] |= 1 << (pos & 7)
+        meta = {'bloom_fpr': fpr, 'excluded': n_excluded, 'weak': n_weak}
+        return cls(bits, m, k, digests, labels, attacks, meta)
+
+    def __len__(self):
+        return len(self.digests)
+
+    def bloom_contains(self, digest):
+        bits = self._bits
+        for pos in _bloom_positions(digest, self.m, self.k):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def lookup_digest(self, digest):
+        """Tên attack nếu digest có trong bảng, None nếu không."""
+        i = int(np.searchsorted(self.digests, np.uint64(digest)))
+        if i < len(self.digests) and int(self.digests[i]) == digest:
+            return self.attacks[int(self.labels[i])]
+        return None
+
+    def lookup(self, canonical_text):
+        """Trả về (attack hoặc None, bloom_hit)."""
+        key = signature_key(canonical_text)
+        # index cũ (build trước khi có is_signature_key) có thể còn khóa yếu
+        if not is_signature_key(key):
+            return None, False
+        d = digest64(key)
+        if not self.bloom_contains(d):
+            return None, False
+        return self.lookup_digest(d), True
+
+    def expected_fpr(self):
+        """Tỉ lệ dương tính giả lý thuyết của Bloom filter và của cả index (sau khi xác nhận digest)."""
+        n = len(self.digests)
+        bloom = (1.0 - math.exp(-self.k * n / self.m)) ** self.k if n else 0.0
+        return {'bloom': bloom, 'index': n / 2.0 ** 64}
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            version=np.array(SIGNATURES_VERSION),
+            bloom=self.bloom,
+            bloom_shape=np.array([self.m, self.k], dtype=np.int64),
+            digests=self.digests,
+            labels=self.labels,
+            attacks=np.array(self.attacks, dtype=str),
+            bloom_fpr=np.array(self.meta.get('bloom_fpr', DEFAULT_BLOOM_FPR)),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['version'])
+            if version != SIGNATURES_VERSION:
+                raise ValueError(f"{path}: unsupported signature index version {version}")
+            m, k = (int(v) for v in data['bloom_shape'])
+            return cls(data['bloom'], m, k, data['digests'], data['labels'],
+                       [str(a) for a in data['attacks']], {'bloom_fpr': float(data['bloom_fpr'])})
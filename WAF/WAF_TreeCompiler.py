@@ -0,0 +1,225 @@
+# WAF/WAF_TreeCompiler.py
+# Biên dịch cây quyết định / ensemble của sklearn thành mảng node phẳng để predict nhanh
+# cho payload đơn lẻ (bỏ qua validate input và traversal tổng quát của sklearn mỗi lần gọi).
+#
+# Hỗ trợ DecisionTreeClassifier, RandomForestClassifier / ExtraTreesClassifier,
+# BaggingClassifier (kể cả estimators_features_) và AdaBoostClassifier (SAMME, SAMME.R)
+# với estimator là cây. Phép tính giữ đúng thứ tự của sklearn để kết quả trùng khớp:
+# X được ép về float32 rồi so với threshold float64 như trong sklearn.
+#
+# Module chỉ dùng numpy để training scripts import được mà không cần Flask.
+import numpy as np
+
+
+class FlatTree:
+    """
+    Một cây dạng mảng. Feature của node là vị trí trong danh sách feature được dùng
+    của cả model (không phải chỉ số vocabulary), leaf trỏ về chính nó.
+    """
+
+    def __init__(self, tree, classes, feature_map, used_position):
+        t = tree.tree_
+        n_classes = len(classes)
+        left = t.children_left.astype(np.int64)
+        right = t.children_right.astype(np.int64)
+        is_leaf = left < 0
+        nodes = np.arange(t.node_count, dtype=np.int64)
+
+        feature = t.feature.astype(np.int64)
+        if feature_map is not None:
+            feature = np.where(is_leaf, 0, feature_map[np.maximum(feature, 0)])
+        self.feature = np.where(is_leaf, 0, used_position[np.maximum(feature, 0)])
+        self.threshold = np.where(is_leaf, np.inf, t.threshold)
+        self.left = np.where(is_leaf, nodes, left)
+        self.right = np.where(is_leaf, nodes, right)
+        self.depth = int(t.max_depth)
+
+        value = np.asarray(t.value)[:, 0, :n_classes].astype(np.float64)
+        normalizer = value.sum(axis=1)
+        normalizer[normalizer == 0.0] = 1.0
+        self.value = value
+        self.proba = value / normalizer[:, np.newaxis]
+        self.classes_ = np.asarray(classes)
+        self._lists = None
+
+    def leaves(self, Xu):
+        """Leaf của từng dòng; Xu là ma trận float32 trên các feature được dùng."""
+        n = Xu.shape[0]
+        if n == 1:
+            return np.array([self._leaf_single(Xu[0])])
+        rows = np.arange(n)
+        node = np.zeros(n, dtype=np.int64)
+        for _ in range(self.depth):
+            go_left = Xu[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _leaf_single(self, x):
+        if self._lists is None:
+            self._lists = (self.feature.tolist(), self.threshold.tolist(), self.left.tolist(), self.right.tolist())
+        feature, threshold, left, right = self._lists
+        x = x.tolist()
+        node = 0
+        while left[node] != node:
+            node = left[node] if x[feature[node]] <= threshold[node] else right[node]
+        return node
+
+
+class CompiledTreeModel:
+    """Model đã biên dịch; có predict / predict_proba như estimator sklearn."""
+
+    def __init__(self, kind, classes, n_features, used, trees, estimator_classes=None,
+                 weights=None, algorithm=None, n_estimators=None, source=''):
+        self.kind = kind
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+        self.used = used
+        self.trees = trees
+        self.estimator_classes = estimator_classes
+        self.weights = weights
+        self.algorithm = algorithm
+        self.n_estimators = n_estimators
+        self.source = source
+
+    # -----------------------------
+    # Input
+    # -----------------------------
+    def _used_features(self, X):
+        if hasattr(X, 'tocsr'):
+            Xu = X.tocsr()[:, self.used].toarray()
+        else:
+            X = np.asarray(X)
+            if X.ndim == 1:
+                X = X.reshape(1, -1)
+            Xu = X[:, self.used]
+        return np.ascontiguousarray(Xu, dtype=np.float32)
+
+    # -----------------------------
+    # Scoring (cùng thứ tự phép tính với sklearn)
+    # -----------------------------
+    def _tree_proba(self, Xu):
+        n_classes = len(self.classes_)
+        if self.kind == 'tree':
+            return self.trees[0].proba[self.trees[0].leaves(Xu)]
+        proba = np.zeros((Xu.shape[0], n_classes), dtype=np.float64)
+        for tree, est_classes in zip(self.trees, self.estimator_classes):
+            p = tree.proba[tree.leaves(Xu)]
+            if est_classes is None or len(est_classes) == n_classes:
+                proba += p
+            else:
+                proba[:, est_classes] += p[:, range(len(est_classes))]
+        return proba / (len(self.trees) if self.kind == 'forest' else self.n_estimators)
+
+    def decision_function(self, X):
+        if self.kind != 'adaboost':
+            raise AttributeError(f"{self.source} không có decision_function")
+        Xu = self._used_features(X)
+        n_classes = len(self.classes_)
+        classes = self.classes_[:, np.newaxis]
+        if self.algorithm == 'SAMME.R':
+            pred = 0
+            for tree in self.trees:
+                proba = np.clip(tree.proba[tree.leaves(Xu)], np.finfo(np.float64).eps, None)
+                log_proba = np.log(proba)
+                pred = pred + (n_classes - 1) * (log_proba - (1.0 / n_classes) * log_proba.sum(axis=1)[:, np.newaxis])
+        else:
+            pred = 0
+            for tree, w in zip(self.trees, self.weights):
+                labels = tree.classes_.take(np.argmax(tree.value[tree.leaves(Xu)], axis=1))
+                pred = pred + np.where((labels == classes).T, w, -1 / (n_classes - 1) * w)
+        pred = pred / self.weights.sum()
+        if n_classes == 2:
+            pred[:, 0] *= -1
+            return pred.sum(axis=1)
+        return pred
+
+    def predict(self, X):
+        if self.kind == 'adaboost':
+            pred = self.decision_function(X)
+            if len(self.classes_) == 2:
+                return self.classes_.take(pred > 0, axis=0)
+            return self.classes_.take(np.argmax(pred, axis=1), axis=0)
+        Xu = self._used_features(X)
+        if self.kind == 'tree':
+            tree = self.trees[0]
+            return self.classes_.take(np.argmax(tree.value[tree.leaves(Xu)], axis=1), axis=0)
+        return self.classes_.take(np.argmax(self._tree_proba(Xu), axis=1), axis=0)
+
+    def predict_proba(self, X):
+        if self.kind != 'adaboost':
+            return self._tree_proba(self._used_features(X))
+        decision = self.decision_function(X)
+        n_classes = len(self.classes_)
+        if n_classes == 2:
+            decision = np.vstack([-decision, decision]).T / 2
+        else:
+            decision = decision / (n_classes - 1)
+        decision = decision - decision.max(axis=1, keepdims=True)
+        exp = np.exp(decision)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+# =====================================================
+# Compiler
+# =====================================================
+
+def _is_tree(est):
+    return hasattr(est, 'tree_') and hasattr(est, 'classes_')
+
+
+def compile_model(model):
+    """
+    Trả về CompiledTreeModel cho model cây / ensemble cây được hỗ trợ, hoặc None
+    (model khác được dùng nguyên như cũ).
+    """
+    kind_name = type(model).__name__
+    n_features = getattr(model, 'n_features_in_', None)
+    if n_features is None:
+        return None
+
+    if _is_tree(model) and getattr(model, 'n_outputs_', 1) == 1:
+        estimators, feature_maps, est_classes, kind = [model], [None], None, 'tree'
+    elif kind_name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        estimators = list(model.estimators_)
+        feature_maps, est_classes, kind = [None] * len(estimators), [None] * len(estimators), 'forest'
+    elif kind_name == 'BaggingClassifier':
+        estimators = list(model.estimators_)
+        if not all(hasattr(e, 'predict_proba') for e in estimators):
+            return None
+        feature_maps = [np.asarray(f, dtype=np.int64) for f in model.estimators_features_]
+        est_classes = [np.asarray(e.classes_).astype(np.int64) for e in estimators]
+        kind = 'bagging'
+    elif kind_name == 'AdaBoostClassifier':
+        estimators = list(model.estimators_)
+        feature_maps, est_classes, kind = [None] * len(estimators), None, 'adaboost'
+    else:
+        return None
+
+    if not all(_is_tree(e) for e in estimators):
+        return None
+
+    # tập feature được dùng bởi mọi cây -> chỉ lấy các cột này từ input
+    used_global = set()
+    for est, fmap in zip(estimators, feature_maps):
+        f = est.tree_.feature
+        f = f[f >= 0]
+        used_global.update((fmap[f] if fmap is not None else f).tolist())
+    used = np.array(sorted(used_global), dtype=np.int64)
+    used_position = np.zeros(n_features, dtype=np.int64)
+    used_position[used] = np.arange(len(used))
+
+    classes = model.classes_
+    trees = []
+    for est, fmap in zip(estimators, feature_maps):
+        # cây con của Bagging học trên nhãn đã encode; của AdaBoost / RF trên nhãn gốc
+        tree_classes = est.classes_
+        trees.append(FlatTree(est, tree_classes, fmap, used_position))
+
+    weights = None
+    algorithm = None
+    if kind == 'adaboost':
+        algorithm = getattr(model, 'algorithm', 'SAMME')
+        weights = np.asarray(model.estimator_weights_[:len(estimators)], dtype=np.float64)
+    return CompiledTreeModel(kind, classes, n_features, used, trees, estimator_classes=est_classes,
+                             weights=weights, algorithm=algorithm,
+                             n_estimators=getattr(model, 'n_estimators', len(estimators)), source=kind_name)
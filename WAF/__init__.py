@@ -8,6 +8,9 @@ import os
 import subprocess
 import ctypes
 
+from WAF.WAF_Compact import CompactLinearModel, COMPACT_SUFFIX
+from WAF.WAF_TreeCompiler import compile_model
+
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
 # Custom Unpickler to load the custom tokenizer
@@ -30,19 +33,89 @@ def is_admin():
     except:
         return False
 
+def load_model(model_path, compile_trees=True):
+    """
+    Load model cho detector. File .npz là CompactLinearModel; với file .pkl, nếu có bản gọn
+    <tên>_compact.npz mới hơn (tạo bởi Model_Export.py) thì dùng bản gọn thay cho pickle sklearn.
+    Cây quyết định / ensemble cây được biên dịch thành mảng phẳng (WAF_TreeCompiler).
+    """
+    if model_path.endswith('.npz'):
+        return CompactLinearModel.load(model_path)
+    compact_path = os.path.splitext(model_path)[0] + COMPACT_SUFFIX
+    if os.path.exists(compact_path) and os.path.getmtime(compact_path) >= os.path.getmtime(model_path):
+        try:
+            model = CompactLinearModel.load(compact_path)
+            print(f"Using compact model: {compact_path}")
+            return model
+        except Exception as e:
+            print(f"Error loading compact model {compact_path}: {e}")
+    model = joblib.load(model_path)
+    if compile_trees:
+        try:
+            compiled = compile_model(model)
+        except Exception as e:
+            print(f"Error compiling tree model {model_path}: {e}")
+            compiled = None
+        if compiled is not None:
+            print(f"Using compiled {compiled.source} ({len(compiled.trees)} trees, {len(compiled.used)} features)")
+            return compiled
+    return model
+
+def whitelisted_ips():
+    """Danh sách IP không bao giờ bị chặn (models/config.json), rỗng nếu không đọc được."""
+    config_path = os.path.join(base_dir, 'models', 'config.json')
+    try:
+        with open(config_path, 'r') as f:
+            return set(json.load(f).get('whitelisted_ips', []))
+    except Exception as e:
+        print(f"Error reading whitelist {config_path}: {e}")
+        return set()
+
+def block_ip(client_ip, admin_privileges):
+    """Chặn IP bằng firewall của hệ điều hành (netsh / iptables) nếu có quyền admin và IP không nằm trong whitelist."""
+    if not admin_privileges:
+        print("Admin privileges not available. IP blocking feature is disabled.")
+        return
+
+    config_path = os.path.join(base_dir, 'models', 'config.json')
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+
+    if client_ip not in config['whitelisted_ips']:
+        print(f"Blocking IP: {client_ip}")
+        if os.name == 'nt':  # Windows
+            try:
+                subprocess.run(['netsh', 'advfirewall', 'firewall', 'add', 'rule', 'name=BlockIP', 'dir=in', 'action=block', 'remoteip=' + client_ip], check=True)
+                print(f"IP {client_ip} blocked successfully on Windows.")
+            except subprocess.CalledProcessError as e:
+                print(f"Error blocking IP on Windows: {e}")
+        else:  # Linux
+            try:
+                subprocess.run(['iptables', '-A', 'INPUT', '-s', client_ip, '-j', 'DROP'], check=True)
+                print(f"IP {client_ip} blocked successfully on Linux.")
+            except subprocess.CalledProcessError as e:
+                print(f"Error blocking IP on Linux: {e}")
+    else:
+        print(f"IP {client_ip} is whitelisted.")
+
 class WAF_AI(ABC):
-    def __init__(self,model_path,vectorizer_path):
+    def __init__(self,model_path,vectorizer_path,vectorizer=None):
         # Load the saved model and vectorizer
         self.model_path=model_path
         self.vectorizer_path=vectorizer_path
         self.admin_privileges = is_admin()
         try:
-            self.model = joblib.load(model_path)
+            self.model = load_model(model_path)
             print("Model loaded successfully.")
         except Exception as e:
             print(f"Error loading model: {e}")
             self.model = None
 
+        if vectorizer is not None:
+            # dùng lại vectorizer đã load (ví dụ detector dự phòng dùng chung vectorizer với detector chính)
+            self.vectorizer = vectorizer
+            return
+
         try:
             with open(vectorizer_path, 'rb') as f:
                 self.vectorizer = CustomUnpickler(f).load()
@@ -52,30 +125,7 @@ class WAF_AI(ABC):
             self.vectorizer = None
     
     def block_ips_feature(self, client_ip):
-        if not self.admin_privileges:
-            print("Admin privileges not available. IP blocking feature is disabled.")
-            return
-
-        config_path = os.path.join(base_dir, 'models', 'config.json')
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-
-        if client_ip not in config['whitelisted_ips']:
-            print(f"Blocking IP: {client_ip}")
-            if os.name == 'nt':  # Windows
-                try:
-                    subprocess.run(['netsh', 'advfirewall', 'firewall', 'add', 'rule', 'name=BlockIP', 'dir=in', 'action=block', 'remoteip=' + client_ip], check=True)
-                    print(f"IP {client_ip} blocked successfully on Windows.")
-                except subprocess.CalledProcessError as e:
-                    print(f"Error blocking IP on Windows: {e}")
-            else:  # Linux
-                try:
-                    subprocess.run(['iptables', '-A', 'INPUT', '-s', client_ip, '-j', 'DROP'], check=True)
-                    print(f"IP {client_ip} blocked successfully on Linux.")
-                except subprocess.CalledProcessError as e:
-                    print(f"Error blocking IP on Linux: {e}")
-        else:
-            print(f"IP {client_ip} is whitelisted.")        
+        block_ip(client_ip, self.admin_privileges)
 
 
     @abstractmethod